@@ -2,8 +2,9 @@
 RAG Agent实现
 简化版本，专注于商品推荐和购物车操作
 """
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, cast, Float, Numeric
 from sqlalchemy.future import select
 
 # 可选导入，如果依赖未安装则提供友好错误
@@ -14,30 +15,24 @@ except ImportError:
     VECTOR_STORE_AVAILABLE = False
     VectorStoreService = None
 
+from app.services.query_embedding_cache import query_embedding_cache
+from app.services.rag_executor import rag_executor
+from app.services.embedding_batcher import embedding_batcher
+from app.services.hybrid_retriever import build_where, create_retriever, parse_query_filters
 from app.services.product_service import ProductService
 from app.services.cart_item_service import CartService
 from app.services.review_service import ReviewService
 from app.models.product import Product
-from app.models.review import Review
 from app.models.user import User
 from app.schemas.cart_item import CartItemCreate
-import json
-import httpx
-
-# 尝试导入settings，如果Deepseek配置不存在则使用默认值
-try:
-    from app.config.settings import settings
-    DEEPSEEK_API_KEY = getattr(settings, 'DEEPSEEK_API_KEY', '') if hasattr(settings, 'DEEPSEEK_API_KEY') else ''
-    DEEPSEEK_API_BASE = getattr(settings, 'DEEPSEEK_API_BASE', 'https://api.deepseek.com/v1') if hasattr(settings, 'DEEPSEEK_API_BASE') else 'https://api.deepseek.com/v1'
-except:
-    DEEPSEEK_API_KEY = ''
-    DEEPSEEK_API_BASE = 'https://api.deepseek.com/v1'
+from app.services.llm_client import LLMError, llm_client
+from app.config.settings import settings
 
 
 class RAGAgent:
     """
     RAG Agent
-    使用向量检索 + Deepseek API实现智能商品推荐
+    使用混合检索（向量 + BM25） + Deepseek API实现智能商品推荐
     """
     
     def __init__(self):
@@ -48,8 +43,7 @@ class RAGAgent:
                 "pip install chromadb sentence-transformers"
             )
         self.vector_store = VectorStoreService()
-        self.api_key = DEEPSEEK_API_KEY
-        self.api_base = DEEPSEEK_API_BASE
+        self.retriever = create_retriever(self.vector_store)
     
     async def chat(
         self,
@@ -68,9 +62,8 @@ class RAGAgent:
         Returns:
             Dict: 包含回复和推荐商品
         """
-        # 1. 使用向量搜索查找相关商品
         try:
-            search_results = self.vector_store.search(user_query, n_results=10)
+            products_info = await self.find_products(user_query, db)
         except ValueError as e:
             # 向量数据库为空或损坏
             return {
@@ -80,40 +73,6 @@ class RAGAgent:
                 "error": str(e)
             }
         
-        # 2. 获取商品详细信息
-        product_ids = [int(r["metadata"].get("product_id", r["id"])) for r in search_results if r["metadata"].get("type") == "product"]
-        
-        products_info = []
-        for product_id in product_ids[:5]:  # 只处理前5个
-            product_query = await db.execute(
-                select(Product).where(Product.id == product_id)
-            )
-            product = product_query.scalars().first()
-            
-            if product:
-                # 获取评论
-                reviews_query = await db.execute(
-                    select(Review).where(Review.product_id == product_id)
-                )
-                reviews = reviews_query.scalars().all()
-                
-                # 计算性价比
-                value_score = self._calculate_value_score(product, reviews)
-                
-                products_info.append({
-                    "id": product.id,
-                    "name": product.name,
-                    "description": product.description,
-                    "price": product.price,
-                    "stock": product.stock,
-                    "rating": sum(r.rating for r in reviews) / len(reviews) if reviews else 0,
-                    "review_count": len(reviews),
-                    "value_score": value_score
-                })
-        
-        # 3. 按性价比排序
-        products_info.sort(key=lambda x: x["value_score"], reverse=True)
-        
         # 4. 使用Deepseek API生成回复
         response_text = await self._generate_response(user_query, products_info)
         
@@ -123,60 +82,162 @@ class RAGAgent:
             "total_found": len(products_info)
         }
     
-    def _calculate_value_score(self, product: Product, reviews: List[Review]) -> float:
+    async def find_products(self, user_query: str, db: AsyncSession) -> List[Dict]:
         """
-        计算性价比分数
-        
-        Args:
-            product: 商品对象
-            reviews: 评论列表
+        检索相关商品并按性价比排序（对话的第1~3步，不调用大模型）
         
         Returns:
-            float: 性价比分数（0-1）
+            List[Dict]: 候选商品，性价比从高到低
+        
+        Raises:
+            ValueError: 向量数据库为空或损坏
         """
-        if not reviews:
-            return 0.0
+        # 1. 使用混合检索查找相关商品
+        # 相同查询复用缓存的向量，跳过模型计算；未命中的查询与并发请求合批编码。
+        # 编码和检索都在RAG线程池中执行，不阻塞事件循环
+        embedding_service = self.vector_store.embedding_service
+        query_embedding = await query_embedding_cache.get_or_encode(
+            embedding_service, user_query,
+            encode=lambda text: embedding_batcher.encode(embedding_service, text))
+        search_results = await rag_executor.run(self._retrieve, user_query, query_embedding)
         
-        # 平均评分（归一化到0-1）
-        avg_rating = sum(r.rating for r in reviews) / len(reviews) / 5.0
+        # 2. 获取商品详细信息
+        product_ids = [int(r["metadata"].get("product_id", r["id"])) for r in search_results if r["metadata"].get("type") == "product"]
         
-        # 价格优势（价格越低分数越高，假设1000元为基准）
-        price_score = min(1000 / max(product.price, 1), 1.0)
+        # 一次查询取出所有候选商品，评分、评价数和性价比来自商品表上的聚合列
+        products_info = await self._fetch_products(db, product_ids[:5])  # 只处理前5个
         
-        # 评论数量（归一化，假设50条评论为满分）
-        review_count_score = min(len(reviews) / 50.0, 1.0)
+        # 3. 按性价比排序
+        products_info.sort(key=lambda x: x["value_score"], reverse=True)
+        return products_info
+    
+    async def chat_stream(self, user_query: str, products_info: List[Dict]) -> AsyncIterator[Dict]:
+        """
+        流式生成回复（products_info 来自 find_products）
         
-        # 好评率（4星以上）
-        positive_rate = sum(1 for r in reviews if r.rating >= 4) / len(reviews)
+        先返回推荐商品，再逐段返回大模型生成的文本，不需要等完整回复生成完：
+        {"event": "products", "data": {...}} → {"event": "token", "data": {"content": ...}}... → {"event": "done", "data": {}}
+        大模型不可用时用一段降级回复代替；已经返回部分文本后失败时返回 error 事件。
+        """
+        yield {"event": "products", "data": {
+            "recommended_products": products_info[:3],
+            "total_found": len(products_info),
+        }}
         
-        # 综合分数
-        value_score = (
-            avg_rating * 0.4 +
-            price_score * 0.3 +
-            review_count_score * 0.2 +
-            positive_rate * 0.1
-        )
+        if not llm_client.enabled:
+            yield {"event": "token", "data": {"content": self._fallback_response(products_info)}}
+            yield {"event": "done", "data": {}}
+            return
         
-        return round(value_score, 3)
+        sent = False
+        try:
+            async for content in llm_client.stream(self._build_messages(user_query, products_info), **self._generation_params()):
+                sent = True
+                yield {"event": "token", "data": {"content": content}}
+        except LLMError as e:
+            print(f"Deepseek API调用失败: {e}")
+            if sent:
+                yield {"event": "error", "data": {"message": "AI服务中断，回复可能不完整"}}
+            else:
+                yield {"event": "token", "data": {"content": self._degraded_response(products_info)}}
+        yield {"event": "done", "data": {}}
     
-    async def _generate_response(self, user_query: str, products: List[Dict]) -> str:
+    def _retrieve(self, user_query: str, query_embedding) -> List[Dict]:
         """
-        使用Deepseek API生成回复
+        检索商品文档（在RAG线程池中执行）
         
-        Args:
-            user_query: 用户查询
-            products: 商品列表
+        只检索商品（type=product），查询中的价格区间和分类也作为过滤条件下推到检索中；
+        带价格/分类过滤没有结果时只按类型过滤重试一次。
+        """
+        hybrid = settings.RAG_HYBRID_ENABLED
+        mode = "hybrid" if hybrid else "vector"
+        filters = parse_query_filters(user_query, self.retriever.categories() if hybrid else ())
+        
+        results = self.retriever.search(
+            user_query, n_results=5, where=build_where(doc_type="product", **filters),
+            query_embedding=query_embedding, mode=mode)
+        if not results and filters:
+            results = self.retriever.search(
+                user_query, n_results=5, where=build_where(doc_type="product"),
+                query_embedding=query_embedding, mode=mode)
+        return results
+    
+    @staticmethod
+    def _value_score_column():
+        """
+        性价比分数（0-1）的SQL表达式，在查询中对所有候选商品一起计算，不需要读取评论：
+        平均评分（归一化到0-1）*0.4 + 价格优势（1000元为基准）*0.3
+        + 评论数量（50条为满分）*0.2 + 好评率（4星以上）*0.1，没有评论时为0
+        """
+        review_count = func.nullif(Product.review_count, 0)
+        avg_rating = Product.average_rating / 5.0
+        price_score = func.least(1000.0 / func.greatest(Product.price, 1), 1.0)
+        review_count_score = func.least(Product.review_count / 50.0, 1.0)
+        positive_rate = cast(Product.rating_4_count + Product.rating_5_count, Float) / review_count
+        
+        score = avg_rating * 0.4 + price_score * 0.3 + review_count_score * 0.2 + positive_rate * 0.1
+        return func.coalesce(func.round(cast(score, Numeric), 3), 0).label("value_score")
+    
+    async def _fetch_products(self, db: AsyncSession, product_ids: List[int]) -> List[Dict]:
+        """
+        批量获取候选商品及其性价比分数（无论候选数量多少都只有一次查询）
         
         Returns:
-            str: AI生成的回复
+            List[Dict]: 按 product_ids 的顺序（检索相关度）排列，跳过不存在或已下架的商品
         """
-        if not self.api_key:
-            # 如果没有配置API Key，返回简单回复
-            if products:
-                return f"我为您找到了 {len(products)} 个相关商品。推荐商品：{products[0]['name']}，价格：{products[0]['price']}元，评分：{products[0]['rating']:.1f}星。"
-            return "抱歉，没有找到相关商品。"
+        if not product_ids:
+            return []
+        
+        result = await db.execute(
+            select(
+                Product.id,
+                Product.name,
+                Product.description,
+                Product.price,
+                Product.stock,
+                Product.average_rating,
+                Product.review_count,
+                self._value_score_column(),
+            ).where(Product.id.in_(product_ids), Product.is_active == True)
+        )
+        rows = {row.id: row for row in result}
         
-        # 构建提示词
+        return [
+            {
+                "id": row.id,
+                "name": row.name,
+                "description": row.description,
+                "price": row.price,
+                "stock": row.stock,
+                "rating": float(row.average_rating or 0),
+                "review_count": row.review_count,
+                "value_score": float(row.value_score),
+            }
+            for row in (rows.get(product_id) for product_id in product_ids)
+            if row is not None
+        ]
+    
+    @staticmethod
+    def _fallback_response(products: List[Dict]) -> str:
+        """未配置API Key时的简单回复"""
+        if products:
+            return f"我为您找到了 {len(products)} 个相关商品。推荐商品：{products[0]['name']}，价格：{products[0]['price']}元，评分：{products[0]['rating']:.1f}星。"
+        return "抱歉，没有找到相关商品。"
+    
+    @staticmethod
+    def _degraded_response(products: List[Dict]) -> str:
+        """大模型调用失败时的降级回复"""
+        if products:
+            return f"我为您找到了 {len(products)} 个相关商品。推荐：{products[0]['name']}（{products[0]['price']}元，评分{products[0]['rating']:.1f}星）。"
+        return "抱歉，没有找到相关商品。"
+    
+    @staticmethod
+    def _generation_params() -> Dict:
+        return {"temperature": 0.7, "max_tokens": 500}
+    
+    @staticmethod
+    def _build_messages(user_query: str, products: List[Dict]) -> List[Dict]:
+        """构建提示词"""
         products_text = "\n".join([
             f"- {p['name']}：价格{p['price']}元，评分{p['rating']:.1f}星，{p['review_count']}条评论，性价比分数{p['value_score']:.2f}"
             for p in products[:3]
@@ -195,38 +256,32 @@ class RAGAgent:
 3. 突出性价比优势
 4. 如果商品列表为空，礼貌地说明没有找到相关商品
 """
+        return [
+            {"role": "system", "content": "你是一个专业的电商购物助手，帮助用户找到性价比最高的商品。"},
+            {"role": "user", "content": prompt}
+        ]
+    
+    async def _generate_response(self, user_query: str, products: List[Dict]) -> str:
+        """
+        使用Deepseek API生成回复（通过共享的连接池客户端）
+        
+        Args:
+            user_query: 用户查询
+            products: 商品列表
+        
+        Returns:
+            str: AI生成的回复
+        """
+        if not llm_client.enabled:
+            # 如果没有配置API Key，返回简单回复
+            return self._fallback_response(products)
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.api_base}/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "deepseek-chat",
-                        "messages": [
-                            {"role": "system", "content": "你是一个专业的电商购物助手，帮助用户找到性价比最高的商品。"},
-                            {"role": "user", "content": prompt}
-                        ],
-                        "temperature": 0.7,
-                        "max_tokens": 500
-                    },
-                    timeout=30.0
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    return result["choices"][0]["message"]["content"]
-                else:
-                    return f"AI服务暂时不可用，但我为您找到了 {len(products)} 个相关商品。"
-        except Exception as e:
+            return await llm_client.complete(self._build_messages(user_query, products), **self._generation_params())
+        except LLMError as e:
             print(f"Deepseek API调用失败: {e}")
             # 降级处理
-            if products:
-                return f"我为您找到了 {len(products)} 个相关商品。推荐：{products[0]['name']}（{products[0]['price']}元，评分{products[0]['rating']:.1f}星）。"
-            return "抱歉，没有找到相关商品。"
+            return self._degraded_response(products)
     
     async def add_to_cart(
         self,
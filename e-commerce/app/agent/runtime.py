@@ -0,0 +1,202 @@
+"""
+RAG Agent 运行时
+每个worker进程只创建一个 RAGAgent / VectorStoreService（Chroma客户端和Embedding模型都只加载一次），
+由 FastAPI lifespan 管理。加载策略由 RAG_AGENT_LOAD_POLICY 控制：
+- preload：启动时在后台线程中加载并用一次空编码预热，加载完成前就绪检查返回未就绪；
+  加载失败时按指数退避自动重试（没有请求流量的实例也能恢复就绪）；
+- lazy：第一次请求时加载；
+- disabled：不加载，Agent接口返回503。
+
+加载完成后，后台任务每隔 KB_COLLECTION_CHECK_SECONDS 检查集合是否被其他进程重建（集合ID变化），
+变化时重新打开集合；并读取其他进程写入知识库的变更通知（knowledge_base_changes），
+更新本进程的Chroma客户端和BM25索引。
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from fastapi import HTTPException, status
+
+from app.config.settings import settings
+from app.services.knowledge_base_changes import latest_change_id, read_changes
+from app.services.vector_store_service import EmbeddingModelMismatchError
+
+
+logger = logging.getLogger(__name__)
+
+LOAD_POLICIES = ("preload", "lazy", "disabled")
+PRELOAD_RETRY_INITIAL_SECONDS = 5.0
+
+STATE_IDLE = "idle"          # lazy 策略下尚未加载
+STATE_LOADING = "loading"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+STATE_DISABLED = "disabled"
+
+
+class AgentRuntime:
+    def __init__(self, policy: str = "preload"):
+        if policy not in LOAD_POLICIES:
+            raise ValueError(f"RAG_AGENT_LOAD_POLICY must be one of {LOAD_POLICIES}, got {policy!r}")
+        self.policy = policy
+        self.state = STATE_DISABLED if policy == "disabled" else STATE_IDLE
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self._agent = None
+        self._load_task: Optional[asyncio.Task] = None
+        self._background_task: Optional[asyncio.Task] = None
+        # 已应用到本进程的最后一个知识库变更ID，为空时下次同步整体重新加载
+        self._changes_id: Optional[str] = None
+
+    @property
+    def agent(self):
+        return self._agent
+
+    @property
+    def vector_store(self):
+        return self._agent.vector_store if self._agent is not None else None
+
+    def _load(self):
+        """在线程中执行：创建Agent并预热（加载模型、打开集合、编码一次）"""
+        from app.agent.rag_agent import RAGAgent
+
+        start = time.perf_counter()
+        agent = RAGAgent()
+        agent.vector_store.embedding_service.encode_single("warm up")
+        # 集合是用另一个Embedding模型/后端构建的：拒绝加载，需要重建知识库
+        agent.vector_store.check_embedding_model()
+        agent.vector_store.is_collection_empty()
+        if settings.RAG_HYBRID_ENABLED:
+            agent.vector_store.refresh_lexical_index()
+        return agent, time.perf_counter() - start
+
+    async def _load_and_set(self):
+        self.state = STATE_LOADING
+        try:
+            # 加载前记录变更位置：加载期间的变更在之后的同步中重新应用
+            self._changes_id = await latest_change_id()
+        except Exception as e:
+            self._changes_id = None
+            logger.warning(f"Failed to read knowledge base change position: {e}")
+        try:
+            self._agent, self.load_seconds = await asyncio.to_thread(self._load)
+        except Exception as e:
+            self.state = STATE_FAILED
+            self.error = str(e)
+            logger.error(f"RAG agent failed to load: {e}")
+            return
+        self.state = STATE_READY
+        self.error = None
+        logger.info(f"RAG agent ready in {self.load_seconds:.1f}s")
+
+    async def _load_once(self):
+        """等待当前的加载任务；没有进行中的加载时开始一次新的加载"""
+        if self._load_task is None or (self._load_task.done() and self.state != STATE_READY):
+            self._load_task = asyncio.create_task(self._load_and_set())
+        await asyncio.shield(self._load_task)
+
+    async def _preload_with_retry(self):
+        delay = PRELOAD_RETRY_INITIAL_SECONDS
+        while True:
+            await self._load_once()
+            if self.state == STATE_READY:
+                return
+            logger.warning(f"Retrying RAG agent preload in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, settings.RAG_PRELOAD_RETRY_MAX_SECONDS)
+
+    async def _sync_changes(self):
+        """应用其他进程写入知识库的变更"""
+        vector_store = self.vector_store
+        if self._changes_id is None:
+            self._changes_id = await latest_change_id()
+            await asyncio.to_thread(vector_store.apply_changes, [], True)
+            return
+        changes_id, changes, lagged = await read_changes(self._changes_id)
+        applied = await asyncio.to_thread(vector_store.apply_changes, changes, lagged)
+        self._changes_id = changes_id
+        if applied or lagged:
+            logger.info(f"Applied {applied} knowledge base changes from other workers (reloaded: {lagged})")
+
+    async def _run_background(self):
+        if self.policy == "preload":
+            await self._preload_with_retry()
+        while True:
+            await asyncio.sleep(settings.KB_COLLECTION_CHECK_SECONDS)
+            if self.state != STATE_READY:
+                continue
+            try:
+                await asyncio.to_thread(self.vector_store.reopen_if_replaced)
+                await self._sync_changes()
+            except EmbeddingModelMismatchError as e:
+                # 集合被用另一个模型重建：停止使用本进程的Agent（增量索引也随之停止），之后的请求会重新加载
+                self._agent = None
+                self.state = STATE_FAILED
+                self.error = str(e)
+                logger.error(f"RAG agent disabled: {e}")
+            except Exception as e:
+                logger.warning(f"Knowledge base collection check failed: {e}")
+
+    def start(self):
+        """lifespan 中调用：preload 策略下开始后台加载（失败时重试），不阻塞启动"""
+        if self.policy != "disabled" and self._background_task is None:
+            self._background_task = asyncio.create_task(self._run_background())
+        return self._background_task
+
+    async def stop(self):
+        for task in (self._background_task, self._load_task):
+            if task is not None and not task.done():
+                task.cancel()
+        self._background_task = None
+        self._load_task = None
+
+    async def get_agent(self):
+        """
+        返回本进程共享的 RAGAgent，正在加载时等待加载完成
+
+        Raises:
+            HTTPException: 503，Agent被禁用或加载失败
+        """
+        if self.state == STATE_READY:
+            return self._agent
+        if self.state == STATE_DISABLED:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="RAG agent is disabled")
+
+        # 并发的首个请求共享同一个加载任务；加载失败后下一次请求会重试
+        await self._load_once()
+
+        if self.state != STATE_READY:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"RAG agent is unavailable: {self.error}")
+        return self._agent
+
+    def readiness(self) -> Dict:
+        """
+        就绪状态。preload 策略下加载完成前不就绪；lazy 策略下未加载也视为就绪（首次请求较慢）
+        """
+        ready = self.state == STATE_READY or (self.policy == "lazy" and self.state == STATE_IDLE)
+        info = {
+            "ready": ready,
+            "state": self.state,
+            "policy": self.policy,
+            "load_seconds": round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            "error": self.error,
+        }
+        if self.state == STATE_READY:
+            info["collection"] = self.vector_store.get_collection_info()
+            info["lexical_documents"] = len(self.vector_store.lexical_index)
+            from app.services.query_embedding_cache import query_embedding_cache
+            from app.services.rag_executor import rag_executor, indexing_executor
+            from app.services.embedding_batcher import embedding_batcher
+            from app.services.llm_client import llm_client
+            info["query_embedding_cache"] = query_embedding_cache.stats()
+            info["executor"] = rag_executor.stats()
+            info["indexing_executor"] = indexing_executor.stats()
+            info["embedding_batcher"] = embedding_batcher.stats()
+            info["llm_client"] = llm_client.stats()
+        return info
+
+
+agent_runtime = AgentRuntime(policy=settings.RAG_AGENT_LOAD_POLICY)
@@ -18,7 +18,9 @@ def init_vector_store():
     """初始化向量存储服务"""
     global vector_store
     if vector_store is None:
-        vector_store = VectorStoreService()
+        # 服务进程中复用 lifespan 创建的共享实例
+        from app.agent.runtime import agent_runtime
+        vector_store = agent_runtime.vector_store or VectorStoreService()
     return vector_store
 
 
@@ -23,9 +23,80 @@ class Settings(BaseSettings):
   # Celery配置
   CELERY_BROKER_URL: str = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
   CELERY_RESULT_BACKEND: str = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
+  # 事务性发件箱（Outbox）中继配置
+  OUTBOX_RELAY_ENABLED: bool = True
+  OUTBOX_BATCH_SIZE: int = 100
+  OUTBOX_POLL_INTERVAL: float = 1.0  # 秒
+  OUTBOX_MAX_ATTEMPTS: int = 10
+  OUTBOX_HANDLER_TIMEOUT: float = 10.0  # 单个事件投递的超时时间（秒）
+  OUTBOX_RETENTION_HOURS: int = 72  # 已投递事件的保留时间，超过后定期删除
+  # 购物车存储："database"（默认）或 "redis"
+  CART_BACKEND: str = "database"
+  CART_PERSIST_INTERVAL: float = 30.0  # Redis购物车写回数据库的间隔（秒）
+  CART_TTL_SECONDS: int = 7 * 24 * 3600
+  # 商品评分聚合校对间隔（秒）
+  RATING_DRIFT_CHECK_ENABLED: bool = True
+  RATING_DRIFT_CHECK_INTERVAL: float = 3600.0
+  # 评价点赞/点踩计数写回数据库的间隔（秒）
+  REACTION_FLUSH_INTERVAL: float = 5.0
+  # 认证用户缓存：Redis中的TTL与进程内缓存的TTL（秒）
+  PRINCIPAL_CACHE_TTL: int = 300
+  PRINCIPAL_LOCAL_TTL: float = 5.0
+  # 密码哈希线程池：并发数（0表示按CPU核数，最多4）与最大排队数
+  PASSWORD_HASH_WORKERS: int = 0
+  PASSWORD_HASH_MAX_PENDING: int = 256
+  # Redis分布式限流（默认策略使用 MAX_REQUESTS_PER_MINUTE / REQUESTS_TIME_LIMIT）
+  RATE_LIMIT_ENABLED: bool = True
+  # 可信反向代理的IP或网段（逗号分隔）：来自这些地址的请求按 X-Forwarded-For 中的客户端IP限流
+  RATE_LIMIT_TRUSTED_PROXIES: str = "127.0.0.1,::1"
+  # 慢请求日志阈值（毫秒）
+  SLOW_REQUEST_MS: float = 1000.0
+  # 智能导购Agent加载策略：preload（启动时加载并预热）、lazy（首次请求时加载）、disabled
+  RAG_AGENT_LOAD_POLICY: str = "preload"
+  # preload 失败后重试的最长间隔（秒，从5秒开始指数退避）；检查集合是否被其他进程重建、读取其他进程知识库变更的间隔（秒）
+  RAG_PRELOAD_RETRY_MAX_SECONDS: float = 300.0
+  KB_COLLECTION_CHECK_SECONDS: float = 10.0
+  # Chroma服务端地址（多worker部署时推荐，所有进程共享同一份向量索引）；为空时使用本地持久化目录
+  CHROMA_SERVER_HOST: str = ""
+  CHROMA_SERVER_PORT: int = 8000
+  # 查询向量缓存：进程内LRU条目数与Redis中的TTL（秒）
+  QUERY_EMBEDDING_CACHE_SIZE: int = 2048
+  QUERY_EMBEDDING_CACHE_TTL: int = 86400
+  # RAG计算线程池：并发数与最大排队数（超过时返回503）
+  RAG_EXECUTOR_WORKERS: int = 2
+  RAG_EXECUTOR_MAX_PENDING: int = 32
+  # 知识库构建/增量索引的批量编码线程数（独立线程池，不占用查询的RAG线程池）
+  KB_INDEX_EXECUTOR_WORKERS: int = 1
+  # 查询编码微批处理：是否启用、每批最多条数、最长等待（毫秒）与最大排队数
+  EMBEDDING_BATCH_ENABLED: bool = True
+  EMBEDDING_BATCH_MAX_SIZE: int = 32
+  EMBEDDING_BATCH_MAX_WAIT_MS: float = 5.0
+  EMBEDDING_BATCH_MAX_QUEUE: int = 512
+  # Embedding后端：torch（默认）、onnx、auto（有导出的ONNX模型时使用ONNX）；ONNX模型目录、是否使用int8量化模型、推理线程数（0为默认）
+  # 切换后端后需要重建知识库（init_knowledge_base.py --rebuild），集合记录了构建时的模型，不一致时拒绝加载
+  EMBEDDING_BACKEND: str = "torch"
+  EMBEDDING_ONNX_DIR: str = "models/all-MiniLM-L6-v2-onnx"
+  EMBEDDING_ONNX_QUANTIZED: bool = True
+  EMBEDDING_ONNX_THREADS: int = 0
+  # 知识库增量索引：是否在API进程中运行与轮询间隔（秒）
+  KB_INDEXER_ENABLED: bool = True
+  KB_INDEX_INTERVAL: float = 5.0
+  # 知识库全量构建：每批从数据库游标读取并编码的文档数（峰值内存与此成正比）
+  KB_BUILD_BATCH_SIZE: int = 256
+  # 混合检索：是否启用BM25+向量融合、RRF常数k、每路召回的候选数
+  RAG_HYBRID_ENABLED: bool = True
+  RAG_RRF_K: int = 60
+  RAG_HYBRID_CANDIDATES: int = 20
+  # 大模型HTTP客户端：最大并发请求数、连接与读取超时（秒）、等待并发名额的超时（秒）、是否启用HTTP/2（需要安装h2）
+  LLM_MAX_CONCURRENCY: int = 16
+  LLM_CONNECT_TIMEOUT: float = 5.0
+  LLM_READ_TIMEOUT: float = 30.0
+  LLM_QUEUE_TIMEOUT: float = 5.0
+  LLM_HTTP2: bool = True
   # Deepseek API配置
   DEEPSEEK_API_KEY: str = os.getenv("DEEPSEEK_API_KEY", "")
   DEEPSEEK_API_BASE: str = os.getenv("DEEPSEEK_API_BASE", "https://api.deepseek.com/v1")
+  DEEPSEEK_MODEL: str = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
 
   model_config = ConfigDict(
     env_file=".env", 
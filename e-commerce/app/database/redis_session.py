@@ -2,4 +2,6 @@ import redis.asyncio as aioredis
 from app.config.settings import settings
 
 
-redis_connection = aioredis.from_url(settings.REDIS_SESSION_URL, decode_responses=True)
\ No newline at end of file
+redis_connection = aioredis.from_url(settings.REDIS_SESSION_URL, decode_responses=True)
+# 不解码响应，用于保存二进制数据（如向量）
+redis_binary_connection = aioredis.from_url(settings.REDIS_SESSION_URL, decode_responses=False)
@@ -8,7 +8,9 @@ from app.config.settings import settings
 
 
 logger = logging.getLogger(__name__)
-engine = create_async_engine(settings.DATABASE_URL, echo=False, isolation_level="AUTOCOMMIT")
+# 使用事务（READ COMMITTED）：会话中的修改在 commit 时一起生效，
+# 业务数据与 OutboxService.add_event 登记的事件原子提交，未提交的修改在会话关闭时回滚
+engine = create_async_engine(settings.DATABASE_URL, echo=False)
 AsyncSessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 
 
@@ -6,10 +6,21 @@ from fastapi import FastAPI, status
 from fastapi.responses import RedirectResponse
 
 from app.models.base import Base
+from app.config.settings import settings
 from app.database.session import engine, initialize_db
+from app.services.outbox_service import outbox_relay
+from app.services.cart_store import cart_persister
+from app.services.rating_service import rating_drift_checker
+from app.services.review_reaction_store import reaction_flusher
+from app.agent.runtime import agent_runtime
+from app.services.rag_executor import rag_executor, indexing_executor
+from app.services.embedding_batcher import embedding_batcher
+from app.services.knowledge_base_indexer import knowledge_base_indexer
+from app.services.llm_client import llm_client
 from app.routers.wishlists import router as wishlists_router
 from app.routers import categories
-# from app.middleware.rate_limitter import AdvancedMiddleware  # 速率限制已禁用
+from app.middleware.rate_limitter import RateLimitMiddleware
+from app.middleware.request_context import RequestIDMiddleware, TimingMiddleware, configure_logging
 from app.routers import (auth, users, products, orders, password_recovery,
                          admin, payments, order_item, reviews, cart_items)
 
@@ -18,7 +29,41 @@ async def lifespan(app: FastAPI):
     await initialize_db()          
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    # 后台投递发件箱事件（邮件、缓存失效、索引更新）
+    if settings.OUTBOX_RELAY_ENABLED:
+        outbox_relay.start()
+    # Redis购物车定期写回数据库
+    if settings.CART_BACKEND == "redis":
+        cart_persister.start()
+    # 定期校对商品评分聚合
+    if settings.RATING_DRIFT_CHECK_ENABLED:
+        rating_drift_checker.start()
+    # 评价点赞/点踩计数批量写回数据库
+    reaction_flusher.start()
+    # 大模型HTTP客户端：每个worker共享一个连接池
+    llm_client.start()
+    # 智能导购Agent：每个worker一个实例，按策略预加载并预热
+    agent_runtime.start()
+    # 并发查询合批编码
+    if settings.EMBEDDING_BATCH_ENABLED and agent_runtime.policy != "disabled":
+        embedding_batcher.start()
+    # 知识库增量索引（本进程Agent加载完成后才会实际写入）
+    if settings.KB_INDEXER_ENABLED and agent_runtime.policy != "disabled":
+        knowledge_base_indexer.start()
     yield
+    await knowledge_base_indexer.stop()
+    await embedding_batcher.stop()
+    await agent_runtime.stop()
+    rag_executor.shutdown()
+    indexing_executor.shutdown()
+    await llm_client.aclose()
+    await reaction_flusher.stop()
+    await rating_drift_checker.stop()
+    if settings.CART_BACKEND == "redis":
+        await cart_persister.stop()
+    await outbox_relay.stop()
+
+configure_logging()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -27,6 +72,11 @@ async def redirect_home():
     response = RedirectResponse(status_code=status.HTTP_301_MOVED_PERMANENTLY, url='/docs')
     return response
 
+# 以下中间件均为纯ASGI实现（不使用 BaseHTTPMiddleware），add_middleware 后添加的位于外层
+# 基于Redis的分布式限流（先添加，位于CORS内层，429响应同样带有CORS头）
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
+
 origins = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
@@ -39,8 +89,14 @@ app.add_middleware(
     allow_credentials=True,      # Needed if you use cookies
     allow_methods=["*"],         # Allow POST, GET, PUT, DELETE, etc.
     allow_headers=["*"],         # Allow headers like Content-Type
+    expose_headers=["X-Request-ID", "Server-Timing", "Retry-After",
+                    "RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "RateLimit-Policy"],
 )
 
+# 耗时统计和请求ID位于最外层（最后添加），覆盖CORS预检和限流响应
+app.add_middleware(TimingMiddleware, slow_request_ms=settings.SLOW_REQUEST_MS)
+app.add_middleware(RequestIDMiddleware)
+
 app.include_router(auth.router)
 app.include_router(password_recovery.router)
 app.include_router(admin.router)
@@ -79,4 +135,3 @@ try:
     app.include_router(knowledge_base.router)
 except ImportError:
     pass  # 知识库功能不可用时静默跳过
-# app.add_middleware(AdvancedMiddleware)  # 速率限制已禁用
\ No newline at end of file
@@ -1,29 +1,202 @@
-import time
-from collections import defaultdict
-from typing import Dict
+"""
+基于Redis的分布式限流（GCRA算法）
+纯ASGI中间件：每个请求只执行一次Lua脚本（EVALSHA），状态保存在Redis中，多个worker共享。
+已登录用户按用户ID限流，未登录请求按客户端IP限流；不同路由可以配置不同的策略。
+请求来自可信反向代理（RATE_LIMIT_TRUSTED_PROXIES）时，客户端IP取 X-Forwarded-For 中
+从右往左第一个不是可信代理的地址，否则所有匿名用户会共用代理IP的额度。
+响应中带有 RateLimit-Limit / RateLimit-Remaining / RateLimit-Reset / RateLimit-Policy 头，
+被限流时返回429和 Retry-After。Redis不可用时放行（fail open）。
+"""
+import ipaddress
+import json
+import logging
+import math
+from dataclasses import dataclass
+from typing import Iterable, Optional, Sequence, Tuple
+
+from jose import jwt
 
-from fastapi import Request, status
-from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
 from app.config.settings import settings
+from app.database.redis_session import redis_connection
+
+
+logger = logging.getLogger(__name__)
+
+# GCRA：每个键只保存一个“理论到达时间”（TAT，毫秒）
+# KEYS[1]=限流键 ARGV[1]=发射间隔（毫秒，period/limit） ARGV[2]=周期（毫秒）
+# 返回 {是否放行, 剩余次数, 重试等待毫秒, 完全恢复毫秒}
+GCRA_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+  tat = now
+end
+
+local new_tat = tat + interval
+local allow_at = new_tat - period
+if now < allow_at then
+  return {0, 0, math.ceil(allow_at - now), math.ceil(tat - now)}
+end
+
+redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil(new_tat - now))
+return {1, math.floor((now - allow_at) / interval), 0, math.ceil(new_tat - now)}
+"""
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+  name: str
+  limit: int                   # 每个周期允许的请求数（同时也是突发上限）
+  period: float                # 周期（秒）
+  per_user: bool = True        # 已登录用户按用户ID计数，否则始终按IP计数
+
+  @property
+  def header(self) -> str:
+    return f"{self.limit};w={int(self.period)}"
+
+
+@dataclass(frozen=True)
+class RouteRateLimit:
+  path_prefix: str
+  policy: RateLimitPolicy
+  methods: Optional[Tuple[str, ...]] = None  # None 表示所有方法
+
+
+DEFAULT_POLICY = RateLimitPolicy("default", settings.MAX_REQUESTS_PER_MINUTE, settings.REQUESTS_TIME_LIMIT)
+
+# 按前缀匹配，先匹配到的生效
+DEFAULT_ROUTE_LIMITS: Sequence[RouteRateLimit] = (
+  # 登录、注册和找回密码涉及bcrypt和邮件，按IP严格限制
+  RouteRateLimit("/auth/login", RateLimitPolicy("login", 10, 60, per_user=False), ("POST",)),
+  RouteRateLimit("/auth/register", RateLimitPolicy("register", 5, 60, per_user=False), ("POST",)),
+  RouteRateLimit("/auth/initiate_password_recovery", RateLimitPolicy("password_recovery", 5, 60, per_user=False), ("POST",)),
+  RouteRateLimit("/auth/password_recovery", RateLimitPolicy("password_recovery", 5, 60, per_user=False), ("POST",)),
+  RouteRateLimit("/auth/refresh", RateLimitPolicy("refresh", 30, 60, per_user=False), ("POST",)),
+  RouteRateLimit("/auth/change_password", RateLimitPolicy("change_password", 5, 60), ("POST",)),
+  # 智能导购调用大模型，按用户限制
+  RouteRateLimit("/agent", RateLimitPolicy("agent", 20, 60)),
+)
+
+def parse_trusted_proxies(value: str) -> Tuple:
+  return tuple(ipaddress.ip_network(item.strip(), strict=False) for item in value.split(",") if item.strip())
+
+
+TRUSTED_PROXIES = parse_trusted_proxies(settings.RATE_LIMIT_TRUSTED_PROXIES)
+
+# 文档、静态文件和就绪探针（/agent/ready 由负载均衡器频繁探测）不限流
+EXEMPT_PATHS = ("/docs", "/redoc", "/openapi.json", "/uploads", "/static", "/agent/ready")
+
+
+class RateLimitMiddleware:
+  def __init__(
+          self,
+          app,
+          default_policy: RateLimitPolicy = DEFAULT_POLICY,
+          route_limits: Iterable[RouteRateLimit] = DEFAULT_ROUTE_LIMITS,
+          exempt_paths: Iterable[str] = EXEMPT_PATHS,
+          trusted_proxies: Iterable = TRUSTED_PROXIES,
+          redis=None):
+    self.app = app
+    self.default_policy = default_policy
+    self.route_limits = tuple(route_limits)
+    self.exempt_paths = tuple(exempt_paths)
+    self.trusted_proxies = tuple(trusted_proxies)
+    self._script = (redis or redis_connection).register_script(GCRA_SCRIPT)
+
+  def _match_policy(self, method: str, path: str) -> RateLimitPolicy:
+    for route in self.route_limits:
+      if path.startswith(route.path_prefix) and (route.methods is None or method in route.methods):
+        return route.policy
+    return self.default_policy
+
+  @staticmethod
+  def _user_id(scope) -> Optional[str]:
+    """从Bearer令牌中取用户ID（只验签，不查数据库）"""
+    for name, value in scope.get("headers", ()):
+      if name == b"authorization":
+        scheme, _, token = value.decode("latin-1").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+          return None
+        try:
+          return str(jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]).get("sub"))
+        except Exception:
+          return None
+    return None
+
+  def _identity(self, scope, policy: RateLimitPolicy) -> str:
+    if policy.per_user:
+      user_id = self._user_id(scope)
+      if user_id:
+        return f"user:{user_id}"
+    return f"ip:{self._client_ip(scope)}"
+
+  def _is_trusted(self, address: str) -> bool:
+    try:
+      ip = ipaddress.ip_address(address)
+    except ValueError:
+      return False
+    return any(ip in network for network in self.trusted_proxies)
+
+  def _client_ip(self, scope) -> str:
+    client = scope.get("client")
+    address = client[0] if client else "unknown"
+    if not self._is_trusted(address):
+      return address
+    forwarded = [
+      value.decode("latin-1") for name, value in scope.get("headers", ()) if name == b"x-forwarded-for"]
+    # 每一级代理把上一跳的地址追加在末尾：从右往左跳过可信代理，最左边的地址可以被客户端伪造
+    for hop in reversed([hop.strip() for value in forwarded for hop in value.split(",") if hop.strip()]):
+      if not self._is_trusted(hop):
+        return hop
+      address = hop
+    return address
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http" or scope["path"].startswith(self.exempt_paths):
+      await self.app(scope, receive, send)
+      return
+
+    policy = self._match_policy(scope["method"], scope["path"])
+    key = f"ratelimit:{policy.name}:{self._identity(scope, policy)}"
+    interval_ms = policy.period * 1000 / policy.limit
 
-class AdvancedMiddleware(BaseHTTPMiddleware):
-  def __init__(self, app):
-    super().__init__(app)
-    self.rate_limit_records: Dict[str, list] = defaultdict(list)
-    self.max_requests = settings.MAX_REQUESTS_PER_MINUTE
-    self.time_limit = settings.REQUESTS_TIME_LIMIT
+    try:
+      allowed, remaining, retry_after_ms, reset_ms = await self._script(
+        keys=[key], args=[interval_ms, policy.period * 1000])
+    except Exception as e:
+      # 限流不可用时不影响业务
+      logger.warning(f"Rate limiter unavailable, allowing request: {e}")
+      await self.app(scope, receive, send)
+      return
 
-  async def dispatch(self, request: Request, call_next):
-    client_ip = request.client.host
-    current_time = time.time()
-    self.rate_limit_records[client_ip] = [
-      t for t in self.rate_limit_records[client_ip] if current_time - t < self.time_limit]
+    headers = [
+      (b"ratelimit-limit", str(policy.limit).encode()),
+      (b"ratelimit-remaining", str(max(int(remaining), 0)).encode()),
+      (b"ratelimit-reset", str(math.ceil(int(reset_ms) / 1000)).encode()),
+      (b"ratelimit-policy", policy.header.encode()),
+    ]
 
-    if len(self.rate_limit_records[client_ip]) >= self.max_requests:
-      return JSONResponse(content="Rate limit exceeded. Try again in 1 minute.", status_code=status.HTTP_429_TOO_MANY_REQUESTS)
+    if not allowed:
+      body = json.dumps({"message": "Rate limit exceeded. Try again later."}).encode()
+      await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": headers + [
+          (b"retry-after", str(math.ceil(int(retry_after_ms) / 1000)).encode()),
+          (b"content-type", b"application/json"),
+          (b"content-length", str(len(body)).encode()),
+        ],
+      })
+      await send({"type": "http.response.body", "body": body})
+      return
 
-    self.rate_limit_records[client_ip].append(current_time)
+    async def send_with_headers(message):
+      if message["type"] == "http.response.start":
+        message = {**message, "headers": list(message.get("headers", ())) + headers}
+      await send(message)
 
-    response = await call_next(request)
-    return response
\ No newline at end of file
+    await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,113 @@
+"""
+请求ID与耗时统计（纯ASGI中间件）
+不使用 BaseHTTPMiddleware：不会为每个请求额外创建任务和内存流，也不会缓冲流式响应，
+只在 http.response.start 消息上追加响应头。
+"""
+import logging
+import time
+import uuid
+from contextvars import ContextVar
+
+
+logger = logging.getLogger(__name__)
+
+# 当前请求ID，日志中可以通过 RequestIDLogFilter 输出
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+REQUEST_ID_HEADER = b"x-request-id"
+MAX_REQUEST_ID_LENGTH = 128
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+
+
+class RequestIDMiddleware:
+  """沿用客户端/网关传入的 X-Request-ID，没有时生成一个，并写回响应头"""
+
+  def __init__(self, app):
+    self.app = app
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http":
+      await self.app(scope, receive, send)
+      return
+
+    request_id = None
+    for name, value in scope.get("headers", ()):
+      if name == REQUEST_ID_HEADER:
+        if 0 < len(value) <= MAX_REQUEST_ID_LENGTH:
+          request_id = value.decode("latin-1")
+        break
+    if request_id is None:
+      request_id = uuid.uuid4().hex
+
+    scope.setdefault("state", {})["request_id"] = request_id
+    token = request_id_var.set(request_id)
+    header = (REQUEST_ID_HEADER, request_id.encode("latin-1"))
+
+    async def send_with_request_id(message):
+      if message["type"] == "http.response.start":
+        message = {**message, "headers": list(message.get("headers", ())) + [header]}
+      await send(message)
+
+    try:
+      await self.app(scope, receive, send_with_request_id)
+    finally:
+      request_id_var.reset(token)
+
+
+class TimingMiddleware:
+  """在响应头中返回服务端处理耗时（Server-Timing），耗时超过阈值时记录慢请求日志"""
+
+  def __init__(self, app, slow_request_ms: float = 1000.0):
+    self.app = app
+    self.slow_request_ms = slow_request_ms
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http":
+      await self.app(scope, receive, send)
+      return
+
+    start = time.perf_counter()
+
+    async def send_with_timing(message):
+      if message["type"] == "http.response.start":
+        # 记录到开始发送响应为止的耗时；流式响应的后续数据不计入
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        message = {**message, "headers": list(message.get("headers", ())) + [
+          (b"server-timing", f"app;dur={elapsed_ms:.1f}".encode()),
+        ]}
+        if elapsed_ms >= self.slow_request_ms:
+          logger.warning(
+            f"Slow request {scope['method']} {scope['path']} took {elapsed_ms:.0f}ms "
+            f"(request_id={request_id_var.get()})")
+      await send(message)
+
+    await self.app(scope, receive, send_with_timing)
+
+
+class RequestIDLogFilter(logging.Filter):
+  """给日志记录加上 request_id 字段，格式中可以使用 %(request_id)s"""
+
+  def filter(self, record):
+    record.request_id = request_id_var.get()
+    return True
+
+
+def configure_logging(level: int = logging.INFO):
+  """
+  应用日志配置（在 main 中调用）
+  根日志没有处理器时添加一个输出 request_id 的处理器；RequestIDLogFilter 安装在根日志和 uvicorn
+  日志的处理器上（装在处理器上，子日志传播上来的记录也会经过过滤器）
+  """
+  root = logging.getLogger()
+  if not root.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root.addHandler(handler)
+    root.setLevel(level)
+
+  request_id_filter = RequestIDLogFilter()
+  for name in ("", "uvicorn", "uvicorn.error", "uvicorn.access"):
+    for handler in logging.getLogger(name).handlers:
+      if not any(isinstance(existing, RequestIDLogFilter) for existing in handler.filters):
+        handler.addFilter(request_id_filter)
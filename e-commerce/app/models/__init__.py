@@ -8,6 +8,8 @@ from app.models.wishlist import Wishlist
 from app.models.cart_item import CartItem
 from app.models.order_item import OrderItem
 from app.models.category import Category
+from app.models.outbox_event import OutboxEvent
+from app.models.purchased_product import PurchasedProduct
 
 
 __all__ = [
@@ -20,5 +22,7 @@ __all__ = [
     'Payment',
     'Wishlist',
     'Category',
+    'OutboxEvent',
+    'PurchasedProduct',
     'Base'
 ]
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey, Float
+from sqlalchemy import Column, Integer, ForeignKey, Float, UniqueConstraint
 from sqlalchemy.orm import relationship
 from app.models.base import Base
 
@@ -12,5 +12,10 @@ class CartItem(Base):
   product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
   quantity = Column(Integer, nullable=False, default=1)
 
+  # 每个用户的购物车中每个商品只有一行，批量加购依赖该约束做 upsert
+  __table_args__ = (
+    UniqueConstraint("user_id", "product_id", name="uq_cart_items_user_product"),
+  )
+
   user = relationship("User", back_populates="cart_items")
   product = relationship("Product", back_populates="cart_items")
\ No newline at end of file
@@ -0,0 +1,35 @@
+import enum
+from sqlalchemy import Column, Integer, String, Text, TIMESTAMP, Enum, JSON, Index
+from sqlalchemy.sql import func
+from app.models.base import Base
+
+
+class OutboxStatus(str, enum.Enum):
+  pending = "pending"
+  processed = "processed"
+  failed = "failed"  # 超过最大重试次数，需要人工处理
+
+
+class OutboxEvent(Base):
+  """
+  事务性发件箱（Transactional Outbox）。
+  与业务数据在同一次提交中写入，由后台中继进程异步投递到Celery、Redis等下游。
+  """
+  __tablename__ = "outbox_events"
+
+  id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+  aggregate_type = Column(String(50), nullable=False, comment="聚合类型，例如 order / payment / product")
+  aggregate_id = Column(String(64), nullable=False, comment="聚合ID，同一聚合的事件按ID顺序投递")
+  event_type = Column(String(100), nullable=False, comment="事件类型，例如 order.placed")
+  payload = Column(JSON, nullable=False, default=dict, comment="事件内容")
+  status = Column(Enum(OutboxStatus), nullable=False, default=OutboxStatus.pending)
+  attempts = Column(Integer, nullable=False, default=0, comment="已投递次数")
+  last_error = Column(Text, nullable=True, comment="最近一次投递失败原因")
+  available_at = Column(TIMESTAMP, server_default=func.now(), nullable=False, comment="下次可投递时间（用于退避重试）")
+  created_at = Column(TIMESTAMP, server_default=func.now(), nullable=False)
+  processed_at = Column(TIMESTAMP, nullable=True)
+
+  __table_args__ = (
+    Index("ix_outbox_events_status_id", "status", "id"),
+    Index("ix_outbox_events_aggregate", "aggregate_type", "aggregate_id", "id"),
+  )
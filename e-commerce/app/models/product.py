@@ -22,6 +22,14 @@ class Product(Base):
   # 新增字段：平均评分和评价总数，用于优化性能
   average_rating = Column(Float, nullable=False, default=0.0, comment="商品平均评分")
   review_count = Column(Integer, nullable=False, default=0, comment="商品评价总数")
+  # 评分增量聚合：评分总和与1~5星直方图，随评价写入在同一条语句中更新
+  rating_sum = Column(Integer, nullable=False, default=0, server_default="0", comment="主评价评分总和")
+  rating_1_count = Column(Integer, nullable=False, default=0, server_default="0", comment="1星评价数")
+  rating_2_count = Column(Integer, nullable=False, default=0, server_default="0", comment="2星评价数")
+  rating_3_count = Column(Integer, nullable=False, default=0, server_default="0", comment="3星评价数")
+  rating_4_count = Column(Integer, nullable=False, default=0, server_default="0", comment="4星评价数")
+  rating_5_count = Column(Integer, nullable=False, default=0, server_default="0", comment="5星评价数")
+  last_review_at = Column(TIMESTAMP, nullable=True, comment="最近一条主评价的时间")
 
   # 与Category的关系
   category_obj = relationship("Category", back_populates="products")
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, ForeignKey, TIMESTAMP
+from sqlalchemy.sql import func
+from app.models.base import Base
+
+
+class PurchasedProduct(Base):
+  """
+  购买资格索引：用户已收到（订单已发货或已完成）的商品。
+  由订单状态流转维护，发表评价时只需按主键查找一次；同一商品多次购买只保留一行。
+  """
+  __tablename__ = "purchased_products"
+
+  user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True, comment="用户ID")
+  product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True, comment="商品ID")
+  first_received_at = Column(TIMESTAMP, server_default=func.now(), nullable=False, comment="第一次发货/完成的时间")
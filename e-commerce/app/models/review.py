@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey, Text, TIMESTAMP, CheckConstraint
+from sqlalchemy import Column, Integer, ForeignKey, Text, TIMESTAMP, CheckConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.models.base import Base
@@ -26,6 +26,9 @@ class Review(Base):
     CheckConstraint('likes_count >= 0', name='check_likes_count_non_negative'),
     CheckConstraint('dislikes_count >= 0', name='check_dislikes_count_non_negative'),
     CheckConstraint('rating >= 1 AND rating <= 5', name='check_rating_range'),
+    # 评论分页（按商品 + 时间倒序的键集分页）与批量加载追评
+    Index('ix_reviews_product_created_id', 'product_id', 'created_at', 'id'),
+    Index('ix_reviews_parent_review_id', 'parent_review_id'),
   )
 
   # --- ORM关系定义 ---
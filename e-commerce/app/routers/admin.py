@@ -23,7 +23,7 @@ async def get_all_reviews(
     all_reviews = await AdminService.all_reviews(db)
     return all_reviews
   except HTTPException as exc:
-    return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+    return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
   except Exception as e:
     return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
 
@@ -35,7 +35,7 @@ async def get_all_orders(
     result = await AdminService.get_all_orders(db)
     return result
   except HTTPException as exc:
-    return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+    return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
   except Exception as e:
     return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
 
@@ -47,7 +47,7 @@ async def get_sales_statistics(
     statistics = await AdminService.get_sales_statistics(db)
     return statistics
   except HTTPException as exc:
-    return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+    return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
   except Exception as e:
     return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
 
@@ -59,7 +59,7 @@ async def get_analytics(
     analytics = await AdminService.generate_analytics(db)
     return analytics
   except HTTPException as exc:
-    return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+    return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
   except Exception as e:
     return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
 
@@ -74,7 +74,7 @@ async def create_user(
       return users
     return JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"message": status.HTTP_403_FORBIDDEN})
   except HTTPException as exc:
-    return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+    return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
   except Exception as e:
     return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
 
@@ -87,6 +87,6 @@ async def get_all_users(
       users = await AdminService.get_all_users_db(db)
       return users
   except HTTPException as exc:
-    return JSONResponse(content=str(exc), status_code=exc.status_code)
+    return JSONResponse(content=str(exc), status_code=exc.status_code, headers=exc.headers)
   except Exception as e:
     return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
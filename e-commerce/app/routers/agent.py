@@ -2,7 +2,9 @@
 AI Agent路由
 提供智能商品推荐和购物车操作接口
 """
-from fastapi.responses import JSONResponse
+import json
+
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, Field
@@ -11,6 +13,7 @@ from typing import Optional, List
 from app.database.session import get_db
 from app.utils.token import get_current_user
 from app.models.user import User
+from app.agent.runtime import agent_runtime
 
 # 可选导入RAGAgent
 try:
@@ -36,6 +39,20 @@ class AddToCartRequest(BaseModel):
     quantity: int = Field(1, ge=1, description="数量")
 
 
+@router.get("/ready")
+async def agent_readiness():
+    """
+    Agent就绪检查（供负载均衡/探针使用）
+    未就绪时返回503
+    """
+    info = agent_runtime.readiness()
+    if not RAG_AGENT_AVAILABLE:
+        info.update({"ready": False, "error": RAG_AGENT_ERROR})
+    if not info["ready"]:
+        return JSONResponse(content=info, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return info
+
+
 @router.post("/chat")
 async def chat_with_agent(
         request: ChatRequest,
@@ -52,7 +69,8 @@ async def chat_with_agent(
         )
     
     try:
-        agent = RAGAgent()
+        # 本进程共享的Agent（lifespan中创建），正在加载时等待
+        agent = await agent_runtime.get_agent()
         result = await agent.chat(
             user_query=request.query,
             user=current_user,
@@ -60,7 +78,7 @@ async def chat_with_agent(
         )
         return result
     except HTTPException as exc:
-        return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+        return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
     except Exception as e:
         return JSONResponse(
             content={"message": f"Agent处理失败: {str(e)}"},
@@ -68,6 +86,55 @@ async def chat_with_agent(
         )
 
 
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/chat/stream")
+async def chat_with_agent_stream(
+        request: ChatRequest,
+        db: AsyncSession = Depends(get_db),
+        current_user=Depends(get_current_user)):
+    """
+    与AI Agent对话（流式）
+    以Server-Sent Events返回：先返回推荐商品（products），再逐段返回回复文本（token），最后返回 done
+    """
+    if not RAG_AGENT_AVAILABLE:
+        return JSONResponse(
+            content={"message": f"Agent功能不可用: {RAG_AGENT_ERROR}. 请安装依赖: pip install chromadb sentence-transformers"},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    
+    try:
+        agent = await agent_runtime.get_agent()
+        # 检索和数据库查询在开始返回响应之前完成（数据库会话不会在流式响应期间保持）
+        products_info = await agent.find_products(request.query, db)
+    except HTTPException as exc:
+        return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
+    except ValueError as e:
+        # 向量数据库为空或损坏
+        return JSONResponse(
+            content={"message": f"抱歉，知识库尚未初始化。{str(e)}"},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    except Exception as e:
+        return JSONResponse(
+            content={"message": f"Agent处理失败: {str(e)}"},
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    
+    async def event_stream():
+        async for item in agent.chat_stream(request.query, products_info):
+            yield _sse(item["event"], item["data"])
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # 禁止代理缓冲，否则首个数据块要等到响应结束才会到达客户端
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.post("/recommend")
 async def recommend_products(
         query: str,
@@ -84,7 +151,8 @@ async def recommend_products(
         )
     
     try:
-        agent = RAGAgent()
+        # 本进程共享的Agent（lifespan中创建），正在加载时等待
+        agent = await agent_runtime.get_agent()
         result = await agent.chat(
             user_query=query,
             user=current_user,
@@ -95,7 +163,7 @@ async def recommend_products(
             "total_found": result.get("total_found", 0)
         }
     except HTTPException as exc:
-        return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+        return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
     except Exception as e:
         return JSONResponse(
             content={"message": f"推荐失败: {str(e)}"},
@@ -118,7 +186,8 @@ async def agent_add_to_cart(
         )
     
     try:
-        agent = RAGAgent()
+        # 本进程共享的Agent（lifespan中创建），正在加载时等待
+        agent = await agent_runtime.get_agent()
         result = await agent.add_to_cart(
             product_id=request.product_id,
             quantity=request.quantity,
@@ -127,7 +196,7 @@ async def agent_add_to_cart(
         )
         return result
     except HTTPException as exc:
-        return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+        return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
     except Exception as e:
         return JSONResponse(
             content={"message": f"添加到购物车失败: {str(e)}"},
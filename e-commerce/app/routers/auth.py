@@ -8,7 +8,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.database.session import get_db
 from app.services.auth_service import AuthService
 from app.services.email_service import EmailService
-from app.schemas.user import UserCreate, UserLogin
+from app.schemas.user import UserCreate, UserLogin, RefreshTokenRequest
 from app.responses.user_responses import user_responses
 from app.responses.register_response import auth_email, register_responses
 
@@ -27,7 +27,7 @@ async def register_user(
     users = await AuthService.register_user(user_data, db)
     return users
   except HTTPException as exc:
-      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
   except Exception as e:
     return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
 
@@ -40,7 +40,21 @@ async def login_user(
     result = await AuthService.login_user(user.email, user.password, response, db)
     return result
   except HTTPException as exc:
-      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
+  except Exception as e:
+    return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
+
+@router.post("/refresh", responses=user_responses)
+async def refresh_token(
+        request: Request,
+        response: Response,
+        data: RefreshTokenRequest = None,
+        db: AsyncSession = Depends(get_db)):
+  try:
+    token = (data.refresh_token if data else None) or request.cookies.get("refresh_token")
+    return await AuthService.refresh_tokens(token, response, db)
+  except HTTPException as exc:
+      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
   except Exception as e:
     return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
 
@@ -50,7 +64,7 @@ async def logout(request: Request, response: Response):
     message = await AuthService.logout_user(request,response)
     return message
   except HTTPException as exc:
-      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
   except Exception as e:
     return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
 
@@ -59,7 +73,7 @@ async def verify_email(request: Request):
   try:
     return templates.TemplateResponse("email-verification.html",{"request":request})
   except HTTPException as exc:
-      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
   except Exception as e:
     return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
   
@@ -70,6 +84,6 @@ async def verify_email_token(
   try:
     return await EmailService.verify_email(token, db)
   except HTTPException as exc:
-      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
   except Exception as e:
     return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
@@ -7,7 +7,7 @@ from fastapi import APIRouter, HTTPException, status, Depends
 from app.database.session import get_db
 from app.utils.token import get_current_user
 from app.services.cart_item_service import CartService
-from app.schemas.cart_item import CartItemCreate, CartItemUpdate, CartItemResponse
+from app.schemas.cart_item import CartItemCreate, CartItemUpdate, CartItemResponse, CartItemBatchCreate, CartSummaryResponse
 from app.responses.cart_item_response import cart_item_post_response, delete_response
 
 
@@ -40,6 +40,31 @@ async def get_cart_items(
   except Exception as e:
     return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
 
+@router.post('/batch', response_model=List[CartItemResponse])
+async def create_cart_items_batch(
+  batch: CartItemBatchCreate,
+  db: AsyncSession = Depends(get_db),
+  current_user=Depends(get_current_user)):
+  try:
+    cart_items = await CartService.create_cart_items_batch(batch, db, current_user)
+    return cart_items
+  except HTTPException as exc:
+      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+  except Exception as e:
+    return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
+
+@router.get('/summary', response_model=CartSummaryResponse)
+async def get_cart_summary(
+  db: AsyncSession=Depends(get_db),
+  current_user=Depends(get_current_user)):
+  try:
+    summary = await CartService.get_cart_summary(db, current_user)
+    return summary
+  except HTTPException as exc:
+      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+  except Exception as e:
+    return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
+
 @router.get('/{cart_item_id}', response_model=CartItemResponse)
 async def get_cart_item_by_id(
   cart_item_id: int, 
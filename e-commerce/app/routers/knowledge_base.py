@@ -8,6 +8,9 @@ from fastapi import APIRouter, Depends, HTTPException, status
 
 from app.database.session import get_db
 from app.utils.token import get_current_admin
+from app.agent.runtime import agent_runtime
+from app.database.redis_session import redis_connection
+from app.services.knowledge_base_indexer import KB_DIRTY_KEY
 import asyncio
 
 # 可选导入
@@ -39,12 +42,14 @@ async def get_knowledge_base_status():
         )
     
     try:
-        vector_store = VectorStoreService()
+        # 优先使用本进程共享的向量数据库，避免为一次状态查询打开新的Chroma客户端
+        vector_store = agent_runtime.vector_store or VectorStoreService()
         info = vector_store.get_collection_info()
         return {
             "status": "active",
             "collection_name": info["name"],
             "document_count": info["count"],
+            "pending_changes": await redis_connection.scard(KB_DIRTY_KEY),
             "message": "知识库运行正常" if info["status"] == "active" else f"知识库状态: {info['status']}"
         }
     except Exception as e:
@@ -60,7 +65,8 @@ async def rebuild_knowledge_base(
         current_user=Depends(get_current_admin)):
     """
     重建知识库（仅管理员）
-    删除旧数据并重新构建
+    删除旧数据并重新构建；其他worker在 KB_COLLECTION_CHECK_SECONDS 内发现集合已重建并重新打开，
+    重建完成前检索结果不完整，建议在维护窗口执行
     """
     if not KNOWLEDGE_BASE_AVAILABLE:
         return JSONResponse(
@@ -70,7 +76,7 @@ async def rebuild_knowledge_base(
     
     try:
         # 在后台任务中执行（避免阻塞）
-        asyncio.create_task(init_knowledge_base(rebuild=True))
+        asyncio.create_task(init_knowledge_base(rebuild=True, vector_store=agent_runtime.vector_store))
         return {
             "message": "知识库重建任务已启动，请稍后查询状态",
             "status": "processing"
@@ -87,8 +93,8 @@ async def update_knowledge_base(
         db: AsyncSession = Depends(get_db),
         current_user=Depends(get_current_admin)):
     """
-    增量更新知识库（仅管理员）
-    只添加新的商品和评论
+    全量校对知识库（仅管理员）
+    只为新增或变化的商品和评论生成向量，并删除已下架/已删除的文档
     """
     if not KNOWLEDGE_BASE_AVAILABLE:
         return JSONResponse(
@@ -98,7 +104,7 @@ async def update_knowledge_base(
     
     try:
         # 在后台任务中执行
-        asyncio.create_task(init_knowledge_base(rebuild=False))
+        asyncio.create_task(init_knowledge_base(rebuild=False, vector_store=agent_runtime.vector_store))
         return {
             "message": "知识库更新任务已启动，请稍后查询状态",
             "status": "processing"
@@ -3,7 +3,9 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import APIRouter, Depends, HTTPException, status
 
 from app.database.session import get_db
-from app.schemas.order import OrderResponse, ShipOrderRequest
+from app.models.order import OrderStatus
+from app.schemas.order import (OrderResponse, ShipOrderRequest, BulkOrderRequest,
+                               BulkShipOrderRequest, BulkOrderStatusRequest, BulkOrderResponse)
 from app.utils.token import get_current_user, get_current_admin, get_current_vendor
 from app.services.order_service import OrderService
 from app.responses.order_responses import order_responses
@@ -11,6 +13,66 @@ from app.responses.order_responses import order_responses
 
 router = APIRouter(prefix="/orders", tags=["Orders"])
 
+@router.patch("/bulk/ship", response_model=BulkOrderResponse)
+async def bulk_ship_orders(
+        ship_request: BulkShipOrderRequest,
+        db: AsyncSession = Depends(get_db),
+        current_vendor=Depends(get_current_vendor)):
+  """
+  商家批量发货
+  一次请求发货多个订单，逐个返回成功或失败原因
+  """
+  try:
+    tracking_numbers = {item.order_id: item.tracking_number for item in ship_request.items}
+    return await OrderService.transition_orders(
+      db, list(tracking_numbers), OrderStatus.shipped, current_vendor, tracking_numbers)
+  except HTTPException as exc:
+      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+  except Exception as e:
+    return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
+
+@router.patch("/bulk/confirm-receipt", response_model=BulkOrderResponse)
+async def bulk_confirm_receipt(
+        bulk_request: BulkOrderRequest,
+        db: AsyncSession = Depends(get_db),
+        current_user=Depends(get_current_user)):
+  """批量确认收货"""
+  try:
+    return await OrderService.transition_orders(
+      db, bulk_request.order_ids, OrderStatus.completed, current_user)
+  except HTTPException as exc:
+      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+  except Exception as e:
+    return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
+
+@router.patch("/bulk/cancel", response_model=BulkOrderResponse)
+async def bulk_cancel_orders(
+        bulk_request: BulkOrderRequest,
+        db: AsyncSession = Depends(get_db),
+        current_user=Depends(get_current_user)):
+  """批量取消订单，并归还库存"""
+  try:
+    return await OrderService.transition_orders(
+      db, bulk_request.order_ids, OrderStatus.canceled, current_user)
+  except HTTPException as exc:
+      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+  except Exception as e:
+    return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
+
+@router.patch("/bulk/status", response_model=BulkOrderResponse)
+async def bulk_update_order_status(
+        bulk_request: BulkOrderStatusRequest,
+        db: AsyncSession = Depends(get_db),
+        current_user=Depends(get_current_user)):
+  """管理员批量修改订单状态（仅允许状态机中定义的流转）"""
+  try:
+    return await OrderService.transition_orders(
+      db, bulk_request.order_ids, bulk_request.order_status, current_user)
+  except HTTPException as exc:
+      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+  except Exception as e:
+    return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
+
 @router.get("/{order_id}", response_model=OrderResponse)
 async def get_order(
         order_id: int,
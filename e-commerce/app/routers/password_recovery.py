@@ -24,7 +24,7 @@ async def initiate_password_recovery(
    response = await InitPasswordRecovery.initiate_password_recovery(user, db)
    return response
   except HTTPException as exc:
-      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
   except Exception as e:
     return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
 
@@ -41,7 +41,7 @@ async def do_password_recovery(
    message = await InitPasswordRecovery.do_password_recovery(userinfo, db)
    return message
   except HTTPException as exc:
-      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
   except Exception as e:
     return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
 
@@ -51,7 +51,7 @@ async def password_recovery(request: Request):
     password_recovery_html = templates.TemplateResponse("password-recovery.html", {"request":request})
     return password_recovery_html
   except HTTPException as exc:
-      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+      return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
   except Exception as e:
     return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
 
@@ -64,6 +64,6 @@ async def change_password(
       message = await InitPasswordRecovery.change_password(user_password, current_user, db)
       return message
   except HTTPException as exc:
-    return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+    return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
   except Exception as e:
       return {"message": str(e)}
\ No newline at end of file
@@ -1,11 +1,11 @@
 from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 
 from app.database.session import get_db
 from app.utils.token import get_current_user
 from app.services.review_service import ReviewService
-from app.schemas.review import ReviewCreate, LikeDislike
+from app.schemas.review import ReviewCreate, LikeDislike, ReviewThreadFilter
 from app.responses.reviews_response import (review_post_response,
                                             review_put_response,
                                             review_delete_response)
@@ -25,13 +25,26 @@ async def get_all_reviews(
   except Exception as e:
     return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
 
+@router.get("/{product_id}/summary")
+async def get_review_summary(
+        product_id:int,
+        db:AsyncSession = Depends(get_db)):
+  try:
+    summary = await ReviewService.get_review_summary(product_id, db)
+    return {"summary": summary}
+  except HTTPException as exc:
+    return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+  except Exception as e:
+    return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
+
 @router.get("/{product_id}")
 async def get_review_by_product_id(
         product_id:int,
+        filters: ReviewThreadFilter = Query(...),
         db:AsyncSession = Depends(get_db)):
   try:
-    review = await ReviewService.get_review_by_id(product_id, db)
-    return {"review": review}
+    page = await ReviewService.get_review_by_id(product_id, db, filters)
+    return {"review": page["items"], "next_cursor": page["next_cursor"]}
   except HTTPException as exc:
     return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
   except Exception as e:
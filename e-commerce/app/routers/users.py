@@ -35,7 +35,7 @@ async def get_user_by_id(
     users = await UserService.get_user_by_id_in_db(user_id, db, current_user)
     return users
   except HTTPException as exc:
-    return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+    return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
   except Exception as e:
     return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
 
@@ -49,7 +49,7 @@ async def update_user(
     users = await UserService.update_user_in_db(user_id, current_user, user_data, db)
     return users
   except HTTPException as exc:
-    return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+    return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
   except Exception as e:
     return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
 
@@ -62,6 +62,6 @@ async def delete_user(
     users = await UserService.delete_user_in_db(user_id, current_user, db)
     return users
   except HTTPException as exc:
-    return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code)
+    return JSONResponse(content={"message": str(exc)}, status_code=exc.status_code, headers=exc.headers)
   except Exception as e:
     return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
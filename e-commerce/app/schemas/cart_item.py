@@ -1,3 +1,5 @@
+from typing import List
+
 from fastapi import HTTPException, status
 from pydantic import BaseModel, ConfigDict, Field, field_validator
 
@@ -47,4 +49,17 @@ class CartItemResponse(CartItemBase):
   price: float
   user_id: int
   
-  model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+  model_config = ConfigDict(from_attributes=True)
+
+
+class CartItemBatchCreate(BaseModel):
+  """批量加购，例如从心愿单或Agent推荐一次加入多个商品"""
+  items: List[CartItemCreate] = Field(..., min_length=1, max_length=100)
+
+
+class CartSummaryResponse(BaseModel):
+  """购物车页面所需的全部数据：购物车行和汇总金额"""
+  items: List[CartItemResponse]
+  item_count: int
+  total_quantity: int
+  total_amount: float
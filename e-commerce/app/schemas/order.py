@@ -83,4 +83,34 @@ class ShipOrderRequest(BaseModel):
         detail="Tracking number must be at most 100 characters long."
       )
     
-    return tracking_number
\ No newline at end of file
+    return tracking_number
+
+class BulkOrderRequest(BaseModel):
+  """批量操作订单（确认收货 / 取消）"""
+  order_ids: List[int] = Field(..., min_length=1, max_length=500,
+                               json_schema_extra={"description": "订单ID列表，最多500个"})
+
+
+class BulkShipItem(ShipOrderRequest):
+  order_id: int = Field(..., gt=0)
+
+
+class BulkShipOrderRequest(BaseModel):
+  """商家批量发货，每个订单对应一个快递单号"""
+  items: List[BulkShipItem] = Field(..., min_length=1, max_length=500)
+
+
+class BulkOrderStatusRequest(BulkOrderRequest):
+  """管理员批量修改订单状态"""
+  order_status: OrderStatus
+
+
+class BulkOrderFailure(BaseModel):
+  order_id: int
+  reason: str
+  detail: str
+
+
+class BulkOrderResponse(BaseModel):
+  succeeded: List[int]
+  failed: List[BulkOrderFailure]
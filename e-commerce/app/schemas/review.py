@@ -1,8 +1,8 @@
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 from pydantic import BaseModel, ConfigDict, Field, field_validator
 from fastapi import HTTPException, status
-from enum import IntEnum
+from enum import Enum, IntEnum
 
 class LikeDislikeEnum(IntEnum): 
   like = 1
@@ -50,15 +50,35 @@ class LikeDislike(BaseModel):
 class ReviewUpdate(ReviewBase):
   pass
 
+class ReviewSort(str, Enum):
+  newest = "newest"              # 最新
+  most_helpful = "most_helpful"  # 点赞最多
+  rating = "rating"              # 评分最高
+
+class ReviewThreadFilter(BaseModel):
+  sort: ReviewSort = ReviewSort.newest
+  size: int = Field(10, ge=1, le=50)
+  cursor: Optional[str] = None  # 上一页返回的 next_cursor，为空时返回第一页
+
 class ReviewResponse(ReviewBase):
   id: int
   product_id: Optional[int]
   parent_review_id: Optional[int] = None  # 主评论ID，如果为NULL则是主评论
+  likes_count: int = 0
+  dislikes_count: int = 0
   created_at: datetime
   follow_up_reviews: Optional[List['ReviewResponse']] = None  # 追评列表
 
   model_config = ConfigDict(from_attributes=True)
 
+class ReviewSummaryResponse(BaseModel):
+  product_id: int
+  average_rating: float
+  review_count: int
+  histogram: Dict[int, int]      # 星级 -> 评价数
+  percentages: Dict[int, float]  # 星级 -> 占比（%）
+  last_review_at: Optional[datetime] = None
+
 class Review(ReviewBase):
   id: int
   created_at: datetime
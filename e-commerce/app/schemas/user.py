@@ -265,6 +265,15 @@ class UserResponse(BaseModel):
 
   model_config = ConfigDict(from_attributes=True)
 
+class Principal(BaseModel):
+  """已认证用户的最小信息，由 get_current_user 从缓存中返回"""
+  id: int
+  role: Optional[Role] = Role.customer
+  is_active: Optional[bool] = True
+  email: str
+
+  model_config = ConfigDict(from_attributes=True)
+
 class Token(BaseModel):
   access_token: str
   token_type: str
@@ -295,6 +304,10 @@ class DefaultUser(BaseModel):
 class UserLogin(DefaultUser):
   password: str = Field(..., min_length=1, json_schema_extra={"description": "The password of the user"})
 
+class RefreshTokenRequest(BaseModel):
+  refresh_token: Optional[str] = Field(
+    default=None, json_schema_extra={"description": "The refresh token; the refresh_token cookie is used when omitted"})
+
 class ChangePassword(BaseModel):
   password: str
   new_password: str
@@ -6,7 +6,7 @@ from app.models.user import User
 from app.models.order import Order
 from app.models.review import Review
 from app.models.product import Product
-from app.utils.hashing import pwd_context
+from app.utils.hashing import hash_password_async
 from app.models.order_item import OrderItem
 from app.schemas.user import UserResponse, UserCreate
 from app.services.email_service import EmailService
@@ -37,7 +37,7 @@ class AdminService:
         status_code=status.HTTP_400_BAD_REQUEST,
         detail="User with this email already exists")
 
-    hashed_password = pwd_context.hash(user_data.password)
+    hashed_password = await hash_password_async(user_data.password)
     new_user_data = user_data.model_dump(exclude={"password", "sensitive_info"})
     if user_data.sensitive_info:
       sensitive_info_data = user_data.sensitive_info
@@ -11,8 +11,10 @@ from app.config.settings import settings
 from app.services.email_service import EmailService
 from app.schemas.user import UserCreate, UserResponse
 from app.database.redis_session import redis_connection
-from app.utils.hashing import hash_password, verify_password
-from app.utils.token import create_access_token, create_refresh_token
+from app.utils.hashing import hash_password_async, verify_password_async
+from app.utils.principal_cache import principal_cache
+from app.utils.refresh_token_store import RefreshTokenStore, REFRESH_OK
+from app.utils.token import create_access_token, create_refresh_token, decode_refresh_token
 
 
 SECRET_KEY=settings.SECRET_KEY
@@ -40,7 +42,7 @@ class AuthService:
 
     # username 允许重复，不检查
 
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await hash_password_async(user_data.password)
     user_data = {**user_data.model_dump(), "password": hashed_password, "created_at": datetime.now()}
 
     new_user = User(**user_data)
@@ -62,7 +64,7 @@ class AuthService:
           detail="Invalid email or password"
         )
 
-      if not verify_password(password, user.password):
+      if not await verify_password_async(password, user.password):
         raise HTTPException(
           status_code=status.HTTP_401_UNAUTHORIZED,
           detail="Invalid email or password"
@@ -74,23 +76,50 @@ class AuthService:
       # if not user.is_verified:
       #   raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
 
-      token_data = {"role": user.role}
-      access_token = create_access_token(token_data, user_id=user.id)
-      refresh_token = create_refresh_token(token_data, user_id=user.id)
-      # unique_id = hex(randint(0,255))
-      # await redis_connection.set(unique_id, refresh_token)
-      
-      # Store refresh token in a simple dictionary for now
-      # In production, you might want to use a database table for this
-      response.set_cookie(key="refresh_token", value=refresh_token, httponly=True)
-
-      return {
-        "accessToken": access_token,
-        "refreshToken": refresh_token,
-      }
-  
+      return AuthService._issue_tokens(user.id, user.role, response)
+
+  @staticmethod
+  def _issue_tokens(user_id: int, role, response: Response, family_id: str = None):
+    token_data = {"role": role}
+    access_token = create_access_token(token_data, user_id=user_id)
+    refresh_token = create_refresh_token(token_data, user_id=user_id, family_id=family_id)
+    response.set_cookie(key="refresh_token", value=refresh_token, httponly=True)
+
+    return {
+      "accessToken": access_token,
+      "refreshToken": refresh_token,
+    }
+
+  @staticmethod
+  async def refresh_tokens(refresh_token: str, response: Response, db: AsyncSession):
+    """
+    用刷新令牌换取新的访问令牌和刷新令牌（轮换），旧刷新令牌随即失效。
+    吊销检查只访问Redis；用户角色和状态从 principal_cache 读取，命中缓存时不访问数据库。
+    """
+    if not refresh_token:
+      raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token is missing")
+
+    payload = await decode_refresh_token(refresh_token)
+    result = await RefreshTokenStore.rotate(payload)
+    if result != REFRESH_OK:
+      raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token has been revoked")
+
+    user = await principal_cache.get(db, int(payload["sub"]))
+    if not user or not user.is_active:
+      raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Inactive user")
+
+    return AuthService._issue_tokens(user.id, user.role, response, family_id=payload["fid"])
+
   @staticmethod
   async def logout_user(request,response):
+    # 吊销当前登录的刷新令牌族
+    refresh_token = request.cookies.get("refresh_token")
+    if refresh_token:
+      try:
+        await RefreshTokenStore.revoke(await decode_refresh_token(refresh_token))
+      except HTTPException:
+        pass
+
     for cookie in request.cookies:
       response.delete_cookie(cookie)
     return {"message": "Successfully logged out"}
\ No newline at end of file
@@ -1,17 +1,74 @@
+from typing import Dict
+
+from sqlalchemy import and_, case, func
 from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import insert
 from fastapi  import HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config.settings import settings
 from app.models.product import Product
 from app.models.cart_item import CartItem
-from app.schemas.cart_item import CartItemCreate, CartItemResponse
+from app.services.pricing_service import PricingService
+from app.services.product_cache_service import ProductCacheService
+from app.services.cart_store import RedisCartStore
+from app.schemas.cart_item import CartItemCreate, CartItemResponse, CartItemBatchCreate, CartSummaryResponse
+
+
+def use_redis_cart() -> bool:
+  return settings.CART_BACKEND == "redis"
+
+
+def merge_batch_items(items) -> Dict[int, int]:
+  """合并批量加购请求中重复的商品，返回 商品ID -> 增加数量"""
+  requested = {}
+  for item in items:
+    requested[item.product_id] = requested.get(item.product_id, 0) + item.quantity
+  return requested
+
+
+def validate_batch_items(requested: Dict[int, int], products: Dict[int, Dict], in_cart: Dict[int, int]):
+  """
+  校验批量加购的所有商品，任意一个不合法则整批拒绝
+
+  Args:
+      requested: 商品ID -> 增加数量
+      products: 商品ID -> {stock, is_active}
+      in_cart: 商品ID -> 购物车中已有数量
+  """
+  missing = [product_id for product_id in requested
+             if product_id not in products or products[product_id]["is_active"] == False]
+  if missing:
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                        detail=f"Product not found: {missing}")
+
+  exceeded = [
+    f"{product_id} (available stock: {products[product_id]['stock']}, current in cart: {in_cart.get(product_id, 0)})"
+    for product_id, quantity in requested.items()
+    if in_cart.get(product_id, 0) + quantity > products[product_id]["stock"]
+  ]
+  if exceeded:
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Product stock exceeded: {', '.join(exceeded)}")
 
 
 class CartService:
+  @staticmethod
+  def _to_priced_response(cart_item: CartItem, pricing: Dict) -> CartItemResponse:
+    line = pricing["lines"].get(cart_item.product_id)
+    return CartItemResponse(
+      id=cart_item.id,
+      product_id=cart_item.product_id,
+      quantity=cart_item.quantity,
+      price=line["line_total"] if line else cart_item.price,
+      user_id=cart_item.user_id)
+
   @staticmethod
   async def create_cart_item(
           cart_item_data: CartItemCreate,
           db: AsyncSession, current_user):
+    if use_redis_cart():
+      return await RedisCartStore.create_cart_item(cart_item_data, db, current_user)
 
     # 1. 检查商品是否存在且有效
     product_query = select(Product).where(Product.id == cart_item_data.product_id)
@@ -64,17 +121,103 @@ class CartService:
       await db.refresh(cart_item)
       return CartItemResponse.model_validate(cart_item)
 
+  @staticmethod
+  async def create_cart_items_batch(
+          batch: CartItemBatchCreate,
+          db: AsyncSession, current_user):
+    """
+    批量加购
+    一次查询校验所有商品和库存，一条 INSERT ... ON CONFLICT DO UPDATE 写入所有购物车行
+    """
+    requested = merge_batch_items(batch.items)
+    if use_redis_cart():
+      return await CartService._create_cart_items_batch_redis(requested, db, current_user)
+
+    # 一次查询取出商品状态、价格、库存以及购物车中已有的数量
+    result = await db.execute(
+      select(
+        Product.id,
+        Product.price,
+        Product.stock,
+        Product.is_active,
+        func.coalesce(CartItem.quantity, 0).label("in_cart"))
+      .outerjoin(CartItem, and_(CartItem.product_id == Product.id, CartItem.user_id == current_user.id))
+      .where(Product.id.in_(list(requested)))
+    )
+    rows = {row.id: row for row in result.all()}
+    validate_batch_items(
+      requested,
+      {product_id: {"stock": row.stock, "is_active": row.is_active} for product_id, row in rows.items()},
+      {product_id: row.in_cart for product_id, row in rows.items()})
+
+    insert_stmt = insert(CartItem).values([
+      {"user_id": current_user.id, "product_id": product_id, "quantity": quantity,
+       "price": rows[product_id].price * quantity}
+      for product_id, quantity in requested.items()
+    ])
+    # 已在购物车中的商品累加数量，并按校验时读到的单价重新计算行价格
+    new_quantity = CartItem.quantity + insert_stmt.excluded.quantity
+    unit_price = case({product_id: row.price for product_id, row in rows.items()}, value=CartItem.product_id)
+    upsert_stmt = (
+      insert_stmt
+      .on_conflict_do_update(
+        index_elements=[CartItem.user_id, CartItem.product_id],
+        set_={"quantity": new_quantity, "price": new_quantity * unit_price})
+      .returning(CartItem)
+    )
+    result = await db.execute(upsert_stmt)
+    cart_items = result.scalars().all()
+    await db.commit()
+
+    return [CartItemResponse.model_validate(item) for item in cart_items]
+
+  @staticmethod
+  async def _create_cart_items_batch_redis(requested: Dict[int, int], db: AsyncSession, current_user):
+    """Redis购物车的批量加购：先校验商品，库存上限在Lua脚本中与累加一起原子校验"""
+    products = await ProductCacheService.get_many(db, requested)
+    validate_batch_items(requested, products, {})
+
+    added, quantities = await RedisCartStore.add_items(
+      db, current_user.id, requested,
+      {product_id: products[product_id]["stock"] for product_id in requested})
+    if not added:
+      # 加上购物车中已有的数量后超出库存
+      validate_batch_items(requested, products, quantities)
+
+    return [
+      RedisCartStore._to_response(current_user.id, product_id, quantity, products[product_id])
+      for product_id, quantity in quantities.items()
+    ]
+
+  @staticmethod
+  async def get_cart_summary(db: AsyncSession, current_user) -> CartSummaryResponse:
+    """购物车汇总：行价格与购物车列表一样由 PricingService 按当前商品价格计算"""
+    items = await CartService.get_cart_items(db, current_user)
+    return CartSummaryResponse(
+      items=items,
+      item_count=len(items),
+      total_quantity=sum(item.quantity for item in items),
+      total_amount=sum(item.price for item in items))
+
   @staticmethod
   async def get_cart_items(db: AsyncSession, current_user):
+    if use_redis_cart():
+      return await RedisCartStore.get_cart_items(db, current_user)
+
     cart_query = select(CartItem).where(CartItem.user_id == current_user.id)
     cart_items_result = await db.execute(cart_query)
     cart_items = cart_items_result.scalars().all()
 
-    # 转换为Pydantic模型以确保所有字段都被正确序列化
-    return [CartItemResponse.model_validate(item) for item in cart_items]
+    # 行价格按当前商品价格计算，而不是加购时保存的价格
+    pricing = await PricingService.price_lines(db, {item.product_id: item.quantity for item in cart_items})
+    return [CartService._to_priced_response(item, pricing) for item in cart_items
+            if item.product_id in pricing["lines"]]
 
   @staticmethod
   async def get_cart_item_by_id(cart_item_id: int, db: AsyncSession, current_user):
+    if use_redis_cart():
+      return await RedisCartStore.get_cart_item_by_id(cart_item_id, db, current_user)
+
     cart_item_query = select(CartItem).where(CartItem.id == cart_item_id)
     cart_item_result = await db.execute(cart_item_query)
     cart_item = cart_item_result.scalar_one_or_none()
@@ -85,10 +228,14 @@ class CartService:
     if not cart_item.user_id == current_user.id:
       raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
 
-    return CartItemResponse.model_validate(cart_item)
+    pricing = await PricingService.price_lines(db, {cart_item.product_id: cart_item.quantity})
+    return CartService._to_priced_response(cart_item, pricing)
 
   @staticmethod
   async def update_cart_item(cart_item_id: int, cart_item, db: AsyncSession, current_user):
+    if use_redis_cart():
+      return await RedisCartStore.update_cart_item(cart_item_id, cart_item, db, current_user)
+
     # 查询购物车项（用于权限验证）
     cart_item_query = select(CartItem).where(CartItem.id == cart_item_id)
     cart_item_db_result = await db.execute(cart_item_query)
@@ -119,6 +266,9 @@ class CartService:
 
   @staticmethod
   async def delete_cart_item(cart_item_id: int, db: AsyncSession, current_user):
+    if use_redis_cart():
+      return await RedisCartStore.delete_cart_item(cart_item_id, db, current_user)
+
     cart_item_query = select(CartItem).where(CartItem.id == cart_item_id)
     cart_item_result = await db.execute(cart_item_query)
     cart_item = cart_item_result.scalar_one_or_none()
@@ -131,4 +281,16 @@ class CartService:
 
     await db.delete(cart_item)
     await db.commit()
-    return {"message": "Cart item deleted successfully"}
\ No newline at end of file
+    return {"message": "Cart item deleted successfully"}
+
+  @staticmethod
+  async def persist_cart(db: AsyncSession, current_user):
+    """下单前确保 cart_items 表中是最新的购物车（数据库模式下无需操作）"""
+    if use_redis_cart():
+      await RedisCartStore.persist_cart(db, current_user.id)
+
+  @staticmethod
+  async def discard_cart_cache(current_user):
+    """下单完成后丢弃缓存中的购物车（数据库模式下无需操作）"""
+    if use_redis_cart():
+      await RedisCartStore.discard_cart(current_user.id)
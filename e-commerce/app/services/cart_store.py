@@ -0,0 +1,359 @@
+"""
+Redis购物车存储
+每个用户的购物车保存为一个Redis哈希（product_id -> quantity），加购/改数量/删除只访问Redis，
+价格在读取时从商品快照缓存计算；购物车由后台任务定期写回 cart_items 表，下单前也会同步写回一次。
+启用方式：CART_BACKEND=redis（默认仍使用数据库）。
+"""
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.settings import settings
+from app.models.cart_item import CartItem
+from app.database.session import AsyncSessionLocal
+from app.database.redis_session import redis_connection
+from app.schemas.cart_item import CartItemCreate, CartItemResponse
+from app.services.pricing_service import PricingService
+from app.services.product_cache_service import ProductCacheService
+from app.utils.distributed_lock import DistributedLock
+
+
+logger = logging.getLogger(__name__)
+
+DIRTY_CARTS_KEY = "cart:dirty"  # 有未写回数据库修改的用户ID集合
+LOADED_FIELD = "_loaded"  # 哨兵字段：保证空购物车也存在于Redis中，避免重复从数据库加载
+NOT_LOADED = -2
+
+# 购物车不在Redis中时返回 NOT_LOADED，由调用方从数据库加载后重试
+# KEYS[1]=购物车键 KEYS[2]=脏数据集合 ARGV[1]=商品ID ARGV[2]=增加数量 ARGV[3]=库存上限 ARGV[4]=TTL ARGV[5]=用户ID
+ADD_ITEM_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return {-2, 0}
+end
+local current = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+local new_quantity = current + tonumber(ARGV[2])
+if new_quantity > tonumber(ARGV[3]) then
+  return {-1, current}
+end
+redis.call('HSET', KEYS[1], ARGV[1], new_quantity)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('SADD', KEYS[2], ARGV[5])
+return {1, new_quantity}
+"""
+
+# 批量加购：先校验所有商品的库存上限，全部满足才累加，任意一个超出则整批不写入
+# ARGV[1]=TTL ARGV[2]=用户ID ARGV[3..]=(商品ID, 增加数量, 库存上限) 三元组
+# 返回 {1, 新数量...}，超出库存时返回 {-1, 已有数量...}
+ADD_ITEMS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return {-2}
+end
+local result = {1}
+for i = 3, #ARGV, 3 do
+  local current = tonumber(redis.call('HGET', KEYS[1], ARGV[i]) or '0')
+  result[#result + 1] = current
+  if current + tonumber(ARGV[i + 1]) > tonumber(ARGV[i + 2]) then
+    result[1] = -1
+  end
+end
+if result[1] == -1 then
+  return result
+end
+for i = 3, #ARGV, 3 do
+  result[(i - 3) / 3 + 2] = redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('SADD', KEYS[2], ARGV[2])
+return result
+"""
+
+# ARGV[1]=商品ID ARGV[2]=新数量 ARGV[3]=TTL ARGV[4]=用户ID
+SET_ITEM_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return -2
+end
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+  return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('SADD', KEYS[2], ARGV[4])
+return 1
+"""
+
+# ARGV[1]=商品ID ARGV[2]=用户ID
+DELETE_ITEM_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return -2
+end
+local removed = redis.call('HDEL', KEYS[1], ARGV[1])
+if removed == 1 then
+  redis.call('SADD', KEYS[2], ARGV[2])
+end
+return removed
+"""
+
+
+def _cart_key(user_id: int) -> str:
+  return f"cart:{user_id}"
+
+
+def _parse_cart(raw: Dict) -> Dict[int, int]:
+  return {int(product_id): int(quantity) for product_id, quantity in raw.items() if product_id != LOADED_FIELD}
+
+
+class RedisCartStore:
+  """
+  与 CartService 相同的接口。
+  Redis模式下购物车行的ID即商品ID（每个商品在购物车中只有一行）。
+  """
+
+  @staticmethod
+  async def _load_from_db(db: AsyncSession, user_id: int) -> Dict[int, int]:
+    """把数据库中的购物车加载到Redis"""
+    result = await db.execute(
+      select(CartItem.product_id, CartItem.quantity).where(CartItem.user_id == user_id))
+    quantities = {row.product_id: row.quantity for row in result.all()}
+
+    key = _cart_key(user_id)
+    async with redis_connection.pipeline(transaction=True) as pipe:
+      pipe.hsetnx(key, LOADED_FIELD, 1)
+      for product_id, quantity in quantities.items():
+        pipe.hsetnx(key, product_id, quantity)
+      pipe.expire(key, settings.CART_TTL_SECONDS)
+      await pipe.execute()
+    return quantities
+
+  @staticmethod
+  async def _eval(db: AsyncSession, user_id: int, script: str, *args):
+    keys = [_cart_key(user_id), DIRTY_CARTS_KEY]
+    result = await redis_connection.eval(script, len(keys), *keys, *args)
+    first = result[0] if isinstance(result, list) else result
+    if first == NOT_LOADED:
+      await RedisCartStore._load_from_db(db, user_id)
+      result = await redis_connection.eval(script, len(keys), *keys, *args)
+      # 加载后购物车又被过期/淘汰：没有写入，不能当作成功返回
+      if (result[0] if isinstance(result, list) else result) == NOT_LOADED:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Cart is temporarily unavailable. Please try again.")
+    return result
+
+  @staticmethod
+  async def _get_quantities(db: AsyncSession, user_id: int) -> Dict[int, int]:
+    raw = await redis_connection.hgetall(_cart_key(user_id))
+    if not raw:
+      return await RedisCartStore._load_from_db(db, user_id)
+    return _parse_cart(raw)
+
+  @staticmethod
+  def _to_response(user_id: int, product_id: int, quantity: int, snapshot: Dict) -> CartItemResponse:
+    return CartItemResponse(
+      id=product_id,
+      product_id=product_id,
+      quantity=quantity,
+      price=snapshot["price"] * quantity,
+      user_id=user_id)
+
+  @staticmethod
+  async def create_cart_item(cart_item_data: CartItemCreate, db: AsyncSession, current_user):
+    product = await ProductCacheService.get(db, cart_item_data.product_id)
+    if not product or product["is_active"] == False:
+      raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                          detail='Product not found')
+
+    result, quantity = await RedisCartStore._eval(
+      db, current_user.id, ADD_ITEM_SCRIPT,
+      product["id"], cart_item_data.quantity, product["stock"],
+      settings.CART_TTL_SECONDS, current_user.id)
+
+    if result == -1:
+      raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f'Product stock exceeded. Available stock: {product["stock"]}, current in cart: {quantity}')
+
+    return RedisCartStore._to_response(current_user.id, product["id"], quantity, product)
+
+  @staticmethod
+  async def get_cart_items(db: AsyncSession, current_user):
+    quantities = await RedisCartStore._get_quantities(db, current_user.id)
+    pricing = await PricingService.price_lines(db, quantities)
+
+    return [
+      CartItemResponse(
+        id=product_id,
+        product_id=product_id,
+        quantity=line["quantity"],
+        price=line["line_total"],
+        user_id=current_user.id)
+      for product_id, line in pricing["lines"].items()
+    ]
+
+  @staticmethod
+  async def add_items(
+          db: AsyncSession,
+          user_id: int,
+          requested: Dict[int, int],
+          stock: Dict[int, int]) -> Tuple[bool, Dict[int, int]]:
+    """
+    批量加购，库存校验与累加在同一个Lua脚本中完成，并发加购也不会超出库存
+
+    Args:
+        requested: 商品ID -> 增加数量
+        stock: 商品ID -> 库存上限
+
+    Returns:
+        Tuple[bool, Dict[int, int]]: (是否写入, 商品ID -> 写入后的数量)，未写入时为购物车中已有的数量
+    """
+    args = []
+    for product_id, quantity in requested.items():
+      args.extend((product_id, quantity, stock[product_id]))
+    result = await RedisCartStore._eval(
+      db, user_id, ADD_ITEMS_SCRIPT, settings.CART_TTL_SECONDS, user_id, *args)
+    return result[0] == 1, dict(zip(requested, (int(quantity) for quantity in result[1:])))
+
+  @staticmethod
+  async def get_cart_item_by_id(cart_item_id: int, db: AsyncSession, current_user):
+    quantities = await RedisCartStore._get_quantities(db, current_user.id)
+    product = await ProductCacheService.get(db, cart_item_id) if cart_item_id in quantities else None
+
+    if not product:
+      raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Cart Item not found')
+
+    return RedisCartStore._to_response(current_user.id, cart_item_id, quantities[cart_item_id], product)
+
+  @staticmethod
+  async def update_cart_item(cart_item_id: int, cart_item, db: AsyncSession, current_user):
+    product = await ProductCacheService.get(db, cart_item_id)
+    if not product:
+      raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Cart Item not found')
+
+    if cart_item.quantity > product["stock"]:
+      raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                          detail=f"Product stock exceeded. Available stock: {product['stock']}")
+
+    updated = await RedisCartStore._eval(
+      db, current_user.id, SET_ITEM_SCRIPT,
+      cart_item_id, cart_item.quantity, settings.CART_TTL_SECONDS, current_user.id)
+
+    if updated != 1:
+      raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Cart Item not found')
+
+    return RedisCartStore._to_response(current_user.id, cart_item_id, cart_item.quantity, product)
+
+  @staticmethod
+  async def delete_cart_item(cart_item_id: int, db: AsyncSession, current_user):
+    removed = await RedisCartStore._eval(
+      db, current_user.id, DELETE_ITEM_SCRIPT, cart_item_id, current_user.id)
+
+    if removed != 1:
+      raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Cart Item not found')
+
+    return {"message": "Cart item deleted successfully"}
+
+  @staticmethod
+  async def persist_cart(db: AsyncSession, user_id: int):
+    """把Redis中的购物车写回 cart_items 表（Redis中没有该购物车时数据库即为最新）"""
+    lock = DistributedLock(f"cart:persist:{user_id}", timeout=10, retry_times=5, retry_delay=0.1)
+    if not await lock.acquire():
+      raise HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Cart is being saved. Please try again later.")
+
+    try:
+      raw = await redis_connection.hgetall(_cart_key(user_id))
+      if not raw:
+        return
+
+      quantities = _parse_cart(raw)
+      products = await ProductCacheService.get_many(db, quantities)
+
+      await db.execute(delete(CartItem).where(CartItem.user_id == user_id))
+      db.add_all([
+        CartItem(
+          user_id=user_id,
+          product_id=product_id,
+          quantity=quantity,
+          price=products[product_id]["price"] * quantity)
+        for product_id, quantity in quantities.items()
+        if product_id in products
+      ])
+      await db.commit()
+    finally:
+      await lock.release()
+
+  @staticmethod
+  async def discard_cart(user_id: int):
+    """下单后丢弃Redis中的购物车，下次访问时从数据库重新加载"""
+    async with redis_connection.pipeline(transaction=True) as pipe:
+      pipe.delete(_cart_key(user_id))
+      pipe.srem(DIRTY_CARTS_KEY, user_id)
+      await pipe.execute()
+
+
+class CartPersister:
+  """后台定期把有修改的购物车写回数据库"""
+
+  def __init__(self, interval: float = 30.0, batch_size: int = 200):
+    self.interval = interval
+    self.batch_size = batch_size
+    self._task: Optional[asyncio.Task] = None
+    self._stopping = False
+
+  async def flush(self) -> int:
+    """
+    写回一批有修改的购物车
+
+    Returns:
+        int: 本批写回的购物车数量
+    """
+    user_ids = await redis_connection.spop(DIRTY_CARTS_KEY, self.batch_size)
+    if not user_ids:
+      return 0
+
+    flushed = 0
+    async with AsyncSessionLocal() as db:
+      for user_id in user_ids:
+        try:
+          await RedisCartStore.persist_cart(db, int(user_id))
+          flushed += 1
+        except Exception as e:
+          # 写回失败时回滚，会话继续用于本批其他购物车；重新标记，下一轮再试
+          await db.rollback()
+          await redis_connection.sadd(DIRTY_CARTS_KEY, user_id)
+          logger.warning(f"Failed to persist cart of user {user_id}: {e}")
+    return flushed
+
+  async def run_forever(self):
+    while not self._stopping:
+      try:
+        while await self.flush() >= self.batch_size:
+          pass
+      except Exception as e:
+        logger.error(f"Cart persister error: {e}")
+      await asyncio.sleep(self.interval)
+
+  def start(self):
+    if self._task is None or self._task.done():
+      self._stopping = False
+      self._task = asyncio.create_task(self.run_forever())
+    return self._task
+
+  async def stop(self):
+    self._stopping = True
+    if self._task is not None:
+      self._task.cancel()
+      self._task = None
+    # 退出前把剩余的修改全部写回
+    try:
+      while await self.flush():
+        pass
+    except Exception as e:
+      logger.error(f"Cart persister final flush failed: {e}")
+
+
+cart_persister = CartPersister(interval=settings.CART_PERSIST_INTERVAL)
@@ -0,0 +1,146 @@
+"""
+查询编码微批处理
+并发的 /agent/chat 请求各自编码一条短查询（batch size 1），大部分矩阵运算能力被浪费。
+EmbeddingBatcher 收集 max_wait_ms 毫秒内（或凑满 max_batch_size 条）的查询，
+在RAG线程池中执行一次 encode，再把结果分发给各个请求。
+同时进行中的批次数不超过RAG线程池的并发数：线程池忙时新查询继续排队，下一批自然更大。
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from app.config.settings import settings
+from app.services.rag_executor import rag_executor
+
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    def __init__(self, max_batch_size: int = 32, max_wait_ms: float = 5.0, max_queue: int = 512,
+                 executor=rag_executor):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.executor = executor
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._batch_tasks = set()
+        self.batches = 0
+        self.items = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def encode(self, embedding_service, text: str):
+        """
+        编码一条查询，返回向量。未启动时直接在RAG线程池中单独编码
+
+        Raises:
+            HTTPException: 503，排队的查询过多
+        """
+        if not self.running:
+            return await self.executor.encode_query(embedding_service, text)
+
+        if self._queue.qsize() >= self.max_queue:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Agent is busy, please retry",
+                headers={"Retry-After": "1"})
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((embedding_service, text, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple]:
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # 先取走已经在排队的查询，再等待剩余时间
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run_batch(self, batch: List[Tuple]):
+        try:
+            # 一般只有一个 EmbeddingService，按实例分组以防万一
+            groups: Dict[int, List[Tuple]] = {}
+            for item in batch:
+                groups.setdefault(id(item[0]), []).append(item)
+
+            for items in groups.values():
+                embedding_service = items[0][0]
+                texts = [text for _, text, _ in items]
+                try:
+                    vectors = await self.executor.run(embedding_service.encode, texts, batch_size=len(texts))
+                except Exception as e:
+                    for _, _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, _, future), vector in zip(items, vectors):
+                    if not future.done():
+                        future.set_result(vector)
+            self.batches += 1
+            self.items += len(batch)
+        finally:
+            self._slots.release()
+
+    async def run_forever(self):
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    def start(self):
+        if not self.running:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.executor.workers)
+            self._task = asyncio.create_task(self.run_forever())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        # 等待进行中的批次完成，排队中的请求返回错误
+        if self._batch_tasks:
+            await asyncio.gather(*self._batch_tasks, return_exceptions=True)
+        while self._queue is not None and not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Agent is shutting down"))
+
+    def stats(self) -> Dict:
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "average_batch_size": round(self.items / self.batches, 2) if self.batches else None,
+        }
+
+
+embedding_batcher = EmbeddingBatcher(
+    max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+    max_wait_ms=settings.EMBEDDING_BATCH_MAX_WAIT_MS,
+    max_queue=settings.EMBEDDING_BATCH_MAX_QUEUE)
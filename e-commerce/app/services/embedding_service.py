@@ -1,51 +1,49 @@
 """
 Embedding服务
 用于将文本转换为向量
+
+支持两种后端（EMBEDDING_BACKEND）：
+- torch：sentence-transformers + PyTorch（原实现）；
+- onnx：ONNX Runtime，可加载int8动态量化模型，不需要导入PyTorch，内存占用和冷启动都小得多。
+  模型由 export_onnx_embedding.py 导出。
+auto 表示有导出的ONNX模型时使用onnx，否则使用torch；onnx加载失败时回退到torch。
+默认使用torch：不同后端的向量不能混用，集合中记录了构建时的 model_id，切换后端需要重建知识库。
 """
 from typing import List, Optional
+import importlib.util
 import os
 
-# 可选导入sentence_transformers，如果未安装或PyTorch DLL加载失败则提供友好的错误提示
-try:
-    from sentence_transformers import SentenceTransformer
-    import numpy as np
-    SENTENCE_TRANSFORMERS_AVAILABLE = True
-    IMPORT_ERROR = None
-except (ImportError, OSError) as e:
-    SENTENCE_TRANSFORMERS_AVAILABLE = False
-    SentenceTransformer = None
-    np = None
-    IMPORT_ERROR = str(e)
+import numpy as np
 
+from app.config.settings import settings
 
-class EmbeddingService:
-    """
-    Embedding服务
-    使用sentence-transformers生成文本向量
-    """
-    
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
-        """
-        初始化Embedding服务
-        
-        Args:
-            model_name: Embedding模型名称
-        """
+# 只检查是否安装，不在导入时加载PyTorch（导入sentence_transformers需要数秒）
+SENTENCE_TRANSFORMERS_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
+ONNXRUNTIME_AVAILABLE = (
+    importlib.util.find_spec("onnxruntime") is not None
+    and importlib.util.find_spec("tokenizers") is not None
+)
+IMPORT_ERROR = None if SENTENCE_TRANSFORMERS_AVAILABLE else "No module named 'sentence_transformers'"
+
+EMBEDDING_BACKENDS = ("auto", "torch", "onnx")
+
+
+class TorchEmbeddingBackend:
+    """sentence-transformers + PyTorch"""
+
+    name = "torch"
+
+    def __init__(self, model_name: str):
         if not SENTENCE_TRANSFORMERS_AVAILABLE:
             raise ImportError(
                 f"sentence-transformers is not available: {IMPORT_ERROR}. "
                 "Please install it with: pip install sentence-transformers"
             )
-        
-        self.model_name = model_name
-        self.model = None
-        self._load_model()
-    
-    def _load_model(self):
-        """加载Embedding模型"""
+        from sentence_transformers import SentenceTransformer
+
         try:
-            self.model = SentenceTransformer(self.model_name)
-            print(f"Embedding模型加载成功: {self.model_name}")
+            self.model = SentenceTransformer(model_name)
+            print(f"Embedding模型加载成功: {model_name}")
         except Exception as e:
             print(f"加载Embedding模型失败: {e}")
             # 尝试使用默认模型
@@ -56,52 +54,163 @@ class EmbeddingService:
                     f"无法加载Embedding模型: {e2}. "
                     "请检查sentence-transformers和PyTorch是否正确安装。"
                 )
-    
+
+    def encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True
+        )
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+
+class OnnxEmbeddingBackend:
+    """
+    ONNX Runtime 后端
+    复现 all-MiniLM-L6-v2 的 sentence-transformers 流程：分词 → Transformer → 按attention mask平均池化 → L2归一化
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_dir: str, quantized: bool = True, max_length: int = 256, threads: int = 0):
+        if not ONNXRUNTIME_AVAILABLE:
+            raise ImportError(
+                "onnxruntime is not available. Please install it with: pip install onnxruntime tokenizers"
+            )
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_file = os.path.join(model_dir, "model_int8.onnx" if quantized else "model.onnx")
+        tokenizer_file = os.path.join(model_dir, "tokenizer.json")
+        for path in (model_file, tokenizer_file):
+            if not os.path.exists(path):
+                raise FileNotFoundError(
+                    f"{path} not found. Export the model first: python export_onnx_embedding.py"
+                )
+
+        self.quantized = quantized
+        if quantized:
+            self.name = "onnx-int8"
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_file)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            model_file, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {item.name for item in self.session.get_inputs()}
+        self._dimension = self.session.get_outputs()[0].shape[-1]
+        print(f"ONNX Embedding模型加载成功: {model_file}")
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            inputs["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        token_embeddings = self.session.run(None, inputs)[0]
+        # 平均池化（忽略padding）
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        # L2归一化
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        return np.vstack([
+            self._encode_batch(texts[i:i + batch_size])
+            for i in range(0, len(texts), batch_size)
+        ]).astype(np.float32)
+
+    @property
+    def dimension(self) -> int:
+        return int(self._dimension)
+
+
+def create_backend(model_name: str, backend: str = "auto", onnx_dir: Optional[str] = None,
+                   quantized: bool = True):
+    """
+    按配置创建后端，onnx加载失败时回退到torch
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"EMBEDDING_BACKEND must be one of {EMBEDDING_BACKENDS}, got {backend!r}")
+
+    if backend in ("auto", "onnx"):
+        try:
+            return OnnxEmbeddingBackend(onnx_dir, quantized=quantized, threads=settings.EMBEDDING_ONNX_THREADS)
+        except (ImportError, OSError, RuntimeError, TypeError) as e:
+            # auto 模式下没有导出ONNX模型是正常情况，不提示
+            if backend == "onnx":
+                print(f"ONNX Embedding后端不可用，回退到PyTorch: {e}")
+
+    return TorchEmbeddingBackend(model_name)
+
+
+class EmbeddingService:
+    """
+    Embedding服务
+    生成文本向量，具体计算由可插拔的后端完成
+    """
+
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", backend: Optional[str] = None):
+        """
+        初始化Embedding服务
+
+        Args:
+            model_name: Embedding模型名称（torch后端使用）
+            backend: auto / torch / onnx，默认读取 EMBEDDING_BACKEND
+        """
+        self.model_name = model_name
+        self.backend = create_backend(
+            model_name,
+            backend or settings.EMBEDDING_BACKEND,
+            onnx_dir=settings.EMBEDDING_ONNX_DIR,
+            quantized=settings.EMBEDDING_ONNX_QUANTIZED,
+        )
+
+    @property
+    def model_id(self) -> str:
+        """模型和后端的标识，不同后端的向量略有差异，缓存时需要区分"""
+        return f"{self.model_name}:{self.backend.name}"
+
     def encode(self, texts: List[str], batch_size: int = 32):
         """
         将文本列表转换为向量
-        
+
         Args:
             texts: 文本列表
             batch_size: 批处理大小
-        
+
         Returns:
             np.ndarray: 向量数组，形状为 (len(texts), embedding_dim)
         """
-        if not SENTENCE_TRANSFORMERS_AVAILABLE:
-            raise ImportError("sentence-transformers is not available")
-        
         if not texts:
             return np.array([])
-        
-        if self.model is None:
-            raise RuntimeError("Embedding模型未加载")
-        
-        embeddings = self.model.encode(
-            texts,
-            batch_size=batch_size,
-            show_progress_bar=True,
-            convert_to_numpy=True
-        )
-        
-        return embeddings
-    
+
+        return self.backend.encode(texts, batch_size=batch_size)
+
     def encode_single(self, text: str):
         """
         将单个文本转换为向量
-        
+
         Args:
             text: 文本字符串
-        
+
         Returns:
             np.ndarray: 向量，形状为 (embedding_dim,)
         """
         return self.encode([text])[0]
-    
+
     @property
     def embedding_dim(self) -> int:
         """获取向量维度"""
-        if self.model is None:
-            return 384  # all-MiniLM-L6-v2的默认维度
-        return self.model.get_sentence_embedding_dimension()
-
+        return self.backend.dimension
@@ -0,0 +1,174 @@
+"""
+混合检索
+向量检索（语义相近）和BM25检索（型号、品牌等精确词）分别召回候选，
+用倒数排名融合（RRF）合并：score(d) = Σ 1 / (k + rank_i(d))，只依赖排名，不需要对两种分数做归一化。
+
+元数据过滤（文档类型、价格区间、分类）同时下推到两路检索中，在召回阶段生效，
+不需要多召回再在结果中过滤。
+"""
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.config.settings import settings
+
+
+SEARCH_MODES = ("hybrid", "vector", "lexical")
+
+_PRICE_RANGE = re.compile(r"(\d+(?:\.\d+)?)\s*(?:元|块)?\s*(?:到|至|-|~)\s*(\d+(?:\.\d+)?)\s*(?:元|块)")
+# 否定形式（不超过/不低于……）的方向与原词相反：先匹配否定形式，原词前面不能是“不”
+_PRICE_MAX = re.compile(
+    r"(?:不超过|不高于|不多于|不大于|不到|最多|(?<!不)(?:低于|少于|小于))\s*(\d+(?:\.\d+)?)"
+    r"|(\d+(?:\.\d+)?)\s*(?:元|块)?\s*(?:以下|以内|之内)")
+_PRICE_MIN = re.compile(
+    r"(?:不低于|不少于|不小于|至少|最少|(?<!不)(?:高于|超过|大于|多于))\s*(\d+(?:\.\d+)?)"
+    r"|(\d+(?:\.\d+)?)\s*(?:元|块)?\s*以上")
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    倒数排名融合
+
+    Args:
+        rankings: 每路检索按相关度排列的文档ID
+        k: 平滑常数，越大排名靠后的结果权重越接近靠前的结果
+
+    Returns:
+        List[Tuple[str, float]]: (文档ID, 融合分数)，按分数从高到低
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def build_where(
+        doc_type: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        category: Optional[str] = None) -> Optional[Dict]:
+    """构建ChromaDB格式的过滤条件（多个条件用 $and 组合）"""
+    conditions = []
+    if doc_type:
+        conditions.append({"type": doc_type})
+    if min_price is not None:
+        conditions.append({"price": {"$gte": min_price}})
+    if max_price is not None:
+        conditions.append({"price": {"$lte": max_price}})
+    if category:
+        conditions.append({"category": category})
+
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def parse_query_filters(query: str, categories: Sequence[str] = ()) -> Dict:
+    """
+    从用户查询中提取价格区间和分类
+
+    Args:
+        query: 例如 "3000元以下的降噪耳机"、"1000到2000元的跑鞋"
+        categories: 已知的分类名称，查询中出现时作为分类过滤（取最长的匹配）
+
+    Returns:
+        Dict: build_where 的参数（min_price / max_price / category）
+    """
+    filters = {}
+    price_range = _PRICE_RANGE.search(query)
+    if price_range:
+        low, high = sorted(float(value) for value in price_range.groups())
+        filters["min_price"], filters["max_price"] = low, high
+    else:
+        price_max = _PRICE_MAX.search(query)
+        if price_max:
+            filters["max_price"] = float(price_max.group(1) or price_max.group(2))
+        price_min = _PRICE_MIN.search(query)
+        if price_min:
+            filters["min_price"] = float(price_min.group(1) or price_min.group(2))
+
+    matched = [name for name in categories if len(name) >= 2 and name in query]
+    if matched:
+        filters["category"] = max(matched, key=len)
+    return filters
+
+
+class HybridRetriever:
+    """
+    在 VectorStoreService 的向量索引和BM25索引上做混合检索
+
+    同步执行（编码之外还有Chroma查询和BM25打分），在RAG线程池中调用
+    """
+
+    def __init__(self, vector_store, rrf_k: int = 60, candidates: int = 20):
+        self.vector_store = vector_store
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+
+    def categories(self) -> List[str]:
+        self.vector_store.ensure_lexical_index()
+        return self.vector_store.lexical_index.facet_values("category")
+
+    def search(
+            self,
+            query: str,
+            n_results: int = 5,
+            where: Optional[Dict] = None,
+            query_embedding=None,
+            mode: str = "hybrid") -> List[Dict]:
+        """
+        检索
+
+        Args:
+            query: 查询文本
+            n_results: 返回结果数量
+            where: 过滤条件（ChromaDB格式，见 build_where），同时作用于两路检索
+            query_embedding: 已计算好的查询向量
+            mode: hybrid / vector / lexical
+
+        Returns:
+            List[Dict]: 与 VectorStoreService.search 相同的结构，另有 score（融合分数）、
+                vector_rank、lexical_rank（未被该路召回时为None）
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"mode must be one of {SEARCH_MODES}, got {mode!r}")
+
+        candidates = max(self.candidates, n_results)
+        vector_results = []
+        if mode != "lexical":
+            vector_results = self.vector_store.search(
+                query, n_results=candidates, filter_dict=where, query_embedding=query_embedding)
+        lexical_results = []
+        if mode != "vector":
+            lexical_results = self.vector_store.lexical_search(query, n_results=candidates, filter_dict=where)
+
+        vector_ids = [result["id"] for result in vector_results]
+        lexical_ids = [result["id"] for result in lexical_results]
+        fused = reciprocal_rank_fusion([ids for ids in (vector_ids, lexical_ids) if ids], k=self.rrf_k)[:n_results]
+
+        # 只被BM25召回的文档需要从集合中读取原文
+        documents = {result["id"]: result for result in vector_results}
+        documents.update(self.vector_store.get_documents([doc_id for doc_id, _ in fused if doc_id not in documents]))
+
+        vector_rank = {doc_id: rank for rank, doc_id in enumerate(vector_ids, start=1)}
+        lexical_rank = {doc_id: rank for rank, doc_id in enumerate(lexical_ids, start=1)}
+        results = []
+        for doc_id, score in fused:
+            document = documents.get(doc_id)
+            if document is None:
+                # 已从集合中删除、BM25索引尚未重新加载
+                continue
+            results.append({
+                "id": doc_id,
+                "text": document["text"],
+                "metadata": document["metadata"],
+                "distance": document.get("distance"),
+                "score": score,
+                "vector_rank": vector_rank.get(doc_id),
+                "lexical_rank": lexical_rank.get(doc_id),
+            })
+        return results
+
+
+def create_retriever(vector_store) -> HybridRetriever:
+    return HybridRetriever(vector_store, rrf_k=settings.RAG_RRF_K, candidates=settings.RAG_HYBRID_CANDIDATES)
@@ -0,0 +1,179 @@
+"""
+流式知识库构建
+面向大商品库的全量校对/构建流水线，峰值内存只与批大小有关，与商品和评价总数无关：
+1. 读取：服务端游标（REPEATABLE READ 只读事务，数据是同一快照）按ID顺序分批读取；
+2. 编码：与已有文档比较内容哈希，只对变化的文档编码（在有界的索引线程池中执行）；
+3. 写入：写入Chroma（线程中执行），与下一批的编码并行；
+每批写入后在Redis中记录检查点（已完成的最大ID），中断后再次执行会从检查点继续。
+最后分页扫描集合，删除数据库中已不存在或已下架的文档，并通知其他worker整体重新加载（见 knowledge_base_changes）。
+"""
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, List, Set
+
+from sqlalchemy import select, any_, literal, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from app.database.session import engine
+from app.database.redis_session import redis_connection
+from app.models.product import Product
+from app.models.review import Review
+from app.models.category import Category
+from app.services.knowledge_base_changes import publish_changes
+from app.services.knowledge_base_service import KnowledgeBaseService
+from app.services.rag_executor import indexing_executor
+
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_KEY = "kb:build:checkpoint"  # 哈希：product / review -> 已写入的最大ID
+
+# 整个构建读取同一快照：派生一个只读的可重复读引擎（共用连接池）
+streaming_engine = engine.execution_options(isolation_level="REPEATABLE READ", postgresql_readonly=True)
+
+_DONE = object()
+
+
+class KnowledgeBaseBuilder:
+    def __init__(self, vector_store, batch_size: int = 256, resume: bool = True):
+        self.vector_store = vector_store
+        self.batch_size = batch_size
+        self.resume = resume
+        self.stats = {"embedded": 0, "metadata_only": 0, "unchanged": 0, "deleted": 0}
+
+    @staticmethod
+    async def clear_checkpoint():
+        await redis_connection.delete(CHECKPOINT_KEY)
+
+    async def _stream(self, kind: str, after_id: int) -> AsyncIterator[List[Dict]]:
+        """按ID顺序分批产出知识文档"""
+        if kind == "product":
+            query = (
+                select(Product, Category)
+                .outerjoin(Category, Product.category_id == Category.id)
+                .where(Product.is_active == True, Product.id > after_id)
+                .order_by(Product.id)
+            )
+            build = KnowledgeBaseService.product_document
+        else:
+            query = (
+                select(Review, Product)
+                .join(Product, Review.product_id == Product.id)
+                .where(Review.parent_review_id.is_(None), Product.is_active == True, Review.id > after_id)
+                .order_by(Review.id)
+            )
+            build = KnowledgeBaseService.review_document
+
+        async with streaming_engine.connect() as conn:
+            async with conn.begin():
+                result = await conn.stream(query.execution_options(yield_per=self.batch_size))
+                async for rows in result.partitions(self.batch_size):
+                    yield [build(*row) for row in rows]
+
+    async def _read(self, kind: str, after_id: int, encode_queue: asyncio.Queue):
+        async for documents in self._stream(kind, after_id):
+            await encode_queue.put(documents)
+        await encode_queue.put(_DONE)
+
+    async def _encode(self, encode_queue: asyncio.Queue, write_queue: asyncio.Queue):
+        def diff_and_encode(documents):
+            to_embed, to_update, unchanged = self.vector_store.diff_documents(documents)
+            embeddings = None
+            if to_embed:
+                embeddings = self.vector_store.embedding_service.encode(
+                    [doc.get("text", "") for doc, _ in to_embed], batch_size=min(len(to_embed), 64))
+            return to_embed, embeddings, to_update, unchanged
+
+        while (documents := await encode_queue.get()) is not _DONE:
+            result = await indexing_executor.run(diff_and_encode, documents)
+            await write_queue.put((documents, result))
+        await write_queue.put(_DONE)
+
+    async def _write(self, kind: str, write_queue: asyncio.Queue):
+        while (item := await write_queue.get()) is not _DONE:
+            documents, (to_embed, embeddings, to_update, unchanged) = item
+            await asyncio.to_thread(self.vector_store.write_documents, to_embed, embeddings, to_update)
+            # 本批写入完成后才推进检查点
+            last_id = max(int(str(doc["id"]).partition(":")[2]) for doc in documents)
+            await redis_connection.hset(CHECKPOINT_KEY, kind, last_id)
+
+            self.stats["embedded"] += len(to_embed)
+            self.stats["metadata_only"] += len(to_update)
+            self.stats["unchanged"] += unchanged
+            logger.info(f"Knowledge base build: {kind} up to id {last_id}, {self.stats}")
+
+    async def _build_kind(self, kind: str, after_id: int):
+        # 队列长度为1：内存中最多同时存在读取、编码、写入和两个队列中的各一批
+        encode_queue = asyncio.Queue(maxsize=1)
+        write_queue = asyncio.Queue(maxsize=1)
+        tasks = [
+            asyncio.create_task(self._read(kind, after_id, encode_queue)),
+            asyncio.create_task(self._encode(encode_queue, write_queue)),
+            asyncio.create_task(self._write(kind, write_queue)),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    async def _existing_ids(self, kind: str, ids: List[int]) -> Set[int]:
+        if kind == "product":
+            query = select(Product.id).where(Product.id == any_(literal(ids, ARRAY(Integer))), Product.is_active == True)
+        else:
+            query = (
+                select(Review.id)
+                .join(Product, Review.product_id == Product.id)
+                .where(Review.id == any_(literal(ids, ARRAY(Integer))),
+                       Review.parent_review_id.is_(None), Product.is_active == True)
+            )
+        async with engine.connect() as conn:
+            return set((await conn.execute(query)).scalars().all())
+
+    async def delete_stale(self, page_size: int = 2000) -> int:
+        """分页扫描集合，删除数据库中已不存在/已下架的文档（包括旧版本的纯数字ID）"""
+        stale = []
+        offset = 0
+        while True:
+            page = await asyncio.to_thread(
+                lambda: self.vector_store.collection.get(include=[], limit=page_size, offset=offset)["ids"])
+            by_kind: Dict[str, Dict[int, str]] = {"product": {}, "review": {}}
+            for doc_id in page:
+                kind, _, object_id = doc_id.partition(":")
+                if kind in by_kind and object_id.isdigit():
+                    by_kind[kind][int(object_id)] = doc_id
+                else:
+                    stale.append(doc_id)
+            for kind, ids in by_kind.items():
+                if ids:
+                    existing = await self._existing_ids(kind, list(ids))
+                    stale.extend(doc_id for object_id, doc_id in ids.items() if object_id not in existing)
+            if len(page) < page_size:
+                break
+            offset += page_size
+
+        # 扫描结束后再删除，避免分页偏移错位
+        for i in range(0, len(stale), 500):
+            await asyncio.to_thread(self.vector_store.delete_documents, stale[i:i + 500])
+        return len(stale)
+
+    async def build(self) -> Dict:
+        """
+        执行一次完整的流式构建/校对
+
+        Returns:
+            Dict: {"embedded", "metadata_only", "unchanged", "deleted", "resumed_from"}
+        """
+        checkpoint = await redis_connection.hgetall(CHECKPOINT_KEY) if self.resume else {}
+        resumed_from = {kind: int(value) for kind, value in checkpoint.items()}
+        if resumed_from:
+            logger.info(f"Resuming knowledge base build from checkpoint {resumed_from}")
+
+        for kind in ("product", "review"):
+            await self._build_kind(kind, resumed_from.get(kind, 0))
+
+        self.stats["deleted"] = await self.delete_stale()
+        await self.clear_checkpoint()
+        await publish_changes(self.vector_store.instance_id, reload=True)
+        return {**self.stats, "resumed_from": resumed_from}
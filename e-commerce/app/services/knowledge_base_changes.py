@@ -0,0 +1,77 @@
+"""
+知识库变更通知
+Chroma PersistentClient 在每个进程中各自持有内存中的HNSW索引，BM25索引也只在各进程内存中：
+写入知识库的进程（增量索引、全量校对）把变更追加到Redis Stream（kb:changes），
+其他worker的 AgentRuntime 后台任务按顺序读取：重新打开Chroma客户端，按变更更新本进程的BM25索引。
+读取位置之后的变更已被裁剪（进程长时间没有读取）或全量校对之后，整体重新加载。
+"""
+import json
+from typing import Dict, Iterable, List, Tuple
+
+from app.database.redis_session import redis_connection
+
+
+KB_CHANGES_KEY = "kb:changes"
+KB_CHANGES_MAXLEN = 10000
+START_ID = "0-0"
+
+
+async def publish_changes(
+        origin: str,
+        upserted: Iterable[str] = (),
+        deleted: Iterable[str] = (),
+        deleted_products: Iterable[int] = (),
+        reload: bool = False):
+    """
+    记录一次知识库写入
+
+    Args:
+        origin: 写入进程的 VectorStoreService.instance_id（写入进程自己已经更新，读取时跳过）
+        upserted: 新增或更新的文档ID
+        deleted: 删除的文档ID
+        deleted_products: 删除了商品及其评价文档的商品ID
+        reload: 大批量写入（全量校对），读取方整体重新加载
+    """
+    await redis_connection.xadd(KB_CHANGES_KEY, {
+        "origin": origin,
+        "upserted": json.dumps(list(upserted)),
+        "deleted": json.dumps(list(deleted)),
+        "deleted_products": json.dumps(list(deleted_products)),
+        "reload": "1" if reload else "0",
+    }, maxlen=KB_CHANGES_MAXLEN, approximate=True)
+
+
+async def latest_change_id() -> str:
+    """当前最新的变更ID，从这里开始读取之后的变更"""
+    entries = await redis_connection.xrevrange(KB_CHANGES_KEY, count=1)
+    return entries[0][0] if entries else START_ID
+
+
+async def read_changes(after_id: str, count: int = 1000) -> Tuple[str, List[Dict], bool]:
+    """
+    读取 after_id 之后的变更
+
+    Returns:
+        (最后读取的变更ID, 变更列表, 之前的变更是否已被裁剪)
+    """
+    # 裁剪从最旧的变更开始：上次读取的变更还在，说明之后的变更都没有被裁剪
+    lagged = after_id != START_ID and not await redis_connection.xrange(KB_CHANGES_KEY, after_id, after_id)
+    changes = []
+    while True:
+        response = await redis_connection.xread({KB_CHANGES_KEY: after_id}, count=count)
+        entries = response[0][1] if response else []
+        for entry_id, fields in entries:
+            changes.append(_parse(fields))
+            after_id = entry_id
+        if len(entries) < count:
+            return after_id, changes, lagged
+
+
+def _parse(fields: Dict) -> Dict:
+    return {
+        "origin": fields.get("origin"),
+        "upserted": json.loads(fields.get("upserted") or "[]"),
+        "deleted": json.loads(fields.get("deleted") or "[]"),
+        "deleted_products": json.loads(fields.get("deleted_products") or "[]"),
+        "reload": fields.get("reload") == "1",
+    }
@@ -0,0 +1,178 @@
+"""
+知识库增量索引
+商品和评价的变化通过发件箱事件（product.* / review.* / order.placed）记录到Redis的待索引集合中，
+KnowledgeBaseIndexer 在后台批量取出，重新读取数据库中的最新数据：
+内容哈希变化时重新编码并 upsert，只有元数据变化时只更新元数据，
+商品下架或删除时删除商品及其评价文档，评价删除时删除评价文档。
+下单（库存）和评价（评分）只改变商品元数据，标记为 product-meta:{id}，只重新读取商品本身，不读取它的评价。
+写入后发布变更通知（knowledge_base_changes），其他worker据此更新各自的Chroma客户端和BM25索引。
+sync_all 用同样的规则做一次全量校对（流式分批，见 knowledge_base_builder），不再需要删除集合重建。
+"""
+import asyncio
+import logging
+from typing import Dict, Optional, Set
+
+from app.config.settings import settings
+from app.database.session import AsyncSessionLocal
+from app.database.redis_session import redis_connection
+from app.models.outbox_event import OutboxEvent
+from app.services.knowledge_base_builder import KnowledgeBaseBuilder
+from app.services.knowledge_base_changes import publish_changes
+from app.services.knowledge_base_service import KnowledgeBaseService, product_doc_id, review_doc_id
+from app.services.outbox_service import outbox_relay
+from app.services.rag_executor import indexing_executor
+from app.utils.distributed_lock import DistributedLock
+
+
+logger = logging.getLogger(__name__)
+
+KB_DIRTY_KEY = "kb:dirty"  # 待重新索引的文档ID集合（product:{id} / review:{id} / product-meta:{id}）
+
+
+def product_meta_member(product_id: int) -> str:
+    """只需更新商品元数据（库存、评分）的标记"""
+    return f"product-meta:{product_id}"
+
+
+@outbox_relay.register(
+    "product.created", "product.updated", "product.deleted", "order.placed",
+    "review.created", "review.updated", "review.deleted")
+async def mark_knowledge_base_dirty(outbox_event: OutboxEvent):
+    payload = outbox_event.payload
+    if outbox_event.aggregate_type == "review":
+        # 评价变化同时改变商品的平均评分
+        members = [review_doc_id(review_id) for review_id in payload.get("review_ids") or [payload["review_id"]]]
+        if payload.get("product_id"):
+            members.append(product_meta_member(payload["product_id"]))
+    elif outbox_event.event_type == "order.placed":
+        # 下单只改变库存
+        members = [product_meta_member(product_id) for product_id in payload.get("product_ids") or []]
+    else:
+        members = [product_doc_id(product_id) for product_id in
+                   payload.get("product_ids") or ([payload["product_id"]] if payload.get("product_id") else [])]
+    if members:
+        await redis_connection.sadd(KB_DIRTY_KEY, *members)
+
+
+async def index_documents(
+        vector_store, product_ids: Set[int], review_ids: Set[int], meta_product_ids: Set[int] = frozenset()) -> Dict:
+    """
+    按数据库中的最新数据重新索引指定的商品和评价
+
+    商品变化时同时校对它的评价（商品名称在评价文本中，商品重新上架时评价也需要恢复）；
+    meta_product_ids 中的商品只重新读取商品本身（文本不变时只更新元数据）
+    """
+    all_product_ids = product_ids | meta_product_ids
+    async with AsyncSessionLocal() as db:
+        products = await KnowledgeBaseService.extract_all_products(db, all_product_ids)
+        reviews = await KnowledgeBaseService.extract_all_reviews(db, review_ids=review_ids) if review_ids else []
+        if product_ids:
+            reviews += await KnowledgeBaseService.extract_all_reviews(db, product_ids=product_ids)
+
+    documents = {doc["id"]: doc for doc in products + reviews}
+
+    # 商品不存在或已下架：删除商品文档及其所有评价文档
+    inactive_products = all_product_ids - {doc["product_id"] for doc in products}
+    # 评价已删除或所属商品已下架
+    removed_reviews = [review_doc_id(review_id) for review_id in review_ids
+                       if review_doc_id(review_id) not in documents]
+
+    def apply():
+        if inactive_products:
+            vector_store.delete_documents(where={"product_id": {"$in": sorted(inactive_products)}})
+        if removed_reviews:
+            vector_store.delete_documents(ids=removed_reviews)
+        return vector_store.upsert_documents(list(documents.values()))
+
+    stats = await indexing_executor.run(apply)
+    await publish_changes(
+        vector_store.instance_id, upserted=list(documents), deleted=removed_reviews,
+        deleted_products=sorted(inactive_products))
+    stats["deleted_products"] = len(inactive_products)
+    stats["deleted_reviews"] = len(removed_reviews)
+    return stats
+
+
+async def sync_all(vector_store, resume: bool = False) -> Dict:
+    """
+    全量校对：写入新增/变化的文档，删除数据库中已不存在（或已下架）的文档
+
+    由 KnowledgeBaseBuilder 按批流式完成，resume 为 True 时从上次中断的检查点继续
+    """
+    builder = KnowledgeBaseBuilder(vector_store, batch_size=settings.KB_BUILD_BATCH_SIZE, resume=resume)
+    return await builder.build()
+
+
+class KnowledgeBaseIndexer:
+    """后台定期消费待索引集合，增量更新向量数据库"""
+
+    def __init__(self, interval: float = 5.0, batch_size: int = 200):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def index_once(self) -> int:
+        """
+        索引一批变化的文档
+
+        Returns:
+            int: 本批处理的文档ID数量
+        """
+        from app.agent.runtime import agent_runtime
+
+        # 向量数据库和模型在本进程加载完成后才能索引，否则留给下一轮
+        vector_store = agent_runtime.vector_store
+        if vector_store is None:
+            return 0
+
+        # Chroma 持久化目录由多个worker共享，同一时间只允许一个进程写入
+        lock = DistributedLock("kb:indexer", timeout=300, retry_times=1)
+        if not await lock.acquire():
+            return 0
+
+        try:
+            members = await redis_connection.spop(KB_DIRTY_KEY, self.batch_size)
+            if not members:
+                return 0
+
+            ids = {"product": set(), "review": set(), "product-meta": set()}
+            for member in members:
+                kind, _, object_id = member.partition(":")
+                ids[kind].add(int(object_id))
+
+            try:
+                stats = await index_documents(
+                    vector_store, ids["product"], ids["review"], ids["product-meta"] - ids["product"])
+            except Exception:
+                # 索引失败时重新标记，下一轮再试
+                await redis_connection.sadd(KB_DIRTY_KEY, *members)
+                raise
+            logger.info(f"Knowledge base indexed {len(members)} changes: {stats}")
+            return len(members)
+        finally:
+            await lock.release()
+
+    async def run_forever(self):
+        while not self._stopping:
+            try:
+                while await self.index_once() >= self.batch_size:
+                    pass
+            except Exception as e:
+                logger.error(f"Knowledge base indexer error: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self.run_forever())
+        return self._task
+
+    async def stop(self):
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+knowledge_base_indexer = KnowledgeBaseIndexer(interval=settings.KB_INDEX_INTERVAL)
@@ -1,136 +1,168 @@
 """
 知识库服务
 用于提取和准备商品、评论数据，构建RAG知识库
+
+每个知识文档的ID为 product:{id} 或 review:{id}，content_hash 是用于Embedding的文本的哈希：
+文本没有变化时只更新元数据（库存、评分等），不重新计算向量。
+库存、浏览量、点赞数等频繁变化的字段只放在元数据中，不放进Embedding文本。
 """
+import hashlib
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from typing import List, Dict
+from typing import Iterable, List, Dict, Optional
 from app.models.product import Product
 from app.models.review import Review
 from app.models.category import Category
 
 
+def product_doc_id(product_id: int) -> str:
+    return f"product:{product_id}"
+
+
+def review_doc_id(review_id: int) -> str:
+    return f"review:{review_id}"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
 class KnowledgeBaseService:
     """
     知识库服务
     负责从数据库提取商品和评论数据，构建知识文档
     """
-    
+
     @staticmethod
-    async def extract_all_products(db: AsyncSession) -> List[Dict]:
+    def product_document(product: Product, category: Optional[Category]) -> Dict:
+        """构建商品知识文档"""
+        category_name = category.name if category else "未分类"
+        category_level = category.level if category else 0
+        # 构建完整的文本内容用于Embedding
+        text = f"""
+商品名称：{product.name}
+商品描述：{product.description or '无描述'}
+价格：{product.price}元
+分类：{category_name}
+""".strip()
+
+        return {
+            "id": product_doc_id(product.id),
+            "type": "product",
+            "product_id": product.id,
+            "name": product.name,
+            "product_name": product.name,
+            "description": product.description or "",
+            "price": product.price,
+            "stock": product.stock,
+            "rating": float(product.average_rating or 0),
+            "category": category_name,
+            "category_level": category_level,
+            "created_at": str(product.created_at),
+            "text": text,
+            "content_hash": content_hash(text),
+        }
+
+    @staticmethod
+    def review_document(review: Review, product: Product) -> Dict:
+        """构建评论知识文档"""
+        text = f"""
+商品：{product.name}
+评分：{review.rating}星
+评论内容：{review.content}
+""".strip()
+
+        return {
+            "id": review_doc_id(review.id),
+            "type": "review",
+            "product_id": review.product_id,
+            "product_name": product.name,
+            "content": review.content,
+            "rating": review.rating,
+            "likes_count": review.likes_count,
+            "dislikes_count": review.dislikes_count,
+            "created_at": str(review.created_at),
+            "text": text,
+            "content_hash": content_hash(text),
+        }
+
+    @staticmethod
+    async def extract_all_products(db: AsyncSession, product_ids: Optional[Iterable[int]] = None) -> List[Dict]:
         """
-        提取所有商品信息
-        
+        提取上架商品信息
+
+        Args:
+            product_ids: 只提取这些商品，默认提取全部
+
         Returns:
             List[Dict]: 商品信息列表，每个商品包含完整信息
         """
         # 使用category_id关联Category表
-        query = await db.execute(
+        query = (
             select(Product, Category)
             .outerjoin(Category, Product.category_id == Category.id)
             .where(Product.is_active == True)
         )
-        results = query.all()
-        
-        products_data = []
-        for product, category in results:
-            # 构建商品知识文档
-            category_name = category.name if category else "未分类"
-            category_level = category.level if category else 0
-            
-            product_doc = {
-                "id": product.id,
-                "type": "product",
-                "name": product.name,
-                "description": product.description or "",
-                "price": product.price,
-                "stock": product.stock,
-                "category": category_name,
-                "category_level": category_level,
-                "view_count": product.view_count,
-                "created_at": str(product.created_at),
-                # 构建完整的文本内容用于Embedding
-                "text": f"""
-商品名称：{product.name}
-商品描述：{product.description or '无描述'}
-价格：{product.price}元
-分类：{category_name}
-库存：{product.stock}
-浏览量：{product.view_count}
-""".strip()
-            }
-            products_data.append(product_doc)
-        
-        return products_data
-    
+        if product_ids is not None:
+            query = query.where(Product.id.in_(list(product_ids)))
+        results = (await db.execute(query)).all()
+
+        return [KnowledgeBaseService.product_document(product, category) for product, category in results]
+
     @staticmethod
-    async def extract_all_reviews(db: AsyncSession) -> List[Dict]:
+    async def extract_all_reviews(
+            db: AsyncSession,
+            review_ids: Optional[Iterable[int]] = None,
+            product_ids: Optional[Iterable[int]] = None) -> List[Dict]:
         """
-        提取所有评论信息
-        
+        提取上架商品的主评论信息
+
+        Args:
+            review_ids: 只提取这些评论
+            product_ids: 只提取这些商品的评论
+
         Returns:
             List[Dict]: 评论信息列表
         """
         # 只提取主评论（parent_review_id为NULL）
-        query = await db.execute(
+        query = (
             select(Review, Product)
             .join(Product, Review.product_id == Product.id)
-            .where(Review.parent_review_id.is_(None))
+            .where(Review.parent_review_id.is_(None), Product.is_active == True)
         )
-        results = query.all()
-        
-        reviews_data = []
-        for review, product in results:
-            # 构建评论知识文档
-            review_doc = {
-                "id": review.id,
-                "type": "review",
-                "product_id": review.product_id,
-                "product_name": product.name,
-                "content": review.content,
-                "rating": review.rating,
-                "likes_count": review.likes_count,
-                "dislikes_count": review.dislikes_count,
-                "created_at": str(review.created_at),
-                # 构建完整的文本内容用于Embedding
-                "text": f"""
-商品：{product.name}
-评分：{review.rating}星
-评论内容：{review.content}
-点赞数：{review.likes_count}
-点踩数：{review.dislikes_count}
-""".strip()
-            }
-            reviews_data.append(review_doc)
-        
-        return reviews_data
-    
+        if review_ids is not None:
+            query = query.where(Review.id.in_(list(review_ids)))
+        if product_ids is not None:
+            query = query.where(Review.product_id.in_(list(product_ids)))
+        results = (await db.execute(query)).all()
+
+        return [KnowledgeBaseService.review_document(review, product) for review, product in results]
+
     @staticmethod
     async def build_knowledge_documents(db: AsyncSession) -> List[Dict]:
         """
         构建完整的知识文档列表
-        
+
         Returns:
             List[Dict]: 包含商品和评论的知识文档列表
         """
         products = await KnowledgeBaseService.extract_all_products(db)
         reviews = await KnowledgeBaseService.extract_all_reviews(db)
-        
+
         # 组合商品和评论
         documents = products + reviews
-        
+
         return documents
-    
+
     @staticmethod
     def format_document_for_embedding(doc: Dict) -> str:
         """
         格式化文档为适合Embedding的文本
-        
+
         Args:
             doc: 知识文档字典
-        
+
         Returns:
             str: 格式化后的文本
         """
         return doc.get("text", "")
-
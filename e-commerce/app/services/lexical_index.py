@@ -0,0 +1,219 @@
+"""
+BM25 词法索引
+向量检索对型号、品牌这类精确词不敏感（“iPhone 15 Pro”和“iPhone 14 Pro”的向量几乎相同），
+这里对同一批知识文档建立内存中的BM25倒排索引，与向量检索结果融合（见 hybrid_retriever）。
+
+分词不依赖分词库：英文/数字按连续字母数字切分（保留 wh-1000xm5 这类型号，同时拆出各部分），
+中文按单字和相邻双字切分。
+元数据过滤使用与ChromaDB相同的 where 语法，过滤条件在打分前生效。
+"""
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.+\-][a-z0-9]+)*|[\u4e00-\u9fff]+")
+_SEPARATORS = re.compile(r"[.+\-]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    切分为检索词
+
+    Returns:
+        List[str]: 例如 "Sony WH-1000XM5 降噪耳机" ->
+            ["sony", "wh-1000xm5", "wh", "1000xm5", "降", "噪", "耳", "机", "降噪", "噪耳", "耳机"]
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.findall(text.lower()):
+        if "\u4e00" <= match[0] <= "\u9fff":
+            tokens.extend(match)
+            tokens.extend(match[i:i + 2] for i in range(len(match) - 1))
+        else:
+            tokens.append(match)
+            parts = _SEPARATORS.split(match)
+            if len(parts) > 1:
+                tokens.extend(part for part in parts if part)
+    return tokens
+
+
+def _compare(value, operator: str, expected) -> bool:
+    if operator == "$eq":
+        return value == expected
+    if operator == "$ne":
+        return value != expected
+    if operator == "$in":
+        return value in expected
+    if operator == "$nin":
+        return value not in expected
+    if value is None:
+        return False
+    if operator == "$gt":
+        return value > expected
+    if operator == "$gte":
+        return value >= expected
+    if operator == "$lt":
+        return value < expected
+    if operator == "$lte":
+        return value <= expected
+    raise ValueError(f"Unsupported where operator: {operator}")
+
+
+def matches_where(metadata: Dict, where: Optional[Dict]) -> bool:
+    """
+    判断元数据是否满足ChromaDB格式的过滤条件
+
+    支持 {"field": value}、{"field": {"$gte": value, ...}}、{"$and": [...]}、{"$or": [...]}
+    """
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, item) for item in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, item) for item in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            if not all(_compare(value, operator, expected) for operator, expected in condition.items()):
+                return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+class BM25Index:
+    """
+    内存倒排索引（线程安全）
+    只保存词频和元数据，不保存原文
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, facets: Iterable[str] = ("category",)):
+        self.k1 = k1
+        self.b = b
+        self.facets = tuple(facets)
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._metadata: Dict[str, Dict] = {}
+        self._terms: Dict[str, Tuple[str, ...]] = {}
+        self._total_length = 0
+        self._facet_counts: Dict[str, Counter] = {facet: Counter() for facet in self.facets}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def _remove(self, doc_id: str):
+        terms = self._terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id)
+        self._set_metadata(doc_id, None)
+
+    def _set_metadata(self, doc_id: str, metadata: Optional[Dict]):
+        old = self._metadata.pop(doc_id, None)
+        for facet in self.facets:
+            if old is not None and old.get(facet):
+                self._facet_counts[facet][old[facet]] -= 1
+                if self._facet_counts[facet][old[facet]] <= 0:
+                    del self._facet_counts[facet][old[facet]]
+            if metadata is not None and metadata.get(facet):
+                self._facet_counts[facet][metadata[facet]] += 1
+        if metadata is not None:
+            self._metadata[doc_id] = metadata
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict]):
+        """添加或替换文档"""
+        with self._lock:
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                self._remove(doc_id)
+                counts = Counter(tokenize(text or ""))
+                for term, count in counts.items():
+                    self._postings.setdefault(term, {})[doc_id] = count
+                self._terms[doc_id] = tuple(counts)
+                self._lengths[doc_id] = sum(counts.values())
+                self._total_length += self._lengths[doc_id]
+                self._set_metadata(doc_id, metadata or {})
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict]):
+        """只更新元数据（文本未变化）"""
+        with self._lock:
+            for doc_id, metadata in zip(ids, metadatas):
+                if doc_id in self._lengths:
+                    self._set_metadata(doc_id, metadata)
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+
+    def remove_where(self, where: Dict) -> List[str]:
+        """删除满足过滤条件的文档，返回被删除的ID"""
+        with self._lock:
+            ids = [doc_id for doc_id, metadata in self._metadata.items() if matches_where(metadata, where)]
+            for doc_id in ids:
+                self._remove(doc_id)
+            return ids
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._lengths.clear()
+            self._metadata.clear()
+            self._terms.clear()
+            self._total_length = 0
+            self._facet_counts = {facet: Counter() for facet in self.facets}
+
+    def facet_values(self, facet: str) -> List[str]:
+        """某个元数据字段的所有取值（例如所有分类名称）"""
+        with self._lock:
+            return list(self._facet_counts.get(facet, ()))
+
+    def get_metadata(self, doc_id: str) -> Optional[Dict]:
+        return self._metadata.get(doc_id)
+
+    def metadatas(self) -> List[Tuple[str, Dict]]:
+        """所有文档的 (ID, 元数据)"""
+        with self._lock:
+            return list(self._metadata.items())
+
+    def search(self, query: str, n_results: int = 10, where: Optional[Dict] = None) -> List[Tuple[str, float]]:
+        """
+        BM25检索
+
+        Returns:
+            List[Tuple[str, float]]: (文档ID, 分数)，按分数从高到低
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            total = len(self._lengths)
+            if not total or not terms:
+                return []
+            average_length = self._total_length / total
+
+            scores: Dict[str, float] = {}
+            allowed: Dict[str, bool] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    # 过滤条件在打分前判断，每个文档只判断一次
+                    if doc_id not in allowed:
+                        allowed[doc_id] = matches_where(self._metadata[doc_id], where)
+                    if not allowed[doc_id]:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        return heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
@@ -0,0 +1,171 @@
+"""
+大模型HTTP客户端
+每个worker进程共享一个连接池化的 httpx.AsyncClient（lifespan中创建、关闭），
+不再每次调用都新建客户端、重新建立TCP和TLS连接：
+- HTTP/2（需要安装 h2）时多个请求复用同一条连接，否则使用HTTP/1.1 keep-alive连接池；
+- 连接、读取（流式响应中两个数据块之间）、写入和等待连接分别设置超时；
+- 同时进行的请求数由 max_concurrency 限制（HTTP/2下连接池大小限制不了并发），
+  等待超过 queue_timeout 时直接失败，调用方降级为不使用大模型的回复。
+
+stream 按 OpenAI 兼容的SSE格式（data: {...} / data: [DONE]）逐段返回生成的文本。
+"""
+import asyncio
+import importlib.util
+import json
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from app.config.settings import settings
+
+
+H2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class LLMError(Exception):
+    """大模型调用失败（未配置、排队超时、连接/超时错误或非200响应）"""
+
+
+class LLMClient:
+    def __init__(
+            self,
+            api_base: str,
+            api_key: str,
+            model: str,
+            max_concurrency: int = 16,
+            connect_timeout: float = 5.0,
+            read_timeout: float = 30.0,
+            queue_timeout: float = 5.0,
+            http2: bool = True,
+            transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.api_base = api_base.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.http2 = http2 and H2_AVAILABLE
+        self.timeout = httpx.Timeout(connect=connect_timeout, read=read_timeout, write=10.0, pool=queue_timeout)
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.api_key)
+
+    def start(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.api_base,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                http2=self.http2,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                    keepalive_expiry=60),
+                transport=self._transport,
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # 脚本等没有经过lifespan的场景下第一次调用时创建
+        return self.start()
+
+    async def _acquire(self):
+        if not self.enabled:
+            raise LLMError("LLM API key is not configured")
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise LLMError(f"Too many concurrent LLM requests (limit {self.max_concurrency})")
+        self._in_flight += 1
+        self.requests += 1
+
+    def _release(self):
+        self._in_flight -= 1
+        self._semaphore.release()
+
+    def _payload(self, messages: List[Dict], stream: bool, **params) -> Dict:
+        return {"model": self.model, "messages": messages, "stream": stream, **params}
+
+    async def complete(self, messages: List[Dict], **params) -> str:
+        """
+        非流式调用，返回完整回复
+
+        Raises:
+            LLMError: 调用失败
+        """
+        await self._acquire()
+        try:
+            response = await self.client.post("/chat/completions", json=self._payload(messages, False, **params))
+            if response.status_code != 200:
+                raise LLMError(f"LLM API returned {response.status_code}")
+            return response.json()["choices"][0]["message"]["content"]
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            self.failures += 1
+            raise LLMError(f"LLM API request failed: {e!r}") from e
+        except LLMError:
+            self.failures += 1
+            raise
+        finally:
+            self._release()
+
+    async def stream(self, messages: List[Dict], **params) -> AsyncIterator[str]:
+        """
+        流式调用，逐段返回生成的文本
+
+        Raises:
+            LLMError: 调用失败（可能发生在已经返回部分文本之后）
+        """
+        await self._acquire()
+        try:
+            async with self.client.stream(
+                    "POST", "/chat/completions", json=self._payload(messages, True, **params)) as response:
+                if response.status_code != 200:
+                    raise LLMError(f"LLM API returned {response.status_code}")
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices") or [{}]
+                    content = choices[0].get("delta", {}).get("content")
+                    if content:
+                        yield content
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            self.failures += 1
+            raise LLMError(f"LLM API request failed: {e!r}") from e
+        except LLMError:
+            self.failures += 1
+            raise
+        finally:
+            self._release()
+
+    def stats(self) -> Dict:
+        return {"http2": self.http2, "max_concurrency": self.max_concurrency, "in_flight": self._in_flight,
+                "requests": self.requests, "failures": self.failures, "rejected": self.rejected}
+
+
+llm_client = LLMClient(
+    api_base=settings.DEEPSEEK_API_BASE,
+    api_key=settings.DEEPSEEK_API_KEY,
+    model=settings.DEEPSEEK_MODEL,
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    connect_timeout=settings.LLM_CONNECT_TIMEOUT,
+    read_timeout=settings.LLM_READ_TIMEOUT,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT,
+    http2=settings.LLM_HTTP2,
+)
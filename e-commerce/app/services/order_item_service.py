@@ -1,4 +1,4 @@
-from sqlalchemy import update, delete
+from sqlalchemy import update, delete, and_
 from fastapi import HTTPException, status
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -10,12 +10,17 @@ from app.models.product import Product
 from app.models.cart_item import CartItem
 from app.models.order_item import OrderItem
 from app.services.order_service import OrderService
-from app.services.email_service import EmailService
+from app.services.cart_item_service import CartService
+from app.services.outbox_service import OutboxService
+from app.services.pricing_service import PricingService
 from app.utils.distributed_lock import DistributedLock
 
 
 class OrderItemService:
   async def create_order_item(db: AsyncSession, current_user):
+    # Redis购物车模式下先把购物车写回数据库，下单以 cart_items 表为准
+    await CartService.persist_cart(db, current_user)
+
     result = await db.execute(
       select(CartItem, Product)
       .join(Product, CartItem.product_id == Product.id)
@@ -36,62 +41,55 @@ class OrderItemService:
         detail="Another order is being processed. Please try again later.")
     
     try:
-      # 重新查询购物车和商品，确保获取最新数据
+      # 重新查询购物车和商品，确保获取最新数据（覆盖会话中已加载的旧对象）
       result = await db.execute(
         select(CartItem, Product)
         .join(Product, CartItem.product_id == Product.id)
-        .filter(CartItem.user_id == current_user.id))
+        .filter(CartItem.user_id == current_user.id)
+        .execution_options(populate_existing=True))
       
       cart_items = result.all()
       
       if not cart_items:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cart is empty")
 
-      order = await OrderService.create_order(db, current_user)
-
-      # 为每个商品获取分布式锁，保护库存扣减
-      for cart_item, product in cart_items:
-        product_lock_key = f"product:stock:{product.id}"
-        product_lock = DistributedLock(product_lock_key, timeout=10, retry_times=3, retry_delay=0.1)
-        
-        if not await product_lock.acquire():
-          raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail=f"Product {product.id} is being processed. Please try again later.")
-        
-        try:
-          # 重新查询商品库存，确保获取最新数据
-          product_query = await db.execute(
-            select(Product).where(Product.id == product.id)
-          )
-          current_product = product_query.scalars().first()
-          
-          if not current_product:
+      # 订单金额与订单项价格使用与购物车展示相同的计价函数，
+      # 但价格取自刚查询到的商品行，而不是可能过期的商品快照缓存
+      pricing = PricingService.price_products(
+        {product.id: {"id": product.id, "name": product.name, "price": product.price,
+                      "stock": product.stock, "is_active": product.is_active}
+         for _, product in cart_items},
+        {cart_item.product_id: cart_item.quantity for cart_item, _ in cart_items})
+      order = await OrderService.create_order(db, current_user, pricing["total_amount"])
+
+      # 条件更新原子扣减库存：行锁持有到提交，并发下单在行锁上排队并读取已提交的最新库存，
+      # 不会基于旧库存覆盖其他订单的扣减；按商品ID顺序加锁，避免两个订单互相等待
+      for cart_item, product in sorted(cart_items, key=lambda row: row[1].id):
+        updated = await db.execute(
+          update(Product)
+          .where(Product.id == product.id, Product.stock >= cart_item.quantity)
+          .values(stock=Product.stock - cart_item.quantity,
+                  is_active=and_(Product.is_active, Product.stock - cart_item.quantity > 0))
+          .returning(Product.stock)
+          .execution_options(synchronize_session=False))
+
+        if updated.scalar_one_or_none() is None:
+          available = (await db.execute(select(Product.stock).where(Product.id == product.id))).scalar_one_or_none()
+          await db.rollback()
+          if available is None:
             raise HTTPException(
               status_code=status.HTTP_404_NOT_FOUND,
               detail=f"Product {product.id} not found")
-          
-          if current_product.stock < cart_item.quantity:
-            raise HTTPException(
-              status_code=status.HTTP_400_BAD_REQUEST,
-              detail=f"Insufficient stock for product {product.id}. Available: {current_product.stock}, Requested: {cart_item.quantity}")
-
-          new_stock = current_product.stock - cart_item.quantity
-          is_active = False if new_stock == 0 else current_product.is_active
-
-          await db.execute(
-            update(Product)
-            .where(Product.id == current_product.id)
-            .values(stock=new_stock, is_active=is_active))
-        finally:
-          await product_lock.release()
+          raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Insufficient stock for product {product.id}. Available: {available}, Requested: {cart_item.quantity}")
 
       order_items = [
         OrderItem(
           order_id=order.id,
           product_id=cart_item.product_id,
           quantity=cart_item.quantity,
-          price=cart_item.price)
+          price=pricing["lines"][cart_item.product_id]["line_total"])
 
         for cart_item, _ in cart_items
       ]
@@ -99,6 +97,14 @@ class OrderItemService:
 
       await db.execute(delete(CartItem).where(CartItem.user_id == current_user.id))
 
+      # 订单邮件通过发件箱异步投递，与订单数据一起提交
+      OutboxService.add_event(db, "order", order.id, "order.placed", {
+        "email": current_user.email,
+        "user_id": current_user.id,
+        "total_amount": order.total_amount,
+        "product_ids": [cart_item.product_id for cart_item, _ in cart_items]
+      })
+
       try:
         await db.commit()
       except SQLAlchemyError:
@@ -106,14 +112,8 @@ class OrderItemService:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="Database error")
 
-      # 使用Celery异步发送邮件
-      try:
-        from app.tasks.email_tasks import send_order_placement_email
-        send_order_placement_email.delay(current_user.email)
-      except Exception:
-        # 如果Celery不可用，同步发送（降级处理）
-        await EmailService.order_placement_message(current_user.email)
-      
+      await CartService.discard_cart_cache(current_user)
+
       # 返回订单ID和订单项列表，方便前端使用
       return {
         "order_id": order.id,
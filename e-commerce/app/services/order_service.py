@@ -1,6 +1,6 @@
-from datetime import datetime
+from typing import Dict, List, Optional
 
-from sqlalchemy import func, and_
+from sqlalchemy import func, and_, case, update
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
@@ -13,21 +13,32 @@ from app.models.cart_item import CartItem
 from app.schemas.order import OrderResponse, OrderItemResponse
 from app.utils.token import get_current_user
 from app.models import Order, User, OrderItem
+from app.services.outbox_service import OutboxService
+from app.services.pricing_service import PricingService
+from app.services.purchase_eligibility_service import PurchaseEligibilityService
+from app.services.order_state_machine import (OrderStateMachine, NOT_FOUND, NOT_AUTHORIZED,
+                                              ALREADY_IN_STATUS, INVALID_TRANSITION)
 
 
 class OrderService:
   @staticmethod
-  async def create_order(db, current_user):
-    total_amount = await db.execute(
-      select(func.sum(CartItem.quantity * Product.price)).join(Product, CartItem.product_id == Product.id)
-      .where(CartItem.user_id == current_user.id))
+  async def create_order(db, current_user, total_amount=None):
+    """
+    创建订单（不含订单项，不提交）
+    total_amount 未传入时按购物车当前价格计算，与购物车展示的金额使用同一计价函数；
+    订单与订单项、库存扣减、发件箱事件由调用方在同一事务中提交
+    """
+    if total_amount is None:
+      result = await db.execute(
+        select(CartItem.product_id, CartItem.quantity).where(CartItem.user_id == current_user.id))
+      pricing = await PricingService.price_lines(db, {row.product_id: row.quantity for row in result.all()})
+      total_amount = pricing["total_amount"]
 
-    total_amount = total_amount.scalar()
     order_data = {"total_amount": total_amount, "user_id": current_user.id}
     order = Order(**order_data)
 
     db.add(order)
-    await db.commit()
+    await db.flush()
     await db.refresh(order)
     return order
 
@@ -124,36 +135,105 @@ class OrderService:
     raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
   
   @staticmethod
-  async def cancel_order(
-          order_id: int,
+  async def transition_orders(
           db: AsyncSession,
-          current_user: User = Depends(get_current_user)):
-
-    query = await db.execute(select(Order).filter(Order.id == order_id))
-    order = query.scalars().first()
+          order_ids: List[int],
+          to_status: OrderStatus,
+          current_user: User,
+          tracking_numbers: Optional[Dict[int, str]] = None):
+    """
+    批量流转订单状态（发货 / 确认收货 / 取消 / 管理员修改）
+    权限条件直接下推到 UPDATE 语句中，一次提交完成所有订单。
+    商家可以发货，订单所有者可以确认收货和取消；管理员不受角色和订单归属限制，
+    可以执行状态机允许的任意流转（目标状态仍需满足 ORDER_TRANSITIONS）。
 
-    if not order:
-      raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
-    
-    if order.user_id != current_user.id and not current_user.role == Role.admin:
+    Returns:
+        Dict: {"succeeded": [订单ID], "failed": [{"order_id", "reason", "detail"}]}
+    """
+    to_status = OrderStatus(to_status)
+    is_admin = current_user.role == Role.admin
+    conditions = []
+    values = {}
+
+    if to_status == OrderStatus.shipped:
+      # 商家（vendor角色）或管理员可以发货
+      if current_user.role != Role.vendor and not is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only vendors can ship orders")
+      if tracking_numbers:
+        values["tracking_number"] = case(tracking_numbers, value=Order.id, else_=Order.tracking_number)
+    elif to_status in (OrderStatus.completed, OrderStatus.canceled):
+      # 订单所有者或管理员可以确认收货、取消订单
+      if not is_admin:
+        conditions.append(Order.user_id == current_user.id)
+    elif not is_admin:
       raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
 
-    if order.order_status == OrderStatus.canceled:
-      raise HTTPException(status_code=status.HTTP_409_CONFLICT,detail="Order already cancelled")
+    result = await OrderStateMachine.bulk_transition(db, order_ids, to_status, conditions, values)
+    succeeded = result["succeeded"]
+
+    if succeeded and to_status == OrderStatus.canceled:
+      # 一条语句归还所有被取消订单的库存
+      restock = (
+        select(OrderItem.product_id, func.sum(OrderItem.quantity).label("quantity"))
+        .where(OrderItem.order_id.in_(succeeded))
+        .group_by(OrderItem.product_id)
+        .subquery()
+      )
+      restocked = await db.execute(
+        update(Product)
+        .where(Product.id == restock.c.product_id)
+        .values(stock=Product.stock + restock.c.quantity, is_active=True)
+        .returning(Product.id)
+        .execution_options(synchronize_session=False)
+      )
+      # 库存和上架状态变化：失效商品缓存并更新知识库
+      for product_id in restocked.scalars().all():
+        OutboxService.add_event(db, "product", product_id, "product.updated", {"product_id": product_id})
 
-    order.order_status=OrderStatus.canceled
+    if succeeded and to_status in (OrderStatus.shipped, OrderStatus.completed):
+      # 已收到的商品写入评价资格索引
+      await PurchaseEligibilityService.record_received_orders(db, succeeded)
 
-    order_item = await db.execute(select(OrderItem).filter(OrderItem.order_id == order_id))
-    order_item = order_item.scalars().first()
-    product = await db.execute(select(Product).filter(Product.id == order_item.product_id))
-    product = product.scalars().first()
-    product.stock = product.stock + order_item.quantity
+    for order_id in succeeded:
+      payload = {"order_status": to_status.value}
+      if to_status == OrderStatus.shipped and tracking_numbers:
+        payload["tracking_number"] = tracking_numbers.get(order_id)
+      OutboxService.add_event(db, "order", order_id, f"order.{to_status.value}", payload)
 
     await db.commit()
-    await db.refresh(order)
-    await db.refresh(product)
+    return result
+
+  @staticmethod
+  async def _transition_single_order(
+          db: AsyncSession,
+          order_id: int,
+          to_status: OrderStatus,
+          current_user: User,
+          tracking_number: Optional[str] = None):
+    """单个订单的状态流转，失败时按原因抛出对应的HTTPException"""
+    tracking_numbers = {order_id: tracking_number} if tracking_number else None
+    result = await OrderService.transition_orders(db, [order_id], to_status, current_user, tracking_numbers)
+
+    if result["failed"]:
+      failure = result["failed"][0]
+      if failure["reason"] in (ALREADY_IN_STATUS, INVALID_TRANSITION):
+        # 状态不允许流转时与状态机使用同一套错误码和错误信息
+        OrderStateMachine.validate_transition(failure["from_status"], to_status)
+      status_codes = {
+        NOT_FOUND: status.HTTP_404_NOT_FOUND,
+        NOT_AUTHORIZED: status.HTTP_403_FORBIDDEN,
+      }
+      raise HTTPException(status_code=status_codes[failure["reason"]], detail=failure["detail"])
+
+  @staticmethod
+  async def cancel_order(
+          order_id: int,
+          db: AsyncSession,
+          current_user: User = Depends(get_current_user)):
+
+    await OrderService._transition_single_order(db, order_id, OrderStatus.canceled, current_user)
     return {"message":"Order canceled successfully"}
-  
+
   @staticmethod
   async def confirm_receipt(
           order_id: int,
@@ -163,41 +243,12 @@ class OrderService:
     用户确认收货接口
     将已发货的订单标记为已完成
     """
-    query = await db.execute(select(Order).filter(Order.id == order_id))
-    order = query.scalars().first()
-
-    if not order:
-      raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
-
-    # 只有订单所有者可以确认收货
-    if order.user_id != current_user.id:
-      raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only the order owner can confirm receipt")
-
-    # 只能对已发货的订单进行确认收货
-    if order.order_status != OrderStatus.shipped:
-      raise HTTPException(
-        status_code=status.HTTP_400_BAD_REQUEST,
-        detail=f"Cannot confirm receipt for order with status: {order.order_status}. Order must be shipped first."
-      )
-
-    # 检查订单是否已经是已完成状态
-    if order.order_status == OrderStatus.completed:
-      raise HTTPException(
-        status_code=status.HTTP_409_CONFLICT,
-        detail="Order has already been confirmed as received"
-      )
-
-    # 更新订单状态为已完成
-    order.order_status = OrderStatus.completed
-    order.updated_at = datetime.now()
-
-    await db.commit()
-    await db.refresh(order)
+    await OrderService._transition_single_order(db, order_id, OrderStatus.completed, current_user)
 
     return {
       "message": "Order confirmed as received successfully",
-      "order_id": order.id,
-      "order_status": order.order_status.value
+      "order_id": order_id,
+      "order_status": OrderStatus.completed.value
     }
 
   @staticmethod
@@ -210,58 +261,27 @@ class OrderService:
     商家发货接口
     将已支付的订单标记为已发货，并保存快递单号
     """
-    query = await db.execute(select(Order).filter(Order.id == order_id))
-    order = query.scalars().first()
-
-    if not order:
-      raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+    await OrderService._transition_single_order(
+      db, order_id, OrderStatus.shipped, current_vendor, tracking_number)
 
-    # 只有商家可以发货（vendor角色）
-    if not current_vendor.role == Role.vendor:
-      raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only vendors can ship orders")
-    
-    # 只能对已支付的订单进行发货
-    if order.order_status != OrderStatus.paid:
-      raise HTTPException(
-        status_code=status.HTTP_400_BAD_REQUEST, 
-        detail=f"Cannot ship order with status: {order.order_status}. Order must be paid first."
-      )
-    
-    # 更新订单状态为已发货，并保存快递单号
-    order.order_status = OrderStatus.shipped
-    order.tracking_number = tracking_number
-    order.updated_at = datetime.now()
-    
-    await db.commit()
-    await db.refresh(order)
-    
     return {
       "message": "Order shipped successfully",
-      "order_id": order.id,
-      "order_status": order.order_status.value,
-      "tracking_number": order.tracking_number
+      "order_id": order_id,
+      "order_status": OrderStatus.shipped.value,
+      "tracking_number": tracking_number
     }
 
   @staticmethod
   async def update_order_status(
           order_id: int,
-          updated_status: str,
+          updated_status: OrderStatus,
           db: AsyncSession,
           current_user: User = Depends(get_current_user)):
 
-    query = await db.execute(select(Order).filter(Order.id == order_id))
-    order = query.scalars().first()
-
-    if not order:
-      raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
-
     if not current_user.role == Role.admin:
       raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
-    
-    order.order_status = updated_status
-    order.updated_at = datetime.now()
-    await db.commit()
-    await db.refresh(order)
+
+    await OrderService._transition_single_order(db, order_id, OrderStatus(updated_status), current_user)
     return {"message":"Order status updated successfully"}
 
   @staticmethod
@@ -0,0 +1,128 @@
+"""
+订单状态机
+集中定义订单状态之间允许的流转，并提供单条语句完成的批量状态流转
+"""
+from typing import Dict, Iterable, List, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import update, select, any_, literal, Integer, and_, true
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.order import Order, OrderStatus
+
+
+# 允许的状态流转：当前状态 -> 可流转到的目标状态
+ORDER_TRANSITIONS: Dict[OrderStatus, frozenset] = {
+  OrderStatus.pending: frozenset({OrderStatus.paid, OrderStatus.canceled}),
+  OrderStatus.paid: frozenset({OrderStatus.shipped, OrderStatus.canceled}),
+  OrderStatus.shipped: frozenset({OrderStatus.completed}),
+  OrderStatus.completed: frozenset(),
+  OrderStatus.canceled: frozenset(),
+}
+
+# 批量流转失败原因
+NOT_FOUND = "not_found"
+NOT_AUTHORIZED = "not_authorized"
+ALREADY_IN_STATUS = "already_in_status"
+INVALID_TRANSITION = "invalid_transition"
+
+
+class OrderStateMachine:
+  @staticmethod
+  def can_transition(from_status, to_status) -> bool:
+    return OrderStatus(to_status) in ORDER_TRANSITIONS[OrderStatus(from_status)]
+
+  @staticmethod
+  def sources_for(to_status) -> List[OrderStatus]:
+    """返回可以流转到目标状态的所有来源状态"""
+    to_status = OrderStatus(to_status)
+    return [source for source, targets in ORDER_TRANSITIONS.items() if to_status in targets]
+
+  @staticmethod
+  def validate_transition(from_status, to_status):
+    """校验单个订单的状态流转，不合法时抛出HTTPException"""
+    from_status = OrderStatus(from_status)
+    to_status = OrderStatus(to_status)
+
+    if from_status == to_status:
+      raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=f"Order is already {to_status.value}")
+
+    if not OrderStateMachine.can_transition(from_status, to_status):
+      raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"Cannot change order status from {from_status.value} to {to_status.value}")
+
+  @staticmethod
+  async def bulk_transition(
+          db: AsyncSession,
+          order_ids: Iterable[int],
+          to_status,
+          conditions: Iterable = (),
+          values: Optional[Dict] = None) -> Dict:
+    """
+    批量流转订单状态（不提交）
+    使用一条 UPDATE ... WHERE id = ANY(:ids) AND order_status IN (:from) RETURNING id 完成，
+    未被更新的订单再用一次查询判断失败原因。
+
+    Args:
+        db: 数据库会话
+        order_ids: 订单ID列表
+        to_status: 目标状态
+        conditions: 额外的过滤条件（例如只允许操作自己的订单）
+        values: 需要同时更新的其他字段
+
+    Returns:
+        Dict: {"succeeded": [订单ID], "failed": [{"order_id", "reason", "detail"}]}，
+        因当前状态失败时 failed 中还包含 "from_status"
+    """
+    to_status = OrderStatus(to_status)
+    order_ids = list(dict.fromkeys(order_ids))  # 去重并保持顺序
+    if not order_ids:
+      return {"succeeded": [], "failed": []}
+
+    conditions = list(conditions)
+    from_statuses = OrderStateMachine.sources_for(to_status)
+    result = await db.execute(
+      update(Order)
+      .where(
+        Order.id == any_(literal(order_ids, ARRAY(Integer))),
+        Order.order_status.in_(from_statuses),
+        *conditions
+      )
+      .values(order_status=to_status, **(values or {}))
+      .returning(Order.id)
+      .execution_options(synchronize_session=False)
+    )
+    updated_ids = set(result.scalars().all())
+
+    succeeded = [order_id for order_id in order_ids if order_id in updated_ids]
+    failed_ids = [order_id for order_id in order_ids if order_id not in updated_ids]
+    failed = []
+
+    if failed_ids:
+      # 只为失败的订单查询一次当前状态，用于返回失败原因；
+      # 先按调用方的过滤条件判断权限，无权操作的订单不返回它的状态
+      rows = await db.execute(
+        select(Order.id, Order.order_status, and_(true(), *conditions).label("visible"))
+        .where(Order.id.in_(failed_ids)))
+      current_statuses = {row.id: (row.order_status, row.visible) for row in rows.all()}
+
+      for order_id in failed_ids:
+        current, visible = current_statuses.get(order_id, (None, False))
+        if current is None:
+          failed.append({"order_id": order_id, "reason": NOT_FOUND, "detail": "Order not found"})
+        elif not visible:
+          failed.append({"order_id": order_id, "reason": NOT_AUTHORIZED, "detail": "Not authorized"})
+        elif current == to_status:
+          failed.append({"order_id": order_id, "reason": ALREADY_IN_STATUS, "from_status": current,
+                         "detail": f"Order is already {to_status.value}"})
+        elif not OrderStateMachine.can_transition(current, to_status):
+          failed.append({"order_id": order_id, "reason": INVALID_TRANSITION, "from_status": current,
+                         "detail": f"Cannot change order status from {OrderStatus(current).value} to {to_status.value}"})
+        else:
+          failed.append({"order_id": order_id, "reason": NOT_AUTHORIZED, "detail": "Not authorized"})
+
+    return {"succeeded": succeeded, "failed": failed}
@@ -0,0 +1,357 @@
+"""
+事务性发件箱（Transactional Outbox）服务
+业务代码通过 OutboxService.add_event 把事件与业务数据放在同一次提交中写入，
+OutboxRelay 在后台批量读取事件并投递到 Celery / Redis pub/sub / 索引器，
+请求链路中不再包含任何消息代理的网络往返。
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import event, select, update, delete, and_, exists, func
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.settings import settings
+from app.database.session import AsyncSessionLocal
+from app.database.redis_session import redis_connection
+from app.models.outbox_event import OutboxEvent, OutboxStatus
+from app.utils.distributed_lock import DistributedLock
+from app.utils.cache_version import bump_cache_version
+
+
+logger = logging.getLogger(__name__)
+
+OutboxHandler = Callable[[OutboxEvent], Awaitable[None]]
+
+
+class OutboxService:
+  @staticmethod
+  def add_event(
+          db: AsyncSession,
+          aggregate_type: str,
+          aggregate_id,
+          event_type: str,
+          payload: Optional[Dict] = None) -> OutboxEvent:
+    """
+    在当前会话中登记一条待投递事件（不提交）。
+    调用方负责在业务修改完成后统一 commit，事件与业务数据一起落库。
+    """
+    outbox_event = OutboxEvent(
+      aggregate_type=aggregate_type,
+      aggregate_id=str(aggregate_id),
+      event_type=event_type,
+      payload=payload or {},
+      status=OutboxStatus.pending,
+      attempts=0)
+    db.add(outbox_event)
+    # 标记会话中有新事件，提交后唤醒中继进程
+    db.info["outbox_pending"] = True
+    return outbox_event
+
+
+class OutboxRelay:
+  """
+  发件箱中继
+  按ID顺序批量拉取待投递事件，同一聚合（aggregate_type + aggregate_id）内严格保序：
+  某个事件投递失败时，同一聚合后续的事件会等待它重试成功后再投递。
+  投递语义为“至少一次”，处理函数需要保证幂等。
+
+  每个事件的投递有超时限制（handler_timeout），一批事件只在中继锁的有效期内投递，
+  剩余时间不足时留到下一批，避免锁过期后另一个进程重复投递同一批事件。
+  已投递的事件保留 retention_hours 小时后由中继定期删除。
+  """
+
+  LOCK_TIMEOUT = 60  # 中继锁的有效期（秒）
+  PRUNE_INTERVAL = 3600  # 清理已投递事件的间隔（秒）
+  PRUNE_BATCH_SIZE = 5000
+
+  def __init__(
+          self,
+          batch_size: int = 100,
+          poll_interval: float = 1.0,
+          max_attempts: int = 10,
+          handler_timeout: float = 10.0,
+          retention_hours: int = 72):
+    self.batch_size = batch_size
+    self.poll_interval = poll_interval
+    self.max_attempts = max_attempts
+    self.handler_timeout = handler_timeout
+    self.retention_hours = retention_hours
+    self._last_pruned = 0.0
+    self.handlers: Dict[str, List[OutboxHandler]] = {}
+    self._wakeup = asyncio.Event()
+    self._task: Optional[asyncio.Task] = None
+    self._stopping = False
+
+  def register(self, *event_types: str):
+    """注册事件处理函数，event_type 为 "*" 时处理所有事件"""
+    def decorator(handler: OutboxHandler):
+      for event_type in event_types:
+        self.handlers.setdefault(event_type, []).append(handler)
+      return handler
+    return decorator
+
+  def notify(self):
+    """唤醒中继，立即处理新提交的事件，而不是等待下一次轮询"""
+    self._wakeup.set()
+
+  async def _fetch_batch(self, db: AsyncSession) -> List[OutboxEvent]:
+    # 如果同一聚合中存在更早的、仍在退避等待中的事件，则当前事件也不能投递，保证聚合内有序
+    earlier = aliased(OutboxEvent)
+    blocked_by_earlier = exists().where(
+      and_(
+        earlier.aggregate_type == OutboxEvent.aggregate_type,
+        earlier.aggregate_id == OutboxEvent.aggregate_id,
+        earlier.status == OutboxStatus.pending,
+        earlier.id < OutboxEvent.id,
+        earlier.available_at > func.now()
+      )
+    )
+    result = await db.execute(
+      select(OutboxEvent)
+      .where(
+        and_(
+          OutboxEvent.status == OutboxStatus.pending,
+          OutboxEvent.available_at <= func.now(),
+          ~blocked_by_earlier
+        )
+      )
+      .order_by(OutboxEvent.id)
+      .limit(self.batch_size)
+    )
+    return result.scalars().all()
+
+  async def _dispatch(self, outbox_event: OutboxEvent):
+    handlers = self.handlers.get(outbox_event.event_type, []) + self.handlers.get("*", [])
+    for handler in handlers:
+      await handler(outbox_event)
+
+  async def _dispatch_with_timeout(self, outbox_event: OutboxEvent):
+    try:
+      await asyncio.wait_for(self._dispatch(outbox_event), timeout=self.handler_timeout)
+    except asyncio.TimeoutError:
+      raise TimeoutError(f"Outbox handlers did not finish within {self.handler_timeout}s")
+
+  async def _mark_failed(self, db: AsyncSession, outbox_event: OutboxEvent, error: Exception):
+    attempts = outbox_event.attempts + 1
+    # 指数退避，最长5分钟
+    backoff = timedelta(seconds=min(2 ** attempts, 300))
+    new_status = OutboxStatus.failed if attempts >= self.max_attempts else OutboxStatus.pending
+
+    await db.execute(
+      update(OutboxEvent)
+      .where(OutboxEvent.id == outbox_event.id)
+      .values(
+        attempts=attempts,
+        status=new_status,
+        last_error=str(error)[:1000],
+        available_at=func.now() + backoff)
+    )
+
+    if new_status == OutboxStatus.failed:
+      logger.error(f"Outbox event {outbox_event.id} ({outbox_event.event_type}) failed permanently: {error}")
+    else:
+      logger.warning(f"Outbox event {outbox_event.id} ({outbox_event.event_type}) failed, retry #{attempts}: {error}")
+
+  async def drain_once(self) -> int:
+    """
+    投递一批事件
+
+    Returns:
+        int: 本批成功投递的事件数量
+    """
+    # 多个worker同时运行中继时，只允许一个进程投递，避免重复和乱序
+    lock = DistributedLock("outbox:relay", timeout=self.LOCK_TIMEOUT, retry_times=1)
+    if not await lock.acquire():
+      return 0
+
+    loop = asyncio.get_running_loop()
+    # 最后一个事件最多耗时 handler_timeout，再留出标记已投递并提交的时间
+    deadline = loop.time() + self.LOCK_TIMEOUT - self.handler_timeout - 5
+    try:
+      async with AsyncSessionLocal() as db:
+        events = await self._fetch_batch(db)
+        processed_ids = []
+        blocked_aggregates = set()
+
+        for outbox_event in events:
+          if loop.time() >= deadline:
+            logger.warning("Outbox relay lock is about to expire; deferring the rest of the batch")
+            break
+
+          aggregate_key = (outbox_event.aggregate_type, outbox_event.aggregate_id)
+          if aggregate_key in blocked_aggregates:
+            continue
+
+          try:
+            await self._dispatch_with_timeout(outbox_event)
+            processed_ids.append(outbox_event.id)
+          except Exception as e:
+            blocked_aggregates.add(aggregate_key)
+            await self._mark_failed(db, outbox_event, e)
+
+        if processed_ids:
+          await db.execute(
+            update(OutboxEvent)
+            .where(OutboxEvent.id.in_(processed_ids))
+            .values(status=OutboxStatus.processed, processed_at=datetime.now())
+          )
+        await db.commit()
+        return len(processed_ids)
+    finally:
+      await lock.release()
+
+  async def prune_processed(self) -> int:
+    """
+    分批删除超过保留时间的已投递事件（投递失败的事件保留，等待人工处理）
+
+    Returns:
+        int: 删除的事件数量
+    """
+    # 锁不释放，到期前其他worker不再重复清理
+    lock = DistributedLock("outbox:prune", timeout=self.PRUNE_INTERVAL, retry_times=1)
+    if not await lock.acquire():
+      return 0
+
+    cutoff = datetime.now() - timedelta(hours=self.retention_hours)
+    deleted = 0
+    while not self._stopping:
+      async with AsyncSessionLocal() as db:
+        expired_ids = (
+          select(OutboxEvent.id)
+          .where(
+            and_(
+              OutboxEvent.status == OutboxStatus.processed,
+              OutboxEvent.processed_at < cutoff
+            )
+          )
+          .order_by(OutboxEvent.id)
+          .limit(self.PRUNE_BATCH_SIZE)
+        )
+        result = await db.execute(delete(OutboxEvent).where(OutboxEvent.id.in_(expired_ids)))
+        await db.commit()
+      deleted += result.rowcount
+      if result.rowcount < self.PRUNE_BATCH_SIZE:
+        break
+
+    if deleted:
+      logger.info(f"Pruned {deleted} processed outbox events older than {self.retention_hours}h")
+    return deleted
+
+  async def _prune_if_due(self):
+    loop = asyncio.get_running_loop()
+    if loop.time() - self._last_pruned < self.PRUNE_INTERVAL:
+      return
+    self._last_pruned = loop.time()
+    try:
+      await self.prune_processed()
+    except Exception as e:
+      logger.error(f"Outbox prune error: {e}")
+
+  async def run_forever(self):
+    """持续投递，直到调用 stop()"""
+    while not self._stopping:
+      try:
+        drained = await self.drain_once()
+      except Exception as e:
+        logger.error(f"Outbox relay error: {e}")
+        drained = 0
+
+      await self._prune_if_due()
+
+      # 本批已满说明还有积压，立即继续
+      if drained >= self.batch_size:
+        continue
+
+      try:
+        await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+      except asyncio.TimeoutError:
+        pass
+      self._wakeup.clear()
+
+  def start(self):
+    """在当前事件循环中启动后台中继任务（在FastAPI lifespan中调用）"""
+    if self._task is None or self._task.done():
+      self._stopping = False
+      self._task = asyncio.create_task(self.run_forever())
+    return self._task
+
+  async def stop(self):
+    self._stopping = True
+    self.notify()
+    if self._task is not None:
+      try:
+        await asyncio.wait_for(self._task, timeout=self.poll_interval + 5)
+      except asyncio.TimeoutError:
+        self._task.cancel()
+      self._task = None
+
+
+outbox_relay = OutboxRelay(
+  batch_size=settings.OUTBOX_BATCH_SIZE,
+  poll_interval=settings.OUTBOX_POLL_INTERVAL,
+  max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+  handler_timeout=settings.OUTBOX_HANDLER_TIMEOUT,
+  retention_hours=settings.OUTBOX_RETENTION_HOURS)
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_relay_after_commit(session):
+  if session.info.pop("outbox_pending", False):
+    outbox_relay.notify()
+
+
+# --- 默认事件处理函数 ---
+
+# 消息代理不可用时 kombu 默认会一直重连，这里限制重试，使发布耗时不超过投递超时
+CELERY_PUBLISH_RETRY_POLICY = {"max_retries": 2, "interval_start": 0, "interval_step": 1, "interval_max": 2}
+
+
+async def _publish_task(task, *args):
+  await asyncio.to_thread(task.apply_async, args=args, retry=True, retry_policy=CELERY_PUBLISH_RETRY_POLICY)
+
+
+@outbox_relay.register("order.placed")
+async def send_order_placement_email(outbox_event: OutboxEvent):
+  from app.tasks.email_tasks import send_order_placement_email
+  await _publish_task(send_order_placement_email, outbox_event.payload["email"])
+
+
+@outbox_relay.register("payment.completed")
+async def send_payment_confirmation_email(outbox_event: OutboxEvent):
+  from app.tasks.email_tasks import send_payment_confirmation_email
+  await _publish_task(send_payment_confirmation_email, outbox_event.payload["email"])
+
+
+@outbox_relay.register("product.created", "product.updated", "product.deleted")
+async def invalidate_product_list_cache(outbox_event: OutboxEvent):
+  # 商品列表和搜索结果的缓存键包含过滤条件和版本号，递增版本号即可全部失效
+  from app.services.product_service import PRODUCT_LIST_CACHE
+  await bump_cache_version(PRODUCT_LIST_CACHE)
+
+
+@outbox_relay.register("product.updated", "product.deleted", "order.placed")
+async def invalidate_product_snapshots(outbox_event: OutboxEvent):
+  # 价格、库存或上下架状态变化后，清除购物车/下单使用的商品快照缓存
+  from app.services.product_cache_service import ProductCacheService
+  payload = outbox_event.payload
+  product_ids = payload.get("product_ids") or ([payload["product_id"]] if payload.get("product_id") else [])
+  await ProductCacheService.invalidate(product_ids)
+
+
+@outbox_relay.register("*")
+async def publish_to_redis(outbox_event: OutboxEvent):
+  # 所有事件都会发布到 outbox:{aggregate_type} 频道，供索引器等订阅方消费
+  await redis_connection.publish(
+    f"outbox:{outbox_event.aggregate_type}",
+    json.dumps({
+      "id": outbox_event.id,
+      "aggregate_type": outbox_event.aggregate_type,
+      "aggregate_id": outbox_event.aggregate_id,
+      "event_type": outbox_event.event_type,
+      "payload": outbox_event.payload,
+    }, ensure_ascii=False, default=str)
+  )
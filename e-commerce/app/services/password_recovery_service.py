@@ -7,7 +7,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.user import User
 from app.schemas.user import PasswordInitiate, ChangePassword, UserBase, SetNewPassword
 from app.services.email_service import EmailService
-from app.utils.hashing import verify_password, hash_password
+from app.utils.hashing import verify_password_async, hash_password_async
+from app.utils.refresh_token_store import RefreshTokenStore
 
 
 class InitPasswordRecovery:
@@ -47,7 +48,7 @@ class InitPasswordRecovery:
     if userinfo.new_password != userinfo.repeat_password:
       raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Passwords don't match")
 
-    new_hashed_password = hash_password(userinfo.new_password)
+    new_hashed_password = await hash_password_async(userinfo.new_password)
     existing_user_db.password = new_hashed_password
     existing_user_db.updated_at = datetime.datetime.now()
 
@@ -56,6 +57,8 @@ class InitPasswordRecovery:
     db.add(existing_user_db)
     await db.commit()
     await db.refresh(existing_user_db)
+    # 修改密码后此前签发的刷新令牌全部失效
+    await RefreshTokenStore.revoke_user(existing_user_db.id)
 
     await EmailService.change_password_message(userinfo.email)
 
@@ -72,16 +75,17 @@ class InitPasswordRecovery:
     if not existing_user_db:
       raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User not found")
 
-    if not verify_password(userinfo.password, existing_user_db.password):
+    if not await verify_password_async(userinfo.password, existing_user_db.password):
       raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Incorrect password")
 
-    new_hashed_password = hash_password(userinfo.new_password)
+    new_hashed_password = await hash_password_async(userinfo.new_password)
     existing_user_db.password = new_hashed_password
     existing_user_db.updated_at = datetime.datetime.now()
 
     db.add(existing_user_db)
     await db.commit()
     await db.refresh(existing_user_db)
+    await RefreshTokenStore.revoke_user(existing_user_db.id)
     await EmailService.change_password_message(current_user.email)
 
     return {"message": "Password recovery successful"}
\ No newline at end of file
@@ -8,7 +8,7 @@ from app.models.payment import Payment
 from app.models.user import User
 from app.schemas.order import OrderStatus
 from app.schemas.payment import PaymentCreate, PaymentStatus
-from app.services.email_service import EmailService
+from app.services.outbox_service import OutboxService
 
 
 class PaymentServiceMock:
@@ -106,22 +106,19 @@ class PaymentServiceMock:
 
     db.add(payment)
     db.add(order)
+
+    # 支付成功邮件通过发件箱异步投递，与支付状态一起提交
+    if user:
+      OutboxService.add_event(db, "order", order.id, "payment.completed", {
+        "email": user.email,
+        "user_id": user.id,
+        "payment_id": payment.id
+      })
+
     await db.commit()
     await db.refresh(payment)
     await db.refresh(order)
 
-    # 使用Celery异步发送支付成功邮件（可选）
-    if user:
-      try:
-        from app.tasks.email_tasks import send_payment_confirmation_email
-        send_payment_confirmation_email.delay(user.email)
-      except Exception:
-        # 如果Celery不可用，同步发送（降级处理）
-        try:
-          await EmailService.payment_confirmation_message(user.email)
-        except:
-          pass  # 邮件发送失败不影响支付流程
-
     return payment
   
   @staticmethod
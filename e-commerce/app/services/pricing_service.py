@@ -0,0 +1,55 @@
+"""
+购物车计价
+购物车读取和下单金额统一由 PricingService 计算：按当前商品价格算出每一行的金额和合计，
+不再依赖加购时写入 cart_items.price 的历史价格。
+购物车展示通过商品快照缓存批量读取价格；下单时使用加锁后重新查询到的商品行计价，不使用缓存。
+"""
+from typing import Dict
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.product_cache_service import ProductCacheService
+
+
+class PricingService:
+  @staticmethod
+  async def price_lines(db: AsyncSession, quantities: Dict[int, int]) -> Dict:
+    """
+    按当前价格为购物车行计价（一次批量读取所有商品）
+
+    Args:
+        db: 数据库会话
+        quantities: 商品ID -> 数量
+
+    Returns:
+        Dict: {
+          "lines": {商品ID: {"product_id", "quantity", "unit_price", "line_total", "product"}},
+          "total_amount": 合计金额
+        }
+        已不存在的商品不会出现在 lines 中，也不计入合计
+    """
+    products = await ProductCacheService.get_many(db, quantities)
+    return PricingService.price_products(products, quantities)
+
+  @staticmethod
+  def price_products(products: Dict[int, Dict], quantities: Dict[int, int]) -> Dict:
+    """
+    用已读取到的商品（商品ID -> {price, ...}）计价，返回格式与 price_lines 相同
+    """
+    lines = {}
+    total_amount = 0
+    for product_id, quantity in quantities.items():
+      product = products.get(int(product_id))
+      if product is None:
+        continue
+      line_total = product["price"] * quantity
+      lines[int(product_id)] = {
+        "product_id": int(product_id),
+        "quantity": quantity,
+        "unit_price": product["price"],
+        "line_total": line_total,
+        "product": product,
+      }
+      total_amount += line_total
+
+    return {"lines": lines, "total_amount": total_amount}
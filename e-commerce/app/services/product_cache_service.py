@@ -0,0 +1,75 @@
+"""
+商品快照缓存
+把购物车、下单等高频路径需要的商品字段（价格、库存、上下架状态）缓存在Redis中，
+批量读取时一次MGET，未命中的商品再用一次数据库查询补齐。
+"""
+import json
+from typing import Dict, Iterable
+
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.product import Product
+from app.database.redis_session import redis_connection
+
+
+PRODUCT_CACHE_TTL = 60  # 秒，价格和库存的最大陈旧时间
+
+
+def _cache_key(product_id: int) -> str:
+  return f"product:snapshot:{product_id}"
+
+
+class ProductCacheService:
+  @staticmethod
+  async def get_many(db: AsyncSession, product_ids: Iterable[int]) -> Dict[int, Dict]:
+    """
+    批量获取商品快照
+
+    Returns:
+        Dict[int, Dict]: 商品ID -> {id, name, price, stock, is_active}，不存在的商品不会出现在结果中
+    """
+    product_ids = list(dict.fromkeys(int(product_id) for product_id in product_ids))
+    if not product_ids:
+      return {}
+
+    snapshots = {}
+    try:
+      cached = await redis_connection.mget([_cache_key(product_id) for product_id in product_ids])
+      for product_id, value in zip(product_ids, cached):
+        if value:
+          snapshots[product_id] = json.loads(value)
+    except Exception:
+      # 缓存不可用时直接查询数据库
+      pass
+
+    missing_ids = [product_id for product_id in product_ids if product_id not in snapshots]
+    if missing_ids:
+      result = await db.execute(
+        select(Product.id, Product.name, Product.price, Product.stock, Product.is_active)
+        .where(Product.id.in_(missing_ids))
+      )
+      loaded = {row.id: dict(row._mapping) for row in result.all()}
+      snapshots.update(loaded)
+
+      if loaded:
+        try:
+          async with redis_connection.pipeline(transaction=False) as pipe:
+            for product_id, snapshot in loaded.items():
+              pipe.setex(_cache_key(product_id), PRODUCT_CACHE_TTL, json.dumps(snapshot))
+            await pipe.execute()
+        except Exception:
+          pass
+
+    return snapshots
+
+  @staticmethod
+  async def get(db: AsyncSession, product_id: int):
+    snapshots = await ProductCacheService.get_many(db, [product_id])
+    return snapshots.get(int(product_id))
+
+  @staticmethod
+  async def invalidate(product_ids: Iterable[int]):
+    keys = [_cache_key(product_id) for product_id in product_ids]
+    if keys:
+      await redis_connection.delete(*keys)
@@ -7,10 +7,16 @@ from app.schemas.user import Role
 from app.models.product import Product
 from app.utils.token import get_client_ip
 from app.database.redis_session import redis_connection
+from app.utils.cache_version import get_cache_version
+from app.services.outbox_service import OutboxService
 from app.utils.pagination import apply_filters, apply_pagination
 from app.schemas.product import ProductCreate, ProductUpdate, ProductFilter, ProductResponse
 
 
+# 商品列表和搜索结果缓存共用的版本号（见 app.utils.cache_version）
+PRODUCT_LIST_CACHE = "products:list"
+
+
 class ProductService:
   @staticmethod
   async def get_all_products(db: AsyncSession, filters: ProductFilter):
@@ -28,11 +34,13 @@ class ProductService:
     if filters.availability is not None:
       cache_key_parts.append(f"availability:{filters.availability}")
     
-    cache_key = f"products:list:{':'.join(cache_key_parts)}"
+    cache_key = None
     cache_ttl = 180  # 缓存3分钟
     
-    # 尝试从Redis缓存获取结果
+    # 尝试从Redis缓存获取结果（缓存键带商品缓存版本号，商品变化时由发件箱递增版本号）
     try:
+      version = await get_cache_version(PRODUCT_LIST_CACHE)
+      cache_key = f"products:list:v{version}:{':'.join(cache_key_parts)}"
       cached_result = await redis_connection.get(cache_key)
       if cached_result:
         import json
@@ -56,11 +64,12 @@ class ProductService:
         "size": products["size"],
         "pages": products["pages"]
       }
-      await redis_connection.setex(
-        cache_key,
-        cache_ttl,
-        json.dumps(cache_data, default=str)
-      )
+      if cache_key is not None:
+        await redis_connection.setex(
+          cache_key,
+          cache_ttl,
+          json.dumps(cache_data, default=str)
+        )
     except Exception:
       pass
     
@@ -82,6 +91,8 @@ class ProductService:
     product_db = Product(**product_dict)
 
     db.add(product_db)
+    await db.flush()
+    OutboxService.add_event(db, "product", product_db.id, "product.created", {"product_id": product_db.id})
     await db.commit()
     await db.refresh(product_db)
 
@@ -138,6 +149,7 @@ class ProductService:
     elif product.stock == 0:
       product.is_active = False
 
+    OutboxService.add_event(db, "product", product.id, "product.updated", {"product_id": product.id})
     await db.commit()
     await db.refresh(product)
     return product
@@ -166,6 +178,7 @@ class ProductService:
 
     # 硬删除：真正从数据库中删除记录
     await db.delete(product)
+    OutboxService.add_event(db, "product", product_id, "product.deleted", {"product_id": product_id})
     await db.commit()
 
     return {"detail": "Product deleted successfully."}
@@ -186,11 +199,13 @@ class ProductService:
     search_term = f"%{search_query}%"
     
     # 构建缓存键（包含搜索关键词和分页信息）
-    cache_key = f"search:products:{search_query.lower()}:page:{page}:size:{size}"
+    cache_key = None
     cache_ttl = 300  # 缓存5分钟
     
     # 尝试从Redis缓存获取结果
     try:
+      version = await get_cache_version(PRODUCT_LIST_CACHE)
+      cache_key = f"search:products:v{version}:{search_query.lower()}:page:{page}:size:{size}"
       cached_result = await redis_connection.get(cache_key)
       if cached_result:
         import json
@@ -199,39 +214,6 @@ class ProductService:
       # 缓存获取失败，继续执行数据库查询
       pass
 
-  @staticmethod
-  async def update_product_rating_stats(db: AsyncSession, product_id: int):
-    """
-    计算并更新指定商品的平均评分和评价总数。
-    这是一个关键的内部方法，在创建、更新或删除评价时被调用。
-
-    Args:
-        db (AsyncSession): 数据库会话。
-        product_id (int): 需要更新的商品ID。
-    """
-    from app.models.review import Review
-
-    # 查询该商品的所有评价的评分
-    stmt = select(Review.rating).where(Review.product_id == product_id)
-    result = await db.execute(stmt)
-    ratings = result.scalars().all()
-
-    # 计算新的平均分和评价总数
-    if ratings:
-        new_review_count = len(ratings)
-        new_average_rating = sum(ratings) / new_review_count
-    else:
-        new_review_count = 0
-        new_average_rating = 0.0
-
-    # 获取商品对象并更新统计数据
-    product = await db.get(Product, product_id)
-    if product:
-        product.review_count = new_review_count
-        product.average_rating = round(new_average_rating, 2)  # 保留两位小数
-        await db.commit()
-        await db.refresh(product)
-    
     # 使用 ILIKE 进行不区分大小写的模糊搜索（PostgreSQL）
     # 搜索商品名称和描述
     query = select(Product).where(
@@ -271,13 +253,29 @@ class ProductService:
     # 将结果存入Redis缓存
     try:
       import json
-      await redis_connection.setex(
-        cache_key,
-        cache_ttl,
-        json.dumps(response_data, default=str)  # default=str处理datetime等类型
-      )
+      if cache_key is not None:
+        await redis_connection.setex(
+          cache_key,
+          cache_ttl,
+          json.dumps(response_data, default=str)  # default=str处理datetime等类型
+        )
     except Exception:
       # 缓存存储失败，不影响返回结果
       pass
     
     return response_data
+
+  @staticmethod
+  async def update_product_rating_stats(db: AsyncSession, product_id: int):
+    """
+    重新计算并修正指定商品的评分统计。
+    日常的评价写入已在同一条语句中增量更新聚合，这里只用于手动校对单个商品。
+
+    Args:
+        db (AsyncSession): 数据库会话。
+        product_id (int): 需要更新的商品ID。
+    """
+    from app.services.rating_service import RatingService
+
+    await RatingService.fix_drift(db, [product_id])
+    await db.commit()
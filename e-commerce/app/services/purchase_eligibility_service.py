@@ -0,0 +1,43 @@
+"""
+评价资格（用户是否已收到某商品）
+订单发货或完成时把订单中的商品写入 purchased_products，发表评价时按 (user_id, product_id) 主键查找。
+"""
+from typing import Iterable
+
+from sqlalchemy import select, exists
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.order import Order
+from app.models.order_item import OrderItem
+from app.models.purchased_product import PurchasedProduct
+
+
+class PurchaseEligibilityService:
+  @staticmethod
+  async def record_received_orders(db: AsyncSession, order_ids: Iterable[int]):
+    """把这些订单的 (用户, 商品) 写入资格索引（不提交），已存在的组合保持不变"""
+    order_ids = list(order_ids)
+    if not order_ids:
+      return
+
+    received = (
+      select(Order.user_id, OrderItem.product_id)
+      .join(OrderItem, OrderItem.order_id == Order.id)
+      .where(Order.id.in_(order_ids))
+      .distinct()
+    )
+    await db.execute(
+      insert(PurchasedProduct)
+      .from_select(["user_id", "product_id"], received)
+      .on_conflict_do_nothing(index_elements=["user_id", "product_id"])
+    )
+
+  @staticmethod
+  async def has_received(db: AsyncSession, user_id: int, product_id: int) -> bool:
+    result = await db.execute(
+      select(exists().where(
+        PurchasedProduct.user_id == user_id,
+        PurchasedProduct.product_id == product_id))
+    )
+    return result.scalar()
@@ -0,0 +1,110 @@
+"""
+查询向量缓存
+相同（规范化后）的查询文本不再重复执行模型前向计算：
+- 第一级：进程内LRU，保存numpy向量；
+- 第二级：Redis，多个worker共享，保存float16字节（384维约768字节）。
+缓存键包含模型名称和后端，更换模型或后端后旧向量自然失效。两级缓存都保存经过float16取整的向量，
+无论命中哪一级，同一查询得到的向量完全相同。
+"""
+import hashlib
+import logging
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Dict
+
+import numpy as np
+
+from app.config.settings import settings
+from app.database.redis_session import redis_binary_connection
+
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """全角转半角、去掉首尾空白、合并连续空白并转为小写"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip().lower()
+
+
+class QueryEmbeddingCache:
+    def __init__(self, max_entries: int = 2048, ttl: int = 86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(model_name: str, normalized: str) -> str:
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        return f"qemb:{model_name}:{digest}"
+
+    def _remember(self, key: str, vector: np.ndarray):
+        # 同一个数组会返回给多个请求，设为只读
+        vector.setflags(write=False)
+        self._local[key] = vector
+        self._local.move_to_end(key)
+        if len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    async def get_or_encode(self, embedding_service, text: str, encode=None) -> np.ndarray:
+        """
+        返回查询文本的向量，两级缓存都未命中时才调用模型
+
+        Args:
+            embedding_service: EmbeddingService，提供 model_id 和 encode_single
+            encode: 可选的异步编码函数 encode(text) -> np.ndarray，默认直接调用 encode_single
+        """
+        key = self._key(embedding_service.model_id, normalize_query(text))
+
+        vector = self._local.get(key)
+        if vector is not None:
+            self._local.move_to_end(key)
+            self.local_hits += 1
+            return vector
+
+        try:
+            cached = await redis_binary_connection.get(key)
+        except Exception as e:
+            logger.warning(f"Query embedding cache unavailable: {e}")
+            cached = None
+        if cached:
+            vector = np.frombuffer(cached, dtype=np.float16).astype(np.float32)
+            self.redis_hits += 1
+            self._remember(key, vector)
+            return vector
+
+        self.misses += 1
+        if encode is not None:
+            encoded = await encode(text)
+        else:
+            encoded = embedding_service.encode_single(text)
+        half = np.asarray(encoded, dtype=np.float16)
+        vector = half.astype(np.float32)
+        self._remember(key, vector)
+        try:
+            await redis_binary_connection.set(key, half.tobytes(), ex=self.ttl)
+        except Exception:
+            pass
+        return vector
+
+    def stats(self) -> Dict:
+        lookups = self.local_hits + self.redis_hits + self.misses
+        hits = self.local_hits + self.redis_hits
+        return {
+            "lookups": lookups,
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+            "local_hit_ratio": round(self.local_hits / lookups, 4) if lookups else None,
+            "local_entries": len(self._local),
+        }
+
+
+query_embedding_cache = QueryEmbeddingCache(
+    max_entries=settings.QUERY_EMBEDDING_CACHE_SIZE, ttl=settings.QUERY_EMBEDDING_CACHE_TTL)
@@ -0,0 +1,56 @@
+"""
+RAG计算线程池
+Embedding编码和Chroma检索都是同步的CPU密集操作，直接在协程中调用会阻塞事件循环，
+同一worker上的其他接口也会跟着变慢。这里把它们放进有界线程池执行
+（PyTorch矩阵运算和hnswlib检索期间都会释放GIL）：
+同时执行的任务数由 workers 限制，排队数超过 max_pending 时直接返回503，流量高峰时不会无限堆积。
+
+知识库构建和增量索引的批量编码使用另一个线程池（indexing_executor）：与查询互不抢占线程，
+后台任务只排队等待，不会被拒绝。
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from fastapi import HTTPException, status
+
+from app.config.settings import settings
+
+
+class RAGExecutor:
+    def __init__(self, workers: int, max_pending: Optional[int], thread_name_prefix: str = "rag"):
+        self.workers = workers
+        self.max_pending = max_pending  # None 表示不限制排队数
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=thread_name_prefix)
+        self._pending = 0
+        self.rejected = 0
+
+    async def run(self, func, *args, **kwargs):
+        if self.max_pending is not None and self._pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Agent is busy, please retry",
+                headers={"Retry-After": "1"})
+
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, lambda: func(*args, **kwargs))
+        finally:
+            self._pending -= 1
+
+    async def encode_query(self, embedding_service, text: str):
+        return await self.run(embedding_service.encode_single, text)
+
+    def stats(self) -> Dict:
+        return {"workers": self.workers, "pending": self._pending,
+                "max_pending": self.max_pending, "rejected": self.rejected}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+rag_executor = RAGExecutor(workers=settings.RAG_EXECUTOR_WORKERS, max_pending=settings.RAG_EXECUTOR_MAX_PENDING)
+indexing_executor = RAGExecutor(workers=settings.KB_INDEX_EXECUTOR_WORKERS, max_pending=None,
+                                thread_name_prefix="kb-index")
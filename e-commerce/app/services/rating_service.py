@@ -0,0 +1,284 @@
+"""
+商品评分聚合
+products 表上维护评分的增量聚合：review_count、rating_sum、1~5星直方图和最近评价时间。
+评价的新增/修改/删除与聚合更新写在同一条SQL中（数据修改CTE），每条评价的代价与商品的评价数量无关；
+RatingDriftChecker 定期用一次全量聚合校对并修正偏差。
+"""
+import asyncio
+import logging
+from typing import List, Optional
+
+from sqlalchemy import (select, update, delete, func, case, cast, literal_column, null, or_, and_,
+                        Numeric, TIMESTAMP, union_all)
+from sqlalchemy.orm import aliased
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.settings import settings
+from app.models.review import Review
+from app.models.product import Product
+from app.database.session import AsyncSessionLocal
+from app.database.redis_session import redis_connection
+from app.utils.distributed_lock import DistributedLock
+
+
+logger = logging.getLogger(__name__)
+
+RATING_STARS = (1, 2, 3, 4, 5)
+
+
+def _histogram_column(star: int):
+  return getattr(Product, f"rating_{star}_count")
+
+
+def _average(rating_sum, review_count):
+  return func.coalesce(
+    func.round(cast(rating_sum, Numeric) / func.nullif(review_count, 0), 2), 0)
+
+
+class RatingService:
+  @staticmethod
+  def _stats_update(changes, removed_ids=None):
+    """
+    根据评价变更构建 products 聚合的增量更新（返回CTE）
+
+    Args:
+        changes: 包含 product_id, rating, sign, created_at 列的可选对象，
+                 sign 为 1（新增）、-1（删除）或 0（不计入聚合的追评）
+        removed_ids: 本次删除的评价ID（子查询），用于重新确定最近评价时间
+    """
+    deltas = (
+      select(
+        changes.c.product_id,
+        func.sum(changes.c.sign).label("count_delta"),
+        func.sum(changes.c.sign * changes.c.rating).label("sum_delta"),
+        func.max(case((changes.c.sign > 0, changes.c.created_at))).label("latest"),
+        *[
+          func.sum(case((changes.c.rating == star, changes.c.sign), else_=0)).label(f"star_{star}")
+          for star in RATING_STARS
+        ]
+      )
+      .group_by(changes.c.product_id)
+      .subquery("rating_deltas")
+    )
+
+    new_count = Product.review_count + deltas.c.count_delta
+    new_sum = Product.rating_sum + deltas.c.sum_delta
+    if removed_ids is None:
+      last_review_at = func.greatest(Product.last_review_at, deltas.c.latest)
+    else:
+      # 同一语句中的子查询看不到本次删除，需要显式排除被删除的评价（走 product_id, created_at 索引）
+      last_review_at = (
+        select(func.max(Review.created_at))
+        .where(
+          Review.product_id == Product.id,
+          Review.parent_review_id.is_(None),
+          Review.id.not_in(removed_ids))
+        .scalar_subquery()
+      )
+    return (
+      update(Product)
+      .where(Product.id == deltas.c.product_id)
+      .values(
+        review_count=new_count,
+        rating_sum=new_sum,
+        average_rating=_average(new_sum, new_count),
+        last_review_at=last_review_at,
+        # 评价变化不算作商品本身的修改
+        updated_at=Product.updated_at,
+        **{
+          f"rating_{star}_count": _histogram_column(star) + deltas.c[f"star_{star}"]
+          for star in RATING_STARS
+        }
+      )
+      .returning(Product.id)
+      .cte("rating_stats")
+    )
+
+  @staticmethod
+  async def insert_review(db: AsyncSession, review_data: dict):
+    """
+    插入一条主评价并在同一条语句中更新商品评分聚合（不提交）
+
+    Returns:
+        Row: 新插入的评价行
+    """
+    inserted = (
+      Review.__table__.insert()
+      .values(**review_data)
+      .returning(*Review.__table__.c, literal_column("1").label("sign"))
+      .cte("inserted_review")
+    )
+    stats = RatingService._stats_update(inserted)
+    result = await db.execute(
+      select(*[inserted.c[column.name] for column in Review.__table__.c]).add_cte(stats))
+    return result.one()
+
+  @staticmethod
+  async def delete_review(db: AsyncSession, review_id: int) -> List[int]:
+    """
+    删除评价及其追评，并在同一条语句中扣减商品评分聚合（不提交）
+
+    Returns:
+        List[int]: 被删除的评价ID
+    """
+    deleted = (
+      delete(Review)
+      .where(or_(Review.id == review_id, Review.parent_review_id == review_id))
+      .returning(
+        Review.id,
+        Review.product_id,
+        Review.rating,
+        Review.created_at,
+        # 只有主评价计入聚合，追评只是随主评价一起删除
+        case((Review.parent_review_id.is_(None), literal_column("-1")), else_=literal_column("0")).label("sign"))
+      .cte("deleted_reviews")
+    )
+    stats = RatingService._stats_update(deleted, removed_ids=select(deleted.c.id))
+    result = await db.execute(select(deleted.c.id).add_cte(stats))
+    return result.scalars().all()
+
+  @staticmethod
+  async def update_review_rating(db: AsyncSession, review_id: int, content: str, rating: int):
+    """
+    修改评价内容和评分，并在同一条语句中把旧评分换成新评分（不提交）
+
+    Returns:
+        Row: 修改后的评价行，评价不存在时为 None
+    """
+    old = aliased(Review, name="old_review")
+    updated = (
+      update(Review)
+      .where(and_(Review.id == review_id, old.id == Review.id))
+      .values(content=content, rating=rating)
+      .returning(
+        *Review.__table__.c,
+        old.rating.label("old_rating"),
+        case((Review.parent_review_id.is_(None), literal_column("1")), else_=literal_column("0")).label("counted"))
+      .cte("updated_review")
+    )
+    # 旧评分 -1，新评分 +1
+    changes = union_all(
+      select(updated.c.product_id, updated.c.old_rating.label("rating"),
+             (-updated.c.counted).label("sign"), updated.c.created_at),
+      select(updated.c.product_id, updated.c.rating,
+             updated.c.counted.label("sign"), cast(null(), TIMESTAMP).label("created_at")),
+    ).subquery("rating_changes")
+    stats = RatingService._stats_update(changes)
+    result = await db.execute(
+      select(*[updated.c[column.name] for column in Review.__table__.c]).add_cte(stats))
+    return result.one_or_none()
+
+  @staticmethod
+  async def fix_drift(db: AsyncSession, product_ids: Optional[List[int]] = None) -> List[int]:
+    """
+    用一次全量聚合重新计算评分统计，只更新与实际不一致的商品（不提交）
+
+    Args:
+        product_ids: 只校对这些商品，默认校对全部商品
+
+    Returns:
+        List[int]: 发生偏差并被修正的商品ID
+    """
+    actual = (
+      select(
+        Review.product_id,
+        func.count().label("review_count"),
+        func.sum(Review.rating).label("rating_sum"),
+        func.max(Review.created_at).label("last_review_at"),
+        *[func.count().filter(Review.rating == star).label(f"star_{star}") for star in RATING_STARS]
+      )
+      .where(Review.parent_review_id.is_(None))
+      .group_by(Review.product_id)
+    )
+    if product_ids is not None:
+      actual = actual.where(Review.product_id.in_(product_ids))
+    actual = actual.subquery("actual_ratings")
+
+    # 没有评价的商品也需要校对，因此从 products 左连接实际聚合
+    expected = select(
+      Product.id.label("product_id"),
+      func.coalesce(actual.c.review_count, 0).label("review_count"),
+      func.coalesce(actual.c.rating_sum, 0).label("rating_sum"),
+      actual.c.last_review_at,
+      *[func.coalesce(actual.c[f"star_{star}"], 0).label(f"star_{star}") for star in RATING_STARS]
+    ).outerjoin(actual, actual.c.product_id == Product.id)
+    if product_ids is not None:
+      expected = expected.where(Product.id.in_(product_ids))
+    expected = expected.subquery("expected_ratings")
+
+    drifted = or_(
+      Product.review_count != expected.c.review_count,
+      Product.rating_sum != expected.c.rating_sum,
+      Product.average_rating != _average(expected.c.rating_sum, expected.c.review_count),
+      Product.last_review_at.is_distinct_from(expected.c.last_review_at),
+      *[_histogram_column(star) != expected.c[f"star_{star}"] for star in RATING_STARS]
+    )
+    result = await db.execute(
+      update(Product)
+      .where(and_(Product.id == expected.c.product_id, drifted))
+      .values(
+        review_count=expected.c.review_count,
+        rating_sum=expected.c.rating_sum,
+        average_rating=_average(expected.c.rating_sum, expected.c.review_count),
+        last_review_at=expected.c.last_review_at,
+        updated_at=Product.updated_at,
+        **{f"rating_{star}_count": expected.c[f"star_{star}"] for star in RATING_STARS}
+      )
+      .returning(Product.id)
+      .execution_options(synchronize_session=False)
+    )
+    return result.scalars().all()
+
+
+class RatingDriftChecker:
+  """后台定期校对评分聚合，发现偏差时记录日志并修正"""
+
+  def __init__(self, interval: float = 3600.0):
+    self.interval = interval
+    self._task: Optional[asyncio.Task] = None
+    self._stopping = False
+
+  async def check_once(self) -> List[int]:
+    # 多个worker只需要一个执行校对
+    lock = DistributedLock("rating:drift_check", timeout=300, retry_times=1)
+    if not await lock.acquire():
+      return []
+
+    try:
+      async with AsyncSessionLocal() as db:
+        drifted = await RatingService.fix_drift(db)
+        await db.commit()
+    finally:
+      await lock.release()
+
+    if drifted:
+      logger.warning(f"Rating aggregates drifted for {len(drifted)} products, fixed: {drifted[:50]}")
+      # 修正后的商品需要清除评价汇总缓存
+      try:
+        await redis_connection.delete(*[f"reviews:product:{product_id}:summary" for product_id in drifted])
+      except Exception:
+        pass
+    return drifted
+
+  async def run_forever(self):
+    while not self._stopping:
+      await asyncio.sleep(self.interval)
+      try:
+        await self.check_once()
+      except Exception as e:
+        logger.error(f"Rating drift check error: {e}")
+
+  def start(self):
+    if self._task is None or self._task.done():
+      self._stopping = False
+      self._task = asyncio.create_task(self.run_forever())
+    return self._task
+
+  async def stop(self):
+    self._stopping = True
+    if self._task is not None:
+      self._task.cancel()
+      self._task = None
+
+
+rating_drift_checker = RatingDriftChecker(interval=settings.RATING_DRIFT_CHECK_INTERVAL)
@@ -0,0 +1,206 @@
+"""
+评价点赞/点踩
+用户的反应状态和计数都保存在Redis中：点击只执行一次Lua脚本（切换状态并返回最新计数），
+不写数据库；ReactionFlusher 在后台把有变化的计数批量写回 reviews.likes_count / dislikes_count。
+"""
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import update
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.settings import settings
+from app.models.review import Review
+from app.database.session import AsyncSessionLocal
+from app.database.redis_session import redis_connection
+
+
+logger = logging.getLogger(__name__)
+
+DIRTY_REVIEWS_KEY = "review:reactions:dirty"  # 计数有变化、尚未写回数据库的评价ID集合
+NOT_LOADED = -2
+
+# 计数不在Redis中时返回 NOT_LOADED，由调用方从数据库加载后重试
+# KEYS[1]=用户反应哈希 KEYS[2]=计数哈希 KEYS[3]=脏数据集合 KEYS[4]=旧版单用户反应键
+# ARGV[1]=用户ID ARGV[2]=like|dislike ARGV[3]=评价ID
+TOGGLE_REACTION_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+  return {-2, 0, 0, ''}
+end
+
+local function decrement(field)
+  if tonumber(redis.call('HGET', KEYS[2], field) or '0') > 0 then
+    redis.call('HINCRBY', KEYS[2], field, -1)
+  end
+end
+
+local previous = redis.call('HGET', KEYS[1], ARGV[1])
+if not previous then
+  -- 兼容旧版按用户单独保存的反应键，读取后迁移到哈希中
+  previous = redis.call('GET', KEYS[4])
+  if previous then
+    redis.call('DEL', KEYS[4])
+  end
+end
+
+local reaction = ARGV[2]
+local state = ''
+if previous == reaction then
+  -- 重复点击同一反应表示取消
+  redis.call('HDEL', KEYS[1], ARGV[1])
+  decrement(reaction .. 's')
+else
+  redis.call('HSET', KEYS[1], ARGV[1], reaction)
+  redis.call('HINCRBY', KEYS[2], reaction .. 's', 1)
+  if previous then
+    decrement(previous .. 's')
+  end
+  state = reaction
+end
+
+redis.call('SADD', KEYS[3], ARGV[3])
+return {1, tonumber(redis.call('HGET', KEYS[2], 'likes')), tonumber(redis.call('HGET', KEYS[2], 'dislikes')), state}
+"""
+
+
+def _reactions_key(review_id: int) -> str:
+  return f"review:{review_id}:reactions"
+
+
+def _counts_key(review_id: int) -> str:
+  return f"review:{review_id}:counts"
+
+
+def _legacy_reaction_key(review_id: int, user_id: int) -> str:
+  return f"review:{review_id}:user:{user_id}:reaction"
+
+
+class ReviewReactionStore:
+  @staticmethod
+  async def _load_counts(db: AsyncSession, review_id: int):
+    """把数据库中的计数加载到Redis（只读数据库）"""
+    result = await db.execute(
+      select(Review.likes_count, Review.dislikes_count).where(Review.id == review_id))
+    row = result.one_or_none()
+    if not row:
+      raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Review not found")
+
+    key = _counts_key(review_id)
+    async with redis_connection.pipeline(transaction=True) as pipe:
+      pipe.hsetnx(key, "likes", row.likes_count or 0)
+      pipe.hsetnx(key, "dislikes", row.dislikes_count or 0)
+      await pipe.execute()
+
+  @staticmethod
+  async def toggle(db: AsyncSession, review_id: int, user_id: int, reaction: str) -> Dict:
+    """
+    切换用户对评价的反应
+
+    Args:
+        reaction: "like" 或 "dislike"，与当前反应相同时取消
+
+    Returns:
+        Dict: {"review_id", "likes_count", "dislikes_count", "reaction"}，reaction 为空表示已取消
+    """
+    keys = [_reactions_key(review_id), _counts_key(review_id), DIRTY_REVIEWS_KEY,
+            _legacy_reaction_key(review_id, user_id)]
+    args = [user_id, reaction, review_id]
+
+    result = await redis_connection.eval(TOGGLE_REACTION_SCRIPT, len(keys), *keys, *args)
+    if result[0] == NOT_LOADED:
+      await ReviewReactionStore._load_counts(db, review_id)
+      result = await redis_connection.eval(TOGGLE_REACTION_SCRIPT, len(keys), *keys, *args)
+
+    _, likes_count, dislikes_count, state = result
+    return {
+      "review_id": review_id,
+      "likes_count": likes_count,
+      "dislikes_count": dislikes_count,
+      "reaction": state or None,
+    }
+
+  @staticmethod
+  async def discard(review_ids):
+    """评价被删除后清除其反应状态和计数"""
+    keys = [key for review_id in review_ids for key in (_reactions_key(review_id), _counts_key(review_id))]
+    if keys:
+      await redis_connection.delete(*keys)
+      await redis_connection.srem(DIRTY_REVIEWS_KEY, *review_ids)
+
+
+class ReactionFlusher:
+  """后台定期把Redis中的点赞/点踩计数批量写回数据库"""
+
+  def __init__(self, interval: float = 5.0, batch_size: int = 500):
+    self.interval = interval
+    self.batch_size = batch_size
+    self._task: Optional[asyncio.Task] = None
+    self._stopping = False
+
+  async def flush(self) -> int:
+    """
+    写回一批有变化的评价计数
+
+    Returns:
+        int: 本批写回的评价数量
+    """
+    review_ids = await redis_connection.spop(DIRTY_REVIEWS_KEY, self.batch_size)
+    if not review_ids:
+      return 0
+
+    async with redis_connection.pipeline(transaction=False) as pipe:
+      for review_id in review_ids:
+        pipe.hmget(_counts_key(review_id), "likes", "dislikes")
+      counts = await pipe.execute()
+
+    rows = [
+      {"id": int(review_id), "likes_count": int(likes), "dislikes_count": int(dislikes)}
+      for review_id, (likes, dislikes) in zip(review_ids, counts)
+      if likes is not None and dislikes is not None
+    ]
+    if not rows:
+      return 0
+
+    try:
+      async with AsyncSessionLocal() as db:
+        # 按主键批量更新（executemany）
+        await db.execute(update(Review), rows)
+        await db.commit()
+    except Exception:
+      # 写回失败时重新标记，下一轮再试
+      await redis_connection.sadd(DIRTY_REVIEWS_KEY, *review_ids)
+      raise
+    return len(rows)
+
+  async def run_forever(self):
+    while not self._stopping:
+      try:
+        while await self.flush() >= self.batch_size:
+          pass
+      except Exception as e:
+        logger.error(f"Reaction flusher error: {e}")
+      await asyncio.sleep(self.interval)
+
+  def start(self):
+    if self._task is None or self._task.done():
+      self._stopping = False
+      self._task = asyncio.create_task(self.run_forever())
+    return self._task
+
+  async def stop(self):
+    self._stopping = True
+    if self._task is not None:
+      self._task.cancel()
+      self._task = None
+    # 退出前把剩余的计数全部写回
+    try:
+      while await self.flush():
+        pass
+    except Exception as e:
+      logger.error(f"Reaction flusher final flush failed: {e}")
+
+
+reaction_flusher = ReactionFlusher(interval=settings.REACTION_FLUSH_INTERVAL)
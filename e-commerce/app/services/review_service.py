@@ -1,15 +1,32 @@
+import json
+import base64
 from datetime import datetime
-from sqlalchemy import select, and_, or_
+from sqlalchemy import select, and_, tuple_, any_, literal, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
 from fastapi import HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.review import Review
 from app.models.product import Product
-from app.models.order import Order, OrderStatus
-from app.models.order_item import OrderItem
 from app.schemas.review import LikeDislike
+from app.services.rating_service import RatingService, RATING_STARS
+from app.services.review_reaction_store import ReviewReactionStore
+from app.services.purchase_eligibility_service import PurchaseEligibilityService
+from app.services.outbox_service import OutboxService
 from app.database.redis_session import redis_connection
-from app.schemas.review import ReviewCreate, ReviewResponse
+from app.utils.cache_version import get_cache_version, bump_cache_version
+from app.schemas.review import (ReviewCreate, ReviewResponse, ReviewSort, ReviewThreadFilter,
+                                ReviewSummaryResponse)
+
+
+# 排序方式对应的排序字段，均按 (字段, id) 倒序做键集分页
+REVIEW_SORT_COLUMNS = {
+  ReviewSort.newest: Review.created_at,
+  ReviewSort.most_helpful: Review.likes_count,
+  ReviewSort.rating: Review.rating,
+}
+FIRST_PAGE_CACHE_TTL = 60  # 秒
+SUMMARY_CACHE_TTL = 300  # 秒，评价新增/修改/删除时主动失效
 
 
 class ReviewService:
@@ -21,62 +38,173 @@ class ReviewService:
     return result
 
   @staticmethod
-  async def get_review_by_id(product_id: int, db: AsyncSession):
+  def _to_response(review: Review, follow_up_reviews=None) -> ReviewResponse:
+    return ReviewResponse(
+      id=review.id,
+      product_id=review.product_id,
+      parent_review_id=review.parent_review_id,
+      content=review.content,
+      rating=review.rating,
+      likes_count=review.likes_count or 0,
+      dislikes_count=review.dislikes_count or 0,
+      created_at=review.created_at,
+      follow_up_reviews=follow_up_reviews
+    )
+
+  @staticmethod
+  def _encode_cursor(sort_value, review_id: int) -> str:
+    if isinstance(sort_value, datetime):
+      sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, review_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+  @staticmethod
+  def _decode_cursor(cursor: str, sort: ReviewSort):
+    try:
+      sort_value, review_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+      if sort == ReviewSort.newest:
+        sort_value = datetime.fromisoformat(sort_value)
+      return sort_value, int(review_id)
+    except Exception:
+      raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+  @staticmethod
+  async def invalidate_review_cache(product_id: int):
     """
-    获取商品的所有主评论，每个主评论包含其追评列表
+    评论新增、修改或删除后失效该商品缓存的第一页评论和评价汇总
+    第一页评论的缓存键带有商品的版本号（各种排序和页大小），递增版本号即可全部失效
     """
-    # 查询该商品的所有主评论（parent_review_id 为 NULL）
-    main_reviews_query = await db.execute(
-      select(Review).where(
-        and_(
-          Review.product_id == product_id,
-          Review.parent_review_id.is_(None)
-        )
-      ).order_by(Review.created_at.desc())
+    try:
+      await bump_cache_version(f"reviews:product:{product_id}", f"reviews:product:{product_id}:summary")
+    except Exception:
+      pass
+
+  @staticmethod
+  async def get_review_by_id(product_id: int, db: AsyncSession, filters: ReviewThreadFilter = None):
+    """
+    分页获取商品的主评论，每个主评论包含其追评列表
+
+    使用 (排序字段, id) 做键集分页，一页的所有追评通过一次 parent_review_id = ANY(...) 查询加载；
+    不带游标的第一页会缓存在Redis中。
+
+    Returns:
+        Dict: {"items": 主评论列表, "next_cursor": 下一页游标，没有更多时为None}
+    """
+    filters = filters or ReviewThreadFilter()
+    cache_key = None
+
+    if filters.cursor is None:
+      try:
+        version = await get_cache_version(f"reviews:product:{product_id}")
+        cache_key = f"reviews:product:{product_id}:v{version}:{filters.sort.value}:{filters.size}"
+        cached_page = await redis_connection.get(cache_key)
+        if cached_page:
+          return json.loads(cached_page)
+      except Exception:
+        pass
+
+    sort_column = REVIEW_SORT_COLUMNS[filters.sort]
+    query = select(Review).where(
+      and_(
+        Review.product_id == product_id,
+        Review.parent_review_id.is_(None)
+      )
     )
+    if filters.cursor is not None:
+      sort_value, review_id = ReviewService._decode_cursor(filters.cursor, filters.sort)
+      query = query.where(tuple_(sort_column, Review.id) < tuple_(sort_value, review_id))
+
+    # 多取一条用于判断是否还有下一页
+    main_reviews_query = await db.execute(
+      query.order_by(sort_column.desc(), Review.id.desc()).limit(filters.size + 1))
     main_reviews = main_reviews_query.scalars().all()
+    has_more = len(main_reviews) > filters.size
+    main_reviews = main_reviews[:filters.size]
 
-    if not main_reviews:
+    if not main_reviews and filters.cursor is None:
       raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No reviews found for this product")
 
-    # 为每个主评论查询其追评列表
-    result = []
-    for main_review in main_reviews:
-      # 查询该主评论的所有追评
+    # 一次查询加载本页所有主评论的追评
+    follow_ups = {}
+    if main_reviews:
       follow_up_query = await db.execute(
-        select(Review).where(
-          Review.parent_review_id == main_review.id
-        ).order_by(Review.created_at.asc())
+        select(Review)
+        .where(Review.parent_review_id == any_(literal([r.id for r in main_reviews], ARRAY(Integer))))
+        .order_by(Review.parent_review_id, Review.created_at.asc(), Review.id.asc())
       )
-      follow_up_reviews = follow_up_query.scalars().all()
-
-      # 构建追评列表
-      follow_up_list = [
-        ReviewResponse(
-          id=fu.id,
-          product_id=fu.product_id,
-          parent_review_id=fu.parent_review_id,
-          content=fu.content,
-          rating=fu.rating,
-          created_at=fu.created_at,
-          follow_up_reviews=None  # 追评不能再有追评
+      for follow_up in follow_up_query.scalars().all():
+        follow_ups.setdefault(follow_up.parent_review_id, []).append(
+          ReviewService._to_response(follow_up))  # 追评不能再有追评
+
+    items = [
+      ReviewService._to_response(main_review, follow_ups.get(main_review.id))
+      for main_review in main_reviews
+    ]
+    next_cursor = None
+    if has_more:
+      last = main_reviews[-1]
+      next_cursor = ReviewService._encode_cursor(getattr(last, sort_column.key), last.id)
+
+    page = {"items": items, "next_cursor": next_cursor}
+
+    if cache_key is not None:
+      try:
+        await redis_connection.setex(
+          cache_key,
+          FIRST_PAGE_CACHE_TTL,
+          json.dumps({"items": [item.model_dump() for item in items], "next_cursor": next_cursor}, default=str)
         )
-        for fu in follow_up_reviews
-      ] if follow_up_reviews else None
-
-      # 构建主评论响应对象
-      main_review_response = ReviewResponse(
-        id=main_review.id,
-        product_id=main_review.product_id,
-        parent_review_id=main_review.parent_review_id,
-        content=main_review.content,
-        rating=main_review.rating,
-        created_at=main_review.created_at,
-        follow_up_reviews=follow_up_list
-      )
-      result.append(main_review_response)
+      except Exception:
+        pass
 
-    return result
+    return page
+
+  @staticmethod
+  async def get_review_summary(product_id: int, db: AsyncSession) -> dict:
+    """
+    商品评价汇总（星级分布、平均分、评价数、最近评价时间）
+    直接读取 products 上预先维护的评分聚合，结果缓存在Redis中，评价变化时失效
+    """
+    cache_key = f"reviews:product:{product_id}:summary"
+    try:
+      cached_summary = await redis_connection.get(cache_key)
+      if cached_summary:
+        return json.loads(cached_summary)
+    except Exception:
+      pass
+
+    result = await db.execute(
+      select(
+        Product.id,
+        Product.average_rating,
+        Product.review_count,
+        Product.last_review_at,
+        *[getattr(Product, f"rating_{star}_count") for star in RATING_STARS]
+      ).where(Product.id == product_id)
+    )
+    row = result.one_or_none()
+    if not row:
+      raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+
+    histogram = {star: getattr(row, f"rating_{star}_count") for star in RATING_STARS}
+    summary = ReviewSummaryResponse(
+      product_id=row.id,
+      average_rating=row.average_rating,
+      review_count=row.review_count,
+      histogram=histogram,
+      percentages={
+        star: round(count * 100 / row.review_count, 1) if row.review_count else 0.0
+        for star, count in histogram.items()
+      },
+      last_review_at=row.last_review_at
+    ).model_dump(mode="json")
+
+    try:
+      await redis_connection.setex(cache_key, SUMMARY_CACHE_TTL, json.dumps(summary))
+    except Exception:
+      pass
+
+    return summary
 
   @staticmethod
   async def create_review(review: ReviewCreate, db: AsyncSession,current_user):
@@ -90,24 +218,10 @@ class ReviewService:
     if not existing_product:
       raise HTTPException(detail="Product not found with that id",status_code=status.HTTP_404_NOT_FOUND)
 
-    # 2. 检查用户是否购买过该商品且订单已完成（completed 或 shipped）
-    purchased_query = await db.execute(
-      select(Order)
-      .join(OrderItem, OrderItem.order_id == Order.id)
-      .where(
-        and_(
-          Order.user_id == current_user.id,
-          OrderItem.product_id == review.product_id,
-          or_(
-            Order.order_status == OrderStatus.completed,  # 已完成
-            Order.order_status == OrderStatus.shipped     # 已发货
-          )
-        )
-      )
-    )
-    purchased_order = purchased_query.scalar_one_or_none()
+    # 2. 检查用户是否购买并收到过该商品（订单已发货或已完成），只需一次主键查找
+    purchased = await PurchaseEligibilityService.has_received(db, current_user.id, review.product_id)
 
-    if not purchased_order:
+    if not purchased:
       raise HTTPException(
         status_code=status.HTTP_403_FORBIDDEN,
         detail="You can only review products you have purchased and received (order status: shipped or completed)."
@@ -152,27 +266,24 @@ class ReviewService:
       # 追评使用主评论的评分
       review_data["rating"] = existing_review.rating
 
-    review_db = Review(**review_data)
-    db.add(review_db)
-    await db.commit()
-    await db.refresh(review_db)
-
-    # --- 关键步骤：更新商品的评分统计 ---
-    # 只有在创建主评论时才触发更新
     if not existing_review:
-        from app.services.product_service import ProductService
-        await ProductService.update_product_rating_stats(db, review_db.product_id)
+      # 主评论：插入评论和更新商品评分聚合在同一条语句中完成
+      review_db = await RatingService.insert_review(db, review_data)
+      # 主评论进入知识库（追评不索引）
+      OutboxService.add_event(db, "review", review_db.id, "review.created",
+                              {"review_id": review_db.id, "product_id": review_db.product_id})
+      await db.commit()
+    else:
+      # 追评不计入评分统计
+      review_db = Review(**review_data)
+      db.add(review_db)
+      await db.commit()
+      await db.refresh(review_db)
+
+    await ReviewService.invalidate_review_cache(review_db.product_id)
 
     # 手动构建 ReviewResponse，避免访问关系属性导致的异步加载问题
-    return ReviewResponse(
-      id=review_db.id,
-      product_id=review_db.product_id,
-      parent_review_id=review_db.parent_review_id,
-      content=review_db.content,
-      rating=review_db.rating,
-      created_at=review_db.created_at,
-      follow_up_reviews=None  # 新创建的评论没有追评
-    )
+    return ReviewService._to_response(review_db)  # 新创建的评论没有追评
 
   @staticmethod
   async def update_review(
@@ -189,14 +300,16 @@ class ReviewService:
     if review_dict.user_id != user.id:
       raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You have no permission to perform this action")
 
-    review_dict.content= updated_review.content
-    review_dict.rating= updated_review.rating
-
-    db.add(review_dict)
+    # 修改评分时同一条语句中更新商品评分聚合
+    review_row = await RatingService.update_review_rating(
+      db, review_id, updated_review.content, updated_review.rating)
+    if review_row.parent_review_id is None:
+      OutboxService.add_event(db, "review", review_id, "review.updated",
+                              {"review_id": review_id, "product_id": review_row.product_id})
     await db.commit()
-    await db.refresh(review_dict)
 
-    return review_dict
+    await ReviewService.invalidate_review_cache(review_row.product_id)
+    return ReviewService._to_response(review_row)
 
   @staticmethod
   async def delete_review(review_id: int, db: AsyncSession, user):
@@ -209,56 +322,24 @@ class ReviewService:
     if review_dict.user_id != user.id:
       raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You have no permission to perform this action")
 
-    # 如果是主评论（parent_review_id 为 NULL），需要先删除所有追评
-    if review_dict.parent_review_id is None:
-      # 查询该主评论的所有追评
-      follow_up_query = await db.execute(
-        select(Review).where(Review.parent_review_id == review_id)
-      )
-      follow_up_reviews = follow_up_query.scalars().all()
-      
-      # 删除所有追评
-      for follow_up_review in follow_up_reviews:
-        await db.delete(follow_up_review)
-    
-    # 删除主评论（或单独的追评）
-    await db.delete(review_dict)
+    # 主评论连同所有追评一起删除（或单独删除一条追评），并在同一条语句中扣减商品评分聚合
+    product_id = review_dict.product_id
+    deleted_ids = await RatingService.delete_review(db, review_id)
+    OutboxService.add_event(db, "review", review_id, "review.deleted",
+                            {"review_ids": deleted_ids, "product_id": product_id})
     await db.commit()
+
+    await ReviewService.invalidate_review_cache(product_id)
+    await ReviewReactionStore.discard(deleted_ids)
   
   @staticmethod
   async def like_dislike(reaction: LikeDislike, db: AsyncSession, current_user):
-    review_query = await db.execute(select(Review).where(Review.id == reaction.review_id))
-    review = review_query.scalars().first()
-
-    if not review:
-      raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,detail="Review not found")
-
-    key = f"review:{review.id}:user:{current_user.id}:reaction"
-    previous_state = await redis_connection.get(key)
-
-    like = "like"
-    dislike = "dislike"
-
-    if previous_state == like and reaction.like_dislike == 1:
-        review.likes_count -= 1
-        await redis_connection.delete(key)
-
-    elif previous_state == dislike and reaction.like_dislike == 0:
-        review.dislikes_count -= 1
-        await redis_connection.delete(key)
-
-    elif reaction.like_dislike == 1:
-        review.likes_count += 1
-        review.dislikes_count -= 1 if previous_state == dislike else 0
-        await redis_connection.set(key, like)
-
-    else:
-        review.dislikes_count += 1
-        review.likes_count -= 1 if previous_state == like else 0
-        await redis_connection.set(key, dislike)
-    
-    db.add(review)
-    await db.commit()
-    await db.refresh(review)
-
-    return review
\ No newline at end of file
+    """
+    点赞/点踩（再次点击相同反应则取消）
+    状态和计数只在Redis中修改，计数由后台任务批量写回数据库
+    """
+    return await ReviewReactionStore.toggle(
+      db,
+      reaction.review_id,
+      current_user.id,
+      "like" if reaction.like_dislike == 1 else "dislike")
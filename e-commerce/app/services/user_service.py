@@ -4,6 +4,8 @@ from fastapi import HTTPException, status, Depends
 
 from app.models import User
 from app.utils.token import get_current_user
+from app.utils.principal_cache import principal_cache
+from app.utils.refresh_token_store import RefreshTokenStore
 from app.services.email_service import EmailService
 from app.schemas.user import UserUpdate, UserResponse, Role
 
@@ -77,6 +79,7 @@ class UserService:
 
     await db.commit()
     await db.refresh(user)
+    await principal_cache.invalidate(user.id)
 
     return UserResponse.model_validate(user)
 
@@ -102,5 +105,7 @@ class UserService:
     # 硬删除：真正从数据库中删除记录
     await db.delete(user)
     await db.commit()
+    await principal_cache.invalidate(user_id)
+    await RefreshTokenStore.revoke_user(user_id)
 
     return {"message": "User deleted successfully"}
\ No newline at end of file
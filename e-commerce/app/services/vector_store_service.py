@@ -1,9 +1,22 @@
 """
 向量数据库服务
 使用ChromaDB存储和检索向量
+
+同时维护同一批文档的BM25词法索引（lexical_index），供混合检索使用：
+本进程写入/删除文档时同步更新，其他进程的写入通过变更通知（knowledge_base_changes）由 apply_changes 生效。
+多个worker共享同一个集合时可以配置 CHROMA_SERVER_HOST 使用Chroma服务端（HttpClient），
+否则（PersistentClient）每个进程有自己的内存HNSW索引，其他进程写入后需要重新打开客户端。
+
+集合元数据中记录构建时的Embedding模型（embedding_model，即 EmbeddingService.model_id），
+当前模型与之不一致时拒绝使用（不同模型/后端的向量不能混用），需要重建知识库。
 """
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import os
+import threading
+import uuid
+
+from app.config.settings import settings
+from app.services.lexical_index import BM25Index
 
 # 可选导入chromadb，如果未安装则提供友好的错误提示
 try:
@@ -25,6 +38,13 @@ except (ImportError, OSError) as e:
     EmbeddingService = None
 
 
+class EmbeddingModelMismatchError(RuntimeError):
+    """集合是用另一个Embedding模型/后端构建的"""
+
+
+COLLECTION_DESCRIPTION = "E-commerce product and review knowledge base"
+
+
 class VectorStoreService:
     """
     向量数据库服务
@@ -57,6 +77,11 @@ class VectorStoreService:
         self.collection = None
         # 延迟加载EmbeddingService，避免在导入时就加载PyTorch
         self._embedding_service = None
+        self.lexical_index = BM25Index()
+        self._lexical_loaded = False
+        self._lexical_lock = threading.Lock()
+        # 变更通知中标识写入进程，读取时跳过本进程自己的写入
+        self.instance_id = uuid.uuid4().hex
         self._initialize_client()
     
     @property
@@ -75,19 +100,12 @@ class VectorStoreService:
     def _initialize_client(self):
         """初始化ChromaDB客户端"""
         try:
-            # 创建持久化目录
-            os.makedirs(self.persist_directory, exist_ok=True)
-            
-            # 初始化ChromaDB客户端
-            self.client = chromadb.PersistentClient(
-                path=self.persist_directory,
-                settings=Settings(anonymized_telemetry=False)
-            )
+            self.client = self._create_client()
             
             # 获取或创建集合
             self.collection = self.client.get_or_create_collection(
                 name=self.collection_name,
-                metadata={"description": "E-commerce product and review knowledge base"}
+                metadata={"description": COLLECTION_DESCRIPTION}
             )
             
             print(f"向量数据库初始化成功: {self.collection_name}")
@@ -95,6 +113,56 @@ class VectorStoreService:
             print(f"初始化向量数据库失败: {e}")
             raise
     
+    @property
+    def uses_server(self) -> bool:
+        return bool(settings.CHROMA_SERVER_HOST)
+    
+    def _create_client(self):
+        """Chroma服务端（多个进程共享同一份索引）或本地持久化目录"""
+        if self.uses_server:
+            return chromadb.HttpClient(
+                host=settings.CHROMA_SERVER_HOST,
+                port=settings.CHROMA_SERVER_PORT,
+                settings=Settings(anonymized_telemetry=False)
+            )
+        # 创建持久化目录
+        os.makedirs(self.persist_directory, exist_ok=True)
+        return chromadb.PersistentClient(
+            path=self.persist_directory,
+            settings=Settings(anonymized_telemetry=False)
+        )
+    
+    def _reopen_client(self):
+        """
+        PersistentClient 重新从磁盘打开（其他进程的写入在本进程的内存HNSW索引中不可见）
+        
+        同一目录的客户端在进程内被缓存，需要先清除缓存；正在进行的检索继续使用旧的集合对象
+        """
+        if self.uses_server:
+            return
+        self.client.clear_system_cache()
+        client = self._create_client()
+        try:
+            collection = client.get_collection(name=self.collection_name)
+        except Exception:
+            # 集合正在重建，由 reopen_if_replaced 之后处理
+            return
+        self.client, self.collection = client, collection
+    
+    @staticmethod
+    def _metadata(doc: Dict) -> Dict:
+        """文档元数据（ChromaDB的元数据值只能是 str/int/float/bool）"""
+        return {
+            "type": doc.get("type", "unknown"),
+            "product_id": doc.get("product_id", doc.get("id")),
+            "product_name": doc.get("product_name", doc.get("name", "")),
+            "price": doc.get("price", 0),
+            "rating": doc.get("rating") or 0,
+            "stock": doc.get("stock", 0),
+            "category": doc.get("category", ""),
+            "content_hash": doc.get("content_hash", ""),
+        }
+    
     def add_documents(self, documents: List[Dict], batch_size: int = 100):
         """
         添加文档到向量数据库
@@ -115,17 +183,7 @@ class VectorStoreService:
         
         # 准备数据
         ids = [str(doc["id"]) for doc in documents]
-        metadatas = [
-            {
-                "type": doc.get("type", "unknown"),
-                "product_id": doc.get("product_id", doc.get("id")),
-                "product_name": doc.get("product_name", doc.get("name", "")),
-                "price": doc.get("price", 0),
-                "rating": doc.get("rating", 0),
-                "category": doc.get("category", ""),
-            }
-            for doc in documents
-        ]
+        metadatas = [self._metadata(doc) for doc in documents]
         
         # 批量添加
         for i in range(0, len(documents), batch_size):
@@ -140,10 +198,191 @@ class VectorStoreService:
                 documents=batch_texts,
                 metadatas=batch_metadatas
             )
+            self.lexical_index.add(batch_ids, batch_texts, batch_metadatas)
             print(f"已添加 {i+len(batch_ids)}/{len(documents)} 个文档")
         
         print(f"成功添加 {len(documents)} 个文档到向量数据库")
     
+    def diff_documents(self, documents: List[Dict]) -> Tuple[List[Tuple[Dict, Dict]], List[Tuple[Dict, Dict]], int]:
+        """
+        与集合中已有的文档比较
+        
+        Returns:
+            (需要重新编码的 [(doc, metadata)], 只需更新元数据的 [(doc, metadata)], 未变化的数量)
+        """
+        ids = [str(doc["id"]) for doc in documents]
+        existing = self.collection.get(ids=ids, include=["metadatas"])
+        existing_metadata = dict(zip(existing["ids"], existing["metadatas"]))
+        
+        to_embed, to_update, unchanged = [], [], 0
+        for doc in documents:
+            metadata = self._metadata(doc)
+            current = existing_metadata.get(str(doc["id"]))
+            if current is None or current.get("content_hash") != metadata["content_hash"]:
+                to_embed.append((doc, metadata))
+            elif current != metadata:
+                to_update.append((doc, metadata))
+            else:
+                unchanged += 1
+        return to_embed, to_update, unchanged
+    
+    def write_documents(self, to_embed: List[Tuple[Dict, Dict]], embeddings, to_update: List[Tuple[Dict, Dict]]):
+        """写入 diff_documents 的结果，embeddings 与 to_embed 一一对应"""
+        if to_embed:
+            self.collection.upsert(
+                ids=[str(doc["id"]) for doc, _ in to_embed],
+                embeddings=embeddings.tolist(),
+                documents=[doc.get("text", "") for doc, _ in to_embed],
+                metadatas=[metadata for _, metadata in to_embed]
+            )
+            self.lexical_index.add(
+                [str(doc["id"]) for doc, _ in to_embed],
+                [doc.get("text", "") for doc, _ in to_embed],
+                [metadata for _, metadata in to_embed]
+            )
+        if to_update:
+            self.collection.update(
+                ids=[str(doc["id"]) for doc, _ in to_update],
+                metadatas=[metadata for _, metadata in to_update]
+            )
+            self.lexical_index.update_metadata(
+                [str(doc["id"]) for doc, _ in to_update],
+                [metadata for _, metadata in to_update]
+            )
+    
+    def upsert_documents(self, documents: List[Dict], batch_size: int = 100) -> Dict:
+        """
+        增量写入文档：文本哈希（content_hash）变化或文档不存在时重新编码并写入，
+        只有元数据变化时只更新元数据，完全相同的文档跳过
+        
+        Returns:
+            Dict: {"embedded": 重新编码的文档数, "metadata_only": 只更新元数据的文档数, "unchanged": 跳过的文档数}
+        """
+        stats = {"embedded": 0, "metadata_only": 0, "unchanged": 0}
+        for i in range(0, len(documents), batch_size):
+            to_embed, to_update, unchanged = self.diff_documents(documents[i:i+batch_size])
+            embeddings = None
+            if to_embed:
+                embeddings = self.embedding_service.encode(
+                    [doc.get("text", "") for doc, _ in to_embed], batch_size=batch_size)
+            self.write_documents(to_embed, embeddings, to_update)
+            stats["embedded"] += len(to_embed)
+            stats["metadata_only"] += len(to_update)
+            stats["unchanged"] += unchanged
+        return stats
+    
+    def delete_documents(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None):
+        """按ID或元数据条件删除文档（不存在的ID会被忽略）"""
+        if ids:
+            self.collection.delete(ids=ids)
+            self.lexical_index.remove(ids)
+        if where:
+            self.collection.delete(where=where)
+            self.lexical_index.remove_where(where)
+    
+    def list_document_ids(self, batch_size: int = 5000) -> List[str]:
+        """返回集合中所有文档ID（用于全量校对）"""
+        ids = []
+        offset = 0
+        while True:
+            batch = self.collection.get(include=[], limit=batch_size, offset=offset)["ids"]
+            ids.extend(batch)
+            if len(batch) < batch_size:
+                return ids
+            offset += batch_size
+    
+    def _load_lexical_index(self, batch_size: int = 5000):
+        index = BM25Index()
+        offset = 0
+        while True:
+            batch = self.collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            index.add(batch["ids"], batch["documents"], batch["metadatas"])
+            if len(batch["ids"]) < batch_size:
+                break
+            offset += batch_size
+        self.lexical_index = index
+        self._lexical_loaded = True
+    
+    def refresh_lexical_index(self):
+        """
+        从集合重新加载BM25索引
+        
+        在新索引上加载完成后再替换，期间检索继续使用旧索引。
+        只在后台调用（Agent加载、集合重建、变更通知落后时），检索请求中不重新加载。
+        """
+        with self._lexical_lock:
+            self._load_lexical_index()
+    
+    def ensure_lexical_index(self):
+        """没有经过 AgentRuntime 加载的实例（脚本等）第一次使用时加载BM25索引，其他线程等待加载完成"""
+        if self._lexical_loaded:
+            return
+        with self._lexical_lock:
+            if not self._lexical_loaded:
+                self._load_lexical_index()
+    
+    def apply_changes(self, changes: List[Dict], lagged: bool = False) -> int:
+        """
+        应用其他进程写入的变更（knowledge_base_changes.read_changes 的结果）
+        
+        先重新打开Chroma客户端，再按变更更新BM25索引：删除的文档从索引中移除，
+        新增/更新的文档从集合读取最新内容（之后又被删除的文档集合中已不存在，同样移除）。
+        lagged 或有全量校对时整体重新加载BM25索引。
+        
+        Returns:
+            int: 应用的变更数量（不包括本进程自己的写入）
+        """
+        changes = [change for change in changes if change["origin"] != self.instance_id]
+        if not changes and not lagged:
+            return 0
+        self._reopen_client()
+        if lagged or any(change["reload"] for change in changes):
+            self.refresh_lexical_index()
+            return len(changes)
+        
+        deleted = {doc_id for change in changes for doc_id in change["deleted"]}
+        deleted_products = sorted({product_id for change in changes for product_id in change["deleted_products"]})
+        upserted = list(dict.fromkeys(doc_id for change in changes for doc_id in change["upserted"]))
+        
+        self.lexical_index.remove(deleted)
+        if deleted_products:
+            self.lexical_index.remove_where({"product_id": {"$in": deleted_products}})
+        for i in range(0, len(upserted), 500):
+            batch = upserted[i:i + 500]
+            documents = self.get_documents(batch)
+            self.lexical_index.remove([doc_id for doc_id in batch if doc_id not in documents])
+            if documents:
+                self.lexical_index.add(
+                    list(documents),
+                    [doc["text"] for doc in documents.values()],
+                    [doc["metadata"] for doc in documents.values()]
+                )
+        return len(changes)
+    
+    def lexical_search(self, query: str, n_results: int = 10, filter_dict: Optional[Dict] = None) -> List[Dict]:
+        """
+        BM25检索，过滤条件与 search 相同（ChromaDB格式）
+        
+        Returns:
+            List[Dict]: [{"id", "metadata", "score"}]，不包含原文
+        """
+        self.ensure_lexical_index()
+        index = self.lexical_index
+        return [
+            {"id": doc_id, "metadata": index.get_metadata(doc_id), "score": score}
+            for doc_id, score in index.search(query, n_results=n_results, where=filter_dict)
+        ]
+    
+    def get_documents(self, ids: List[str]) -> Dict[str, Dict]:
+        """按ID读取原文和元数据"""
+        if not ids:
+            return {}
+        result = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        return {
+            doc_id: {"id": doc_id, "text": text, "metadata": metadata}
+            for doc_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])
+        }
+    
     def is_collection_empty(self) -> bool:
         """
         检查集合是否为空
@@ -157,7 +396,8 @@ class VectorStoreService:
         except Exception:
             return True
     
-    def search(self, query: str, n_results: int = 10, filter_dict: Optional[Dict] = None) -> List[Dict]:
+    def search(self, query: str, n_results: int = 10, filter_dict: Optional[Dict] = None,
+               query_embedding=None) -> List[Dict]:
         """
         语义搜索
         
@@ -165,6 +405,7 @@ class VectorStoreService:
             query: 查询文本
             n_results: 返回结果数量
             filter_dict: 过滤条件（ChromaDB格式）
+            query_embedding: 已计算好的查询向量（例如来自查询向量缓存），为空时现场编码
         
         Returns:
             List[Dict]: 搜索结果列表
@@ -181,7 +422,8 @@ class VectorStoreService:
         
         try:
             # 生成查询向量
-            query_embedding = self.embedding_service.encode_single(query)
+            if query_embedding is None:
+                query_embedding = self.embedding_service.encode_single(query)
             
             # 执行搜索
             results = self.collection.query(
@@ -220,6 +462,64 @@ class VectorStoreService:
         except Exception as e:
             print(f"删除集合失败: {e}")
     
+    def check_embedding_model(self):
+        """
+        校验集合记录的Embedding模型与当前模型一致
+        
+        没有记录的集合（空集合，或记录模型之前构建的集合）记录为当前模型
+        
+        Raises:
+            EmbeddingModelMismatchError: 模型不一致
+        """
+        model_id = self.embedding_service.model_id
+        metadata = dict(self.collection.metadata or {})
+        stored = metadata.get("embedding_model")
+        if stored == model_id:
+            return
+        if stored is None:
+            metadata["embedding_model"] = model_id
+            self.collection.modify(metadata=metadata)
+            return
+        raise EmbeddingModelMismatchError(
+            f"Knowledge base collection was built with {stored}, but the current embedding model is {model_id}. "
+            "Rebuild it with: python init_knowledge_base.py --rebuild "
+            "(or set EMBEDDING_BACKEND back to the backend it was built with)"
+        )
+    
+    def reopen_if_replaced(self) -> bool:
+        """
+        其他进程重建了集合（删除后重新创建，集合ID变化）时重新打开集合并重新加载BM25索引，
+        否则本进程持有的旧集合句柄在重建后一直失败
+        
+        Returns:
+            bool: 是否重新打开了集合
+        """
+        try:
+            current = self.client.get_collection(name=self.collection_name)
+        except Exception:
+            # 集合正在重建（已删除、尚未重新创建），下次再检查
+            return False
+        if self.collection is not None and current.id == self.collection.id:
+            return False
+        self.collection = current
+        self.refresh_lexical_index()
+        print(f"集合已被重建，重新打开: {self.collection_name}")
+        self.check_embedding_model()
+        return True
+    
+    def reset_collection(self):
+        """
+        删除并重新创建集合（用于重建），Embedding模型和客户端保持不变
+        其他进程通过 reopen_if_replaced 发现集合ID变化后重新打开
+        """
+        self.delete_collection()
+        self.collection = self.client.get_or_create_collection(
+            name=self.collection_name,
+            metadata={"description": COLLECTION_DESCRIPTION, "embedding_model": self.embedding_service.model_id}
+        )
+        self.lexical_index.clear()
+        self._lexical_loaded = True
+    
     def get_collection_info(self) -> Dict:
         """获取集合信息"""
         try:
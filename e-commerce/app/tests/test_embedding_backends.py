@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.config.settings import settings
+from app.services.embedding_service import EmbeddingService
+
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("onnxruntime")
+
+ONNX_DIR = settings.EMBEDDING_ONNX_DIR
+QUANTIZED = settings.EMBEDDING_ONNX_QUANTIZED
+MODEL_FILE = os.path.join(ONNX_DIR, "model_int8.onnx" if QUANTIZED else "model.onnx")
+
+pytestmark = pytest.mark.skipif(
+    not os.path.exists(MODEL_FILE), reason="ONNX model not exported, run export_onnx_embedding.py")
+
+TEXTS = [
+    "性价比高的手机",
+    "适合学生的轻薄笔记本电脑",
+    "降噪耳机推荐",
+    "商品名称：跑步鞋\n商品描述：缓震透气，适合长跑\n价格：399元\n分类：运动鞋",
+    "评分：5星\n评论内容：电池很耐用，充电也快，非常满意",
+    "cheap wireless earbuds with long battery life",
+]
+
+
+@pytest.fixture(scope="module")
+def torch_service():
+    return EmbeddingService(backend="torch")
+
+
+@pytest.fixture(scope="module")
+def onnx_service():
+    service = EmbeddingService(backend="onnx")
+    assert service.backend.name.startswith("onnx")
+    return service
+
+
+def test_dimension_matches(torch_service, onnx_service):
+    assert onnx_service.embedding_dim == torch_service.embedding_dim
+
+def test_cosine_parity(torch_service, onnx_service):
+    expected = torch_service.encode(TEXTS)
+    actual = onnx_service.encode(TEXTS)
+
+    # 两个后端的输出都已归一化，点积即余弦相似度
+    cosine = np.sum(expected * actual, axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1))
+    threshold = 0.99 if QUANTIZED else 0.9999
+    assert cosine.min() >= threshold, cosine
+
+def test_ranking_parity(torch_service, onnx_service):
+    # 检索时关心的是相对顺序：同一查询下两个后端给出的最近邻应一致
+    query = "续航长的手机"
+    documents = TEXTS
+    expected = torch_service.encode(documents) @ torch_service.encode_single(query)
+    actual = onnx_service.encode(documents) @ onnx_service.encode_single(query)
+    assert np.argmax(actual) == np.argmax(expected)
+
+def test_batching_does_not_change_vectors(onnx_service):
+    # padding 不应影响结果
+    one_by_one = np.vstack([onnx_service.encode_single(text) for text in TEXTS])
+    batched = onnx_service.encode(TEXTS, batch_size=len(TEXTS))
+    assert np.allclose(one_by_one, batched, atol=1e-4)
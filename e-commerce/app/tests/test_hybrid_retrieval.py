@@ -0,0 +1,67 @@
+from app.services.hybrid_retriever import build_where, parse_query_filters, reciprocal_rank_fusion
+from app.services.lexical_index import BM25Index, matches_where, tokenize
+
+
+def make_index():
+    index = BM25Index()
+    index.add(
+        ["product:1", "product:2", "product:3", "review:1"],
+        [
+            "商品名称：iPhone 15 Pro\n价格：8999元\n分类：手机",
+            "商品名称：iPhone 14 Pro\n价格：7999元\n分类：手机",
+            "商品名称：Sony WH-1000XM5 降噪耳机\n价格：2699元\n分类：耳机",
+            "商品：iPhone 15 Pro\n评分：5星\n评论内容：拍照很好",
+        ],
+        [
+            {"type": "product", "price": 8999, "category": "手机"},
+            {"type": "product", "price": 7999, "category": "手机"},
+            {"type": "product", "price": 2699, "category": "耳机"},
+            {"type": "review", "price": 0, "category": ""},
+        ],
+    )
+    return index
+
+
+def test_tokenize_keeps_model_numbers():
+    tokens = tokenize("Sony WH-1000XM5 降噪耳机")
+    assert "wh-1000xm5" in tokens and "1000xm5" in tokens
+    assert "降噪" in tokens and "耳机" in tokens
+
+def test_bm25_prefers_exact_model():
+    index = make_index()
+    results = index.search("iPhone 15 Pro", where={"type": "product"})
+    assert results[0][0] == "product:1"
+    assert "review:1" not in dict(results)
+
+    assert index.search("WH-1000XM5")[0][0] == "product:3"
+
+def test_filters_are_applied_before_ranking():
+    index = make_index()
+    where = build_where(doc_type="product", max_price=8000)
+    assert [doc_id for doc_id, _ in index.search("iPhone 15 Pro", where=where)] == ["product:2"]
+    assert matches_where({"type": "product", "price": 100}, where)
+    assert not matches_where({"type": "review", "price": 100}, where)
+
+def test_index_updates_and_facets():
+    index = make_index()
+    assert sorted(index.facet_values("category")) == ["手机", "耳机"]
+    index.remove_where({"category": "耳机"})
+    assert index.search("WH-1000XM5") == []
+    assert index.facet_values("category") == ["手机"]
+    index.update_metadata(["product:1"], [{"type": "product", "price": 100, "category": "手机"}])
+    assert index.search("iPhone", where={"price": {"$lt": 1000}})[0][0] == "product:1"
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=60)
+    assert [doc_id for doc_id, _ in fused] == ["a", "c", "b"]
+
+def test_parse_query_filters():
+    assert parse_query_filters("3000元以下的降噪耳机") == {"max_price": 3000}
+    assert parse_query_filters("1000到2000元的跑鞋") == {"min_price": 1000, "max_price": 2000}
+    assert parse_query_filters("500元以上的手机", ["手机", "耳机"]) == {"min_price": 500, "category": "手机"}
+    assert parse_query_filters("iPhone 15 Pro") == {}
+    # 否定形式的方向与原词相反
+    assert parse_query_filters("价格不超过3000的手机") == {"max_price": 3000}
+    assert parse_query_filters("不低于500元的耳机") == {"min_price": 500}
+    assert parse_query_filters("价格不高于2000的手机") == {"max_price": 2000}
+    assert parse_query_filters("至少1000，最多2000的跑鞋") == {"min_price": 1000, "max_price": 2000}
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.services.llm_client import LLMClient, LLMError
+
+TOKENS = ["您好，", "推荐", "iPhone 15 Pro", "。"]
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """本地的OpenAI兼容接口：/v1/chat/completions，支持 stream"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.ports.add(self.client_address[1])
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            if server.status != 200:
+                self._send_json(server.status, {"error": "stub failure"})
+            elif body.get("stream"):
+                self._stream()
+            else:
+                time.sleep(server.delay)
+                self._send_json(200, {"choices": [{"message": {"content": "".join(TOKENS)}}]})
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in TOKENS:
+            chunk = {"choices": [{"delta": {"content": token}}]}
+            self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+            time.sleep(self.server.delay)
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubLLMHandler)
+    server.lock = threading.Lock()
+    server.ports = set()
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.delay = 0.0
+    server.status = 200
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(server, **kwargs):
+    return LLMClient(
+        api_base=f"http://127.0.0.1:{server.server_address[1]}/v1",
+        api_key="test-key", model="stub", http2=False, **kwargs)
+
+
+def run(client, coroutine_factory):
+    async def main():
+        try:
+            return await coroutine_factory()
+        finally:
+            await client.aclose()
+    return asyncio.run(main())
+
+
+MESSAGES = [{"role": "user", "content": "推荐手机"}]
+
+
+def test_complete_reuses_pooled_connection(stub_server):
+    client = make_client(stub_server)
+
+    async def calls():
+        return [await client.complete(MESSAGES) for _ in range(5)]
+
+    assert run(client, calls) == ["".join(TOKENS)] * 5
+    assert len(stub_server.ports) == 1
+
+def test_stream_yields_tokens_before_completion(stub_server):
+    stub_server.delay = 0.1
+    client = make_client(stub_server)
+
+    async def consume():
+        start = time.perf_counter()
+        first_token_at = None
+        tokens = []
+        async for token in client.stream(MESSAGES):
+            if first_token_at is None:
+                first_token_at = time.perf_counter() - start
+            tokens.append(token)
+        return tokens, first_token_at, time.perf_counter() - start
+
+    tokens, first_token_at, total = run(client, consume)
+    assert tokens == TOKENS
+    assert first_token_at < total / 2
+    assert client.stats()["in_flight"] == 0
+
+def test_concurrency_limit(stub_server):
+    stub_server.delay = 0.1
+    client = make_client(stub_server, max_concurrency=2)
+
+    async def calls():
+        return await asyncio.gather(*(client.complete(MESSAGES) for _ in range(6)))
+
+    assert len(run(client, calls)) == 6
+    assert stub_server.max_in_flight <= 2
+
+def test_queue_timeout_rejects(stub_server):
+    stub_server.delay = 0.5
+    client = make_client(stub_server, max_concurrency=1, queue_timeout=0.1)
+
+    async def calls():
+        return await asyncio.gather(client.complete(MESSAGES), client.complete(MESSAGES), return_exceptions=True)
+
+    results = run(client, calls)
+    assert sum(isinstance(result, LLMError) for result in results) == 1
+    assert client.stats()["rejected"] == 1
+
+def test_error_status_raises(stub_server):
+    stub_server.status = 500
+    client = make_client(stub_server)
+
+    async def stream():
+        return [token async for token in client.stream(MESSAGES)]
+
+    with pytest.raises(LLMError):
+        run(client, lambda: client.complete(MESSAGES))
+    with pytest.raises(LLMError):
+        run(client, stream)
+
+def test_disabled_without_api_key(stub_server):
+    client = LLMClient(api_base="http://127.0.0.1:1/v1", api_key="", model="stub")
+    assert not client.enabled
+    with pytest.raises(LLMError):
+        run(client, lambda: client.complete(MESSAGES))
@@ -0,0 +1,25 @@
+import pytest
+from fastapi import HTTPException
+
+from app.models.order import OrderStatus
+from app.services.order_state_machine import OrderStateMachine
+
+
+def test_allowed_transitions():
+    assert OrderStateMachine.can_transition(OrderStatus.pending, OrderStatus.paid)
+    assert OrderStateMachine.can_transition(OrderStatus.paid, OrderStatus.shipped)
+    assert OrderStateMachine.can_transition(OrderStatus.shipped, "completed")
+    assert not OrderStateMachine.can_transition(OrderStatus.pending, OrderStatus.shipped)
+    assert not OrderStateMachine.can_transition(OrderStatus.completed, OrderStatus.canceled)
+
+def test_sources_for_cancel():
+    assert set(OrderStateMachine.sources_for("canceled")) == {OrderStatus.pending, OrderStatus.paid}
+
+def test_validate_transition_errors():
+    with pytest.raises(HTTPException) as exc:
+        OrderStateMachine.validate_transition("shipped", "shipped")
+    assert exc.value.status_code == 409
+
+    with pytest.raises(HTTPException) as exc:
+        OrderStateMachine.validate_transition("canceled", "paid")
+    assert exc.value.status_code == 400
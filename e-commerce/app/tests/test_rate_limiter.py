@@ -0,0 +1,96 @@
+import asyncio
+
+import fakeredis
+import httpx
+from fastapi import FastAPI
+from jose import jwt
+
+from app.config.settings import settings
+from app.middleware.rate_limitter import (
+    RateLimitMiddleware, RateLimitPolicy, RouteRateLimit, EXEMPT_PATHS, parse_trusted_proxies)
+
+
+def make_app(redis, default_limit=3, route_limits=(), trusted_proxies=()):
+    app = FastAPI()
+
+    @app.get("/products")
+    async def products():
+        return {"ok": True}
+
+    @app.post("/auth/login")
+    async def login():
+        return {"ok": True}
+
+    @app.get("/agent/ready")
+    async def ready():
+        return {"ready": True}
+
+    return RateLimitMiddleware(
+        app,
+        default_policy=RateLimitPolicy("default", default_limit, 60),
+        route_limits=route_limits,
+        exempt_paths=EXEMPT_PATHS,
+        trusted_proxies=parse_trusted_proxies(",".join(trusted_proxies)),
+        redis=redis)
+
+
+def request_many(app, method, path, count, headers=None, client=("10.0.0.1", 1234)):
+    async def main():
+        transport = httpx.ASGITransport(app=app, client=client)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return [await http.request(method, path, headers=headers) for _ in range(count)]
+    return asyncio.run(main())
+
+
+def bearer(user_id):
+    token = jwt.encode({"sub": str(user_id)}, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_allows_until_limit_then_rejects():
+    app = make_app(fakeredis.FakeAsyncRedis())
+    responses = request_many(app, "GET", "/products", 4)
+    assert [response.status_code for response in responses] == [200, 200, 200, 429]
+    assert [response.headers["ratelimit-remaining"] for response in responses[:3]] == ["2", "1", "0"]
+    assert responses[0].headers["ratelimit-policy"] == "3;w=60"
+
+def test_rejection_sets_retry_after():
+    app = make_app(fakeredis.FakeAsyncRedis())
+    rejected = request_many(app, "GET", "/products", 4)[-1]
+    assert rejected.status_code == 429
+    # 每分钟3次：下一次请求需要等待约20秒
+    assert 0 < int(rejected.headers["retry-after"]) <= 20
+
+def test_route_policy_is_selected_by_prefix_and_method():
+    login_policy = RateLimitPolicy("login", 1, 60, per_user=False)
+    app = make_app(fakeredis.FakeAsyncRedis(), route_limits=(RouteRateLimit("/auth/login", login_policy, ("POST",)),))
+
+    login = request_many(app, "POST", "/auth/login", 2)
+    assert [response.status_code for response in login] == [200, 429]
+    assert login[0].headers["ratelimit-policy"] == "1;w=60"
+    # 其他路由使用默认策略，计数互不影响
+    assert request_many(app, "GET", "/products", 1)[0].headers["ratelimit-policy"] == "3;w=60"
+
+def test_users_are_counted_separately():
+    app = make_app(fakeredis.FakeAsyncRedis(), default_limit=1)
+    assert request_many(app, "GET", "/products", 1, headers=bearer(1))[0].status_code == 200
+    assert request_many(app, "GET", "/products", 1, headers=bearer(1))[0].status_code == 429
+    assert request_many(app, "GET", "/products", 1, headers=bearer(2))[0].status_code == 200
+
+def test_exempt_paths_are_not_limited():
+    app = make_app(fakeredis.FakeAsyncRedis(), default_limit=1)
+    responses = request_many(app, "GET", "/agent/ready", 5)
+    assert all(response.status_code == 200 for response in responses)
+    assert "ratelimit-limit" not in responses[0].headers
+def test_forwarded_client_ip_behind_trusted_proxy():
+    app = make_app(fakeredis.FakeAsyncRedis(), default_limit=1, trusted_proxies=("10.0.0.0/8",))
+    # 经过可信代理的不同客户端分别计数
+    assert request_many(app, "GET", "/products", 1, headers={"X-Forwarded-For": "203.0.113.1"})[0].status_code == 200
+    assert request_many(app, "GET", "/products", 1, headers={"X-Forwarded-For": "203.0.113.2"})[0].status_code == 200
+    # 客户端伪造的最左边地址不影响计数：按代理追加的真实地址限流
+    spoofed = {"X-Forwarded-For": "198.51.100.9, 203.0.113.1"}
+    assert request_many(app, "GET", "/products", 1, headers=spoofed)[0].status_code == 429
+def test_forwarded_header_ignored_from_untrusted_client():
+    app = make_app(fakeredis.FakeAsyncRedis(), default_limit=1)
+    assert request_many(app, "GET", "/products", 1, headers={"X-Forwarded-For": "203.0.113.1"})[0].status_code == 200
+    assert request_many(app, "GET", "/products", 1, headers={"X-Forwarded-For": "203.0.113.2"})[0].status_code == 429
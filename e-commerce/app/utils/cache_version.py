@@ -0,0 +1,30 @@
+"""
+缓存版本号
+一组缓存键（例如某个商品的所有评论分页、所有商品列表页）共用一个版本号，版本号是缓存键的一部分；
+失效时只需递增版本号，旧版本的键不会再被读取，由各自的TTL过期，不需要 SCAN 整个键空间。
+"""
+from app.database.redis_session import redis_connection
+
+
+# 版本号键的TTL需要长于所有使用它的缓存键的TTL：版本号过期归零后，旧的 v0 键早已过期
+VERSION_TTL = 24 * 3600
+
+
+def _version_key(name: str) -> str:
+  return f"cache:version:{name}"
+
+
+async def get_cache_version(name: str) -> int:
+  value = await redis_connection.get(_version_key(name))
+  return int(value or 0)
+
+
+async def bump_cache_version(name: str, *delete_keys: str) -> int:
+  """递增版本号，并顺带删除不带版本号的键（例如单个汇总缓存）"""
+  async with redis_connection.pipeline(transaction=True) as pipe:
+    pipe.incr(_version_key(name))
+    pipe.expire(_version_key(name), VERSION_TTL)
+    if delete_keys:
+      pipe.delete(*delete_keys)
+    results = await pipe.execute()
+  return results[0]
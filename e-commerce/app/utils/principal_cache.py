@@ -0,0 +1,93 @@
+"""
+认证用户（Principal）缓存
+get_current_user 不再每次请求都查询 users 表：先查进程内TTL缓存，再查Redis，最后才查数据库。
+Redis中的缓存带版本号，用户被修改/删除时版本号递增，避免并发回填把旧数据写回缓存。
+其他worker的进程内缓存最多保留 PRINCIPAL_LOCAL_TTL 秒。
+"""
+import json
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.settings import settings
+from app.models.user import User
+from app.schemas.user import Principal
+from app.database.redis_session import redis_connection
+
+
+# 只有版本号没有变化时才写入缓存
+# KEYS[1]=版本号键 KEYS[2]=缓存键 ARGV[1]=读取数据库前的版本号 ARGV[2]=JSON ARGV[3]=TTL
+SET_IF_VERSION_SCRIPT = """
+local version = redis.call('GET', KEYS[1]) or '0'
+if version ~= ARGV[1] then
+  return 0
+end
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+def _version_key(user_id: int) -> str:
+  return f"principal:version:{user_id}"
+
+
+def _cache_key(user_id: int) -> str:
+  return f"principal:{user_id}"
+
+
+class PrincipalCache:
+  def __init__(self, ttl: int = 300, local_ttl: float = 5.0, max_local_entries: int = 10000):
+    self.ttl = ttl
+    self.local_ttl = local_ttl
+    self.max_local_entries = max_local_entries
+    self._local: Dict[int, Tuple[float, Principal]] = {}
+
+  async def get(self, db: AsyncSession, user_id: int) -> Optional[Principal]:
+    """返回用户的 Principal，用户不存在时返回 None"""
+    cached = self._local.get(user_id)
+    if cached and cached[0] > time.monotonic():
+      return cached[1]
+
+    try:
+      async with redis_connection.pipeline(transaction=False) as pipe:
+        pipe.get(_cache_key(user_id))
+        pipe.get(_version_key(user_id))
+        value, version = await pipe.execute()
+    except Exception:
+      value, version = None, None
+
+    if value:
+      principal = Principal.model_validate_json(value)
+    else:
+      result = await db.execute(
+        select(User.id, User.role, User.is_active, User.email).where(User.id == user_id))
+      row = result.one_or_none()
+      if not row:
+        return None
+      principal = Principal.model_validate(row)
+
+      try:
+        await redis_connection.eval(
+          SET_IF_VERSION_SCRIPT, 2, _version_key(user_id), _cache_key(user_id),
+          version or "0", principal.model_dump_json(), self.ttl)
+      except Exception:
+        pass
+
+    if len(self._local) >= self.max_local_entries:
+      # 淘汰最早写入的条目
+      self._local.pop(next(iter(self._local)))
+    self._local[user_id] = (time.monotonic() + self.local_ttl, principal)
+    return principal
+
+  async def invalidate(self, user_id: int):
+    """用户信息、角色变化或用户被删除后调用"""
+    self._local.pop(user_id, None)
+    async with redis_connection.pipeline(transaction=True) as pipe:
+      pipe.incr(_version_key(user_id))
+      pipe.delete(_cache_key(user_id))
+      await pipe.execute()
+
+
+principal_cache = PrincipalCache(ttl=settings.PRINCIPAL_CACHE_TTL, local_ttl=settings.PRINCIPAL_LOCAL_TTL)
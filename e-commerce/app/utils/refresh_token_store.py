@@ -0,0 +1,89 @@
+"""
+刷新令牌吊销状态
+刷新令牌本身是无状态JWT（jti 唯一ID、fid 令牌族ID、iat 签发时间），Redis中只保存吊销信息：
+- 已使用/已注销的 jti 按过期日期分桶放在集合中，集合在当天所有令牌过期后自动删除；
+- 被吊销的令牌族（检测到旧令牌被重复使用时，整族作废）；
+- 用户级别的“此时间之前签发的令牌全部失效”（修改密码、禁用用户）。
+刷新时只执行一次Lua脚本，不访问数据库。
+"""
+from datetime import datetime, timezone, timedelta
+
+from app.config.settings import settings
+from app.database.redis_session import redis_connection
+
+
+REFRESH_OK = 1
+REFRESH_REUSED = 0            # 已经轮换过的令牌再次出现，整个令牌族被吊销
+REFRESH_FAMILY_REVOKED = -1
+REFRESH_USER_REVOKED = -2
+
+# KEYS[1]=按过期日期分桶的已吊销jti集合 KEYS[2]=令牌族吊销键 KEYS[3]=用户失效时间键
+# ARGV[1]=jti ARGV[2]=分桶过期时间戳 ARGV[3]=iat ARGV[4]=令牌族吊销保留秒数
+# ARGV[5]=1 表示轮换（检测重复使用），0 表示注销
+CONSUME_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+  return -1
+end
+local not_before = redis.call('GET', KEYS[3])
+if not_before and tonumber(ARGV[3]) < tonumber(not_before) then
+  return -2
+end
+if redis.call('SADD', KEYS[1], ARGV[1]) == 0 and ARGV[5] == '1' then
+  redis.call('SET', KEYS[2], 1, 'EX', ARGV[4])
+  return 0
+end
+redis.call('EXPIREAT', KEYS[1], ARGV[2])
+if ARGV[5] == '0' then
+  redis.call('SET', KEYS[2], 1, 'EX', ARGV[4])
+end
+return 1
+"""
+
+
+def _refresh_lifetime_seconds() -> int:
+  return int(timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS).total_seconds())
+
+
+def _revoked_bucket(exp: int):
+  """返回 (集合键, 集合过期时间戳)，同一天过期的令牌放在同一个集合中"""
+  expires = datetime.fromtimestamp(exp, tz=timezone.utc)
+  bucket_end = datetime(expires.year, expires.month, expires.day, tzinfo=timezone.utc) + timedelta(days=1)
+  return f"auth:refresh:revoked:{expires:%Y%m%d}", int(bucket_end.timestamp())
+
+
+def _family_key(family_id: str) -> str:
+  return f"auth:refresh:family:{family_id}:revoked"
+
+
+def _user_not_before_key(user_id) -> str:
+  return f"auth:refresh:user:{user_id}:not_before"
+
+
+class RefreshTokenStore:
+  @staticmethod
+  async def _consume(payload: dict, rotate: bool) -> int:
+    bucket, bucket_expires_at = _revoked_bucket(int(payload["exp"]))
+    keys = [bucket, _family_key(payload["fid"]), _user_not_before_key(payload["sub"])]
+    args = [payload["jti"], bucket_expires_at, int(payload["iat"]), _refresh_lifetime_seconds(), int(rotate)]
+    return int(await redis_connection.eval(CONSUME_SCRIPT, len(keys), *keys, *args))
+
+  @staticmethod
+  async def rotate(payload: dict) -> int:
+    """
+    标记刷新令牌已使用
+
+    Returns:
+        int: REFRESH_OK 表示可以签发新令牌，其余值表示令牌已失效
+    """
+    return await RefreshTokenStore._consume(payload, rotate=True)
+
+  @staticmethod
+  async def revoke(payload: dict):
+    """注销：吊销该令牌及其整个令牌族"""
+    await RefreshTokenStore._consume(payload, rotate=False)
+
+  @staticmethod
+  async def revoke_user(user_id: int):
+    """使该用户此前签发的所有刷新令牌失效（修改密码、删除或禁用用户后调用）"""
+    await redis_connection.set(
+      _user_not_before_key(user_id), int(datetime.now(timezone.utc).timestamp()), ex=_refresh_lifetime_seconds())
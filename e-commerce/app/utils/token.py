@@ -1,15 +1,15 @@
+import uuid
 from datetime import datetime, timezone, timedelta
 
 from fastapi import Depends, HTTPException, status, Response, Request
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, ExpiredSignatureError
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config.settings import settings
 # from app.database.redis_session import redis_connection
 from app.database.session import get_db
-from app.models import User
+from app.utils.principal_cache import principal_cache
 from app.schemas.user import Role
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
@@ -28,10 +28,21 @@ def create_access_token(token_data: dict, user_id: int):
 
   return auth_token
 
-def create_refresh_token(user: dict, user_id: int):
-  expires = datetime.now() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+def create_refresh_token(user: dict, user_id: int, family_id: str = None):
+  """
+  签发刷新令牌。jti 唯一标识这一枚令牌，fid 标识同一次登录轮换出的令牌族（轮换时沿用）
+  """
+  now = datetime.now(timezone.utc)
+  expires = now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
   data = user.copy()
-  data.update({"exp": expires, "sub": str(user_id)})
+  data.update({
+    "exp": expires,
+    "iat": int(now.timestamp()),
+    "sub": str(user_id),
+    "type": "refresh",
+    "jti": uuid.uuid4().hex,
+    "fid": family_id or uuid.uuid4().hex,
+  })
   refresh_auth_token = jwt.encode(data, SECRET_KEY, algorithm=ALGORITHM)
 
   return refresh_auth_token
@@ -43,6 +54,9 @@ async def verify_access_token(
         db: AsyncSession):
   try:
     payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    # 刷新令牌只能用于 /auth/refresh
+    if payload.get("type") == "refresh":
+      return
     return payload
 
   except ExpiredSignatureError:
@@ -70,8 +84,8 @@ async def get_current_user(
   try:
     payload = await verify_access_token(request, response, token, db)
     user_id = int(payload.get("sub"))
-    user = await db.execute(select(User).where(User.id == user_id))
-    user = user.scalars().first()
+    # 先查进程内缓存和Redis，命中时不访问数据库
+    user = await principal_cache.get(db, user_id)
 
     return user
 
@@ -81,9 +95,14 @@ async def get_current_user(
 async def decode_refresh_token(token):
   try:
     payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    return payload
+  except ExpiredSignatureError:
+    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token has expired")
   except Exception:
-    raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Invalid token")
+    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+
+  if payload.get("type") != "refresh" or not payload.get("jti") or not payload.get("fid"):
+    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+  return payload
 
 async def get_current_admin(
         request: Request,
@@ -111,8 +130,7 @@ async def get_current_vendor(
   """
   payload = await verify_access_token(request, response, token, db)
   user_id = int(payload.get("sub"))
-  user = await db.execute(select(User).where(User.id == user_id))
-  user = user.scalars().first()
+  user = await principal_cache.get(db, user_id)
 
   if not user or user.role != Role.vendor:
     raise HTTPException(
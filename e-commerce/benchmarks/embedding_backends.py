@@ -0,0 +1,100 @@
+"""
+Embedding后端基准测试
+对每个后端（torch / onnx / onnx-int8）在独立的子进程中测量：
+- 导入并加载模型的耗时（冷启动）；
+- 常驻内存（加载后与编码后的峰值RSS）；
+- 编码吞吐量（短查询逐条编码，以及知识库文档按批编码）。
+
+用法（在 e-commerce 目录下，onnx 后端需要先执行 python export_onnx_embedding.py）：
+    python -m benchmarks.embedding_backends
+    python -m benchmarks.embedding_backends --backends torch,onnx-int8 --documents 2000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+
+BACKENDS = {
+    "torch": {"EMBEDDING_BACKEND": "torch"},
+    "onnx": {"EMBEDDING_BACKEND": "onnx", "EMBEDDING_ONNX_QUANTIZED": "false"},
+    "onnx-int8": {"EMBEDDING_BACKEND": "onnx", "EMBEDDING_ONNX_QUANTIZED": "true"},
+}
+
+QUERY = "性价比高的手机"
+DOCUMENT = """商品名称：轻薄笔记本电脑
+商品描述：14英寸高色域屏幕，16GB内存，512GB固态硬盘，续航12小时
+价格：4999元
+分类：电脑办公
+库存：120"""
+
+
+def max_rss_mb() -> float:
+    # Linux 上 ru_maxrss 的单位是KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def worker(queries: int, documents: int, batch_size: int):
+    """在子进程中执行，结果以JSON输出到最后一行"""
+    start = time.perf_counter()
+    from app.services.embedding_service import EmbeddingService
+    service = EmbeddingService()
+    service.encode_single("warm up")
+    load_seconds = time.perf_counter() - start
+    rss_loaded = max_rss_mb()
+
+    start = time.perf_counter()
+    for index in range(queries):
+        service.encode_single(f"{QUERY} {index}")
+    query_seconds = time.perf_counter() - start
+
+    texts = [f"{DOCUMENT}\n编号：{index}" for index in range(documents)]
+    start = time.perf_counter()
+    service.encode(texts, batch_size=batch_size)
+    document_seconds = time.perf_counter() - start
+
+    print(json.dumps({
+        "backend": service.backend.name,
+        "load_seconds": load_seconds,
+        "rss_loaded_mb": rss_loaded,
+        "rss_peak_mb": max_rss_mb(),
+        "queries_per_second": queries / query_seconds,
+        "documents_per_second": documents / document_seconds,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--queries", type=int, default=500, help="逐条编码的查询数")
+    parser.add_argument("--documents", type=int, default=1000, help="按批编码的文档数")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.queries, args.documents, args.batch_size)
+        return
+
+    print(f"{'backend':<12}{'actual':>12}{'load s':>9}{'RSS MB':>9}{'peak MB':>9}{'query/s':>10}{'doc/s':>10}")
+    for name in args.backends.split(","):
+        env = {**os.environ, **BACKENDS[name]}
+        result = subprocess.run(
+            [sys.executable, "-m", "benchmarks.embedding_backends", "--worker",
+             "--queries", str(args.queries), "--documents", str(args.documents),
+             "--batch-size", str(args.batch_size)],
+            env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"{name:<12}  failed: {result.stderr.strip().splitlines()[-1] if result.stderr else result.returncode}")
+            continue
+        stats = json.loads(result.stdout.strip().splitlines()[-1])
+        # 回退到torch时 actual 列会显示 torch
+        print(f"{name:<12}{stats['backend']:>12}{stats['load_seconds']:>9.2f}{stats['rss_loaded_mb']:>9.0f}"
+              f"{stats['rss_peak_mb']:>9.0f}{stats['queries_per_second']:>10.1f}{stats['documents_per_second']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
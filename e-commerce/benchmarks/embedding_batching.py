@@ -0,0 +1,85 @@
+"""
+查询编码微批处理基准测试
+分别用 1/8/32/128 个并发客户端持续编码不同的短查询，对比逐条编码（每条查询单独提交到RAG线程池）
+与微批处理（EmbeddingBatcher 合批编码）的吞吐量和延迟。
+
+用法（在 e-commerce 目录下，需要安装 sentence-transformers）：
+    python -m benchmarks.embedding_batching --duration 10
+    python -m benchmarks.embedding_batching --clients 1,32 --max-batch-size 64 --max-wait-ms 2
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.login_storm import percentile
+
+
+QUERY_TEMPLATES = [
+    "性价比高的{}", "适合学生的{}", "{}推荐", "续航长的{}", "轻薄的{}", "{}哪个牌子好",
+]
+ITEMS = ["手机", "笔记本电脑", "耳机", "运动鞋", "咖啡机", "显示器", "机械键盘", "背包"]
+
+
+def make_query(client: int, index: int) -> str:
+    # 每条查询都不同，避免命中任何缓存
+    template = QUERY_TEMPLATES[index % len(QUERY_TEMPLATES)]
+    return template.format(ITEMS[(client + index) % len(ITEMS)]) + f" {client}-{index}"
+
+
+async def run(encode, clients: int, duration: float):
+    latencies = []
+    stop_at = time.perf_counter() + duration
+
+    async def client(number):
+        index = 0
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            await encode(make_query(number, index))
+            latencies.append((time.perf_counter() - start) * 1000)
+            index += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client(number) for number in range(clients)])
+    return latencies, time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", default="1,8,32,128")
+    parser.add_argument("--duration", type=float, default=10.0, help="每个组合的持续时间（秒）")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--workers", type=int, default=2, help="RAG线程池并发数")
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    args = parser.parse_args()
+
+    from app.services.embedding_service import EmbeddingService
+    from app.services.embedding_batcher import EmbeddingBatcher
+    from app.services.rag_executor import RAGExecutor
+
+    embedding_service = EmbeddingService(args.model)
+    # 排队上限设得足够大，基准测试中不触发503
+    executor = RAGExecutor(workers=args.workers, max_pending=10 ** 6)
+    embedding_service.encode_single("warm up")
+
+    print(f"model={args.model} workers={args.workers} "
+          f"max_batch_size={args.max_batch_size} max_wait_ms={args.max_wait_ms}")
+    print(f"{'mode':<10}{'clients':>8}{'queries/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'avg batch':>11}")
+    for clients in [int(value) for value in args.clients.split(",")]:
+        unbatched, elapsed = await run(
+            lambda text: executor.encode_query(embedding_service, text), clients, args.duration)
+        print(f"{'single':<10}{clients:>8}{len(unbatched) / elapsed:>12.1f}"
+              f"{statistics.median(unbatched):>10.2f}{percentile(unbatched, 99):>10.2f}{1:>11}")
+
+        batcher = EmbeddingBatcher(args.max_batch_size, args.max_wait_ms, max_queue=10 ** 6, executor=executor)
+        batcher.start()
+        batched, elapsed = await run(lambda text: batcher.encode(embedding_service, text), clients, args.duration)
+        await batcher.stop()
+        print(f"{'batched':<10}{clients:>8}{len(batched) / elapsed:>12.1f}"
+              f"{statistics.median(batched):>10.2f}{percentile(batched, 99):>10.2f}"
+              f"{batcher.stats()['average_batch_size']:>11}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+"""
+登录风暴基准测试
+在N个并发登录（bcrypt校验）进行时，测量一个无关接口（/ping）的延迟分布，
+对比在事件循环中同步执行bcrypt（inline）与放入有界线程池（executor）两种方式。
+
+用法（在 e-commerce 目录下）：
+    python -m benchmarks.login_storm --logins 200 --pings 500
+
+默认在进程内通过 ASGI 传输调用一个最小应用，只测量事件循环是否被阻塞；
+指定 --base-url 时改为对运行中的服务发起真实请求（需要提供可登录的账号）。
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+
+
+def percentile(values, p):
+  values = sorted(values)
+  index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+  return values[index]
+
+
+def build_app(mode: str, hashed: str) -> FastAPI:
+  from app.utils.hashing import verify_password, verify_password_async
+
+  app = FastAPI()
+
+  @app.post("/auth/login")
+  async def login():
+    if mode == "inline":
+      ok = verify_password("password123", hashed)
+    else:
+      ok = await verify_password_async("password123", hashed)
+    return {"ok": ok}
+
+  @app.get("/ping")
+  async def ping():
+    return {"pong": True}
+
+  return app
+
+
+async def run(client: httpx.AsyncClient, logins: int, pings: int, login_payload: dict):
+  async def login():
+    response = await client.post("/auth/login", json=login_payload)
+    return response.status_code
+
+  async def ping_loop(interval=0.005):
+    # 每隔 interval 发一次请求，延迟从“本应发出请求”的时刻算起，
+    # 这样事件循环被阻塞造成的调度延迟也会被计入
+    latencies = []
+    for _ in range(pings):
+      due = time.perf_counter() + interval
+      await asyncio.sleep(interval)
+      await client.get("/ping")
+      latencies.append((time.perf_counter() - due) * 1000)
+    return latencies
+
+  # 基线：没有登录请求时的延迟
+  baseline = await ping_loop()
+
+  start = time.perf_counter()
+  login_tasks = [asyncio.create_task(login()) for _ in range(logins)]
+  during = await ping_loop()
+  statuses = await asyncio.gather(*login_tasks)
+  elapsed = time.perf_counter() - start
+
+  return baseline, during, statuses, elapsed
+
+
+def report(label, baseline, during, statuses, elapsed):
+  print(f"\n== {label} ==")
+  for name, values in (("idle", baseline), ("during storm", during)):
+    print(f"  /ping {name:>12}: p50={statistics.median(values):7.2f}ms "
+          f"p99={percentile(values, 99):7.2f}ms max={max(values):7.2f}ms")
+  codes = {code: statuses.count(code) for code in set(statuses)}
+  print(f"  logins: {len(statuses)} in {elapsed:.2f}s, status codes: {codes}")
+
+
+async def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--logins", type=int, default=200)
+  parser.add_argument("--pings", type=int, default=300)
+  parser.add_argument("--base-url", default=None, help="对运行中的服务测试，例如 http://127.0.0.1:8000")
+  parser.add_argument("--email", default="testuser@example.com")
+  parser.add_argument("--password", default="password123")
+  parser.add_argument("--ping-path", default="/products/?page=1&size=1",
+                      help="--base-url 模式下作为无关接口测量的路径")
+  args = parser.parse_args()
+
+  if args.base_url:
+    limits = httpx.Limits(max_connections=args.logins + 10)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+      # 真实服务没有 /ping，用指定路径代替
+      original_get = client.get
+      client.get = lambda url, **kw: original_get(args.ping_path if url == "/ping" else url, **kw)
+      result = await run(client, args.logins, args.pings, {"email": args.email, "password": args.password})
+      report(args.base_url, *result)
+    return
+
+  from app.utils.hashing import hash_password
+  hashed = hash_password("password123")
+  for mode in ("inline", "executor"):
+    transport = httpx.ASGITransport(app=build_app(mode, hashed))
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+      result = await run(client, args.logins, args.pings, {})
+      report(mode, *result)
+
+
+if __name__ == "__main__":
+  asyncio.run(main())
@@ -0,0 +1,147 @@
+"""
+中间件开销基准测试
+对一个最简单的接口，分别在不同的中间件组合下测量吞吐量（req/s）和延迟分布，
+用于发现中间件带来的性能回退。BaseHTTPMiddleware 的空实现作为对照组。
+
+用法（在 e-commerce 目录下）：
+    python -m benchmarks.middleware_overhead --requests 5000 --concurrency 32
+    python -m benchmarks.middleware_overhead --only bare,full
+
+请求通过 ASGI 传输在进程内发出，不经过网络，结果只反映框架和中间件本身的开销。
+rate_limit 和 full 组合需要可用的Redis（settings.REDIS_SESSION_URL），连接不上时跳过。
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from benchmarks.login_storm import percentile
+
+
+class NoopHTTPMiddleware(BaseHTTPMiddleware):
+  async def dispatch(self, request, call_next):
+    return await call_next(request)
+
+
+def add_cors(app):
+  app.add_middleware(CORSMiddleware, allow_origins=["http://localhost:3000"], allow_credentials=True,
+                     allow_methods=["*"], allow_headers=["*"])
+
+
+def add_rate_limit(app):
+  from app.middleware.rate_limitter import RateLimitMiddleware, RateLimitPolicy
+  # 限额足够大，测量的是每个请求执行一次脚本的开销而不是429
+  app.add_middleware(RateLimitMiddleware, default_policy=RateLimitPolicy("bench", 10 ** 9, 60), route_limits=())
+
+
+def add_timing(app):
+  from app.middleware.request_context import TimingMiddleware
+  app.add_middleware(TimingMiddleware)
+
+
+def add_request_id(app):
+  from app.middleware.request_context import RequestIDMiddleware
+  app.add_middleware(RequestIDMiddleware)
+
+
+def add_base_http(app):
+  app.add_middleware(NoopHTTPMiddleware)
+
+
+def add_full(app):
+  # 与 app/main.py 中的顺序一致
+  add_rate_limit(app)
+  add_cors(app)
+  add_timing(app)
+  add_request_id(app)
+
+
+CONFIGURATIONS = {
+  "bare": [],
+  "cors": [add_cors],
+  "request_id": [add_request_id],
+  "timing": [add_timing],
+  "rate_limit": [add_rate_limit],
+  "base_http_noop": [add_base_http],
+  "full": [add_full],
+}
+NEEDS_REDIS = {"rate_limit", "full"}
+
+
+def build_app(setup) -> FastAPI:
+  app = FastAPI()
+
+  @app.get("/ping")
+  async def ping():
+    return {"pong": True}
+
+  for add in setup:
+    add(app)
+  return app
+
+
+async def run(app, requests: int, concurrency: int):
+  transport = httpx.ASGITransport(app=app, client=("127.0.0.1", 12345))
+  async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+    # 预热
+    for _ in range(50):
+      await client.get("/ping")
+
+    latencies = []
+    remaining = requests
+
+    async def worker():
+      nonlocal remaining
+      while remaining > 0:
+        remaining -= 1
+        start = time.perf_counter()
+        response = await client.get("/ping", headers={"Origin": "http://localhost:3000"})
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+  return latencies, elapsed
+
+
+async def redis_available() -> bool:
+  from app.database.redis_session import redis_connection
+  try:
+    await asyncio.wait_for(redis_connection.ping(), timeout=1)
+    return True
+  except Exception:
+    return False
+
+
+async def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--requests", type=int, default=5000)
+  parser.add_argument("--concurrency", type=int, default=32)
+  parser.add_argument("--only", default=None, help="逗号分隔的组合名，默认全部：" + ",".join(CONFIGURATIONS))
+  args = parser.parse_args()
+
+  names = args.only.split(",") if args.only else list(CONFIGURATIONS)
+  has_redis = await redis_available() if NEEDS_REDIS & set(names) else False
+
+  print(f"{args.requests} requests, concurrency {args.concurrency}")
+  print(f"{'configuration':<16}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+  baseline = None
+  for name in names:
+    if name in NEEDS_REDIS and not has_redis:
+      print(f"{name:<16}  skipped (Redis unavailable)")
+      continue
+    latencies, elapsed = await run(build_app(CONFIGURATIONS[name]), args.requests, args.concurrency)
+    rps = len(latencies) / elapsed
+    baseline = baseline or rps
+    print(f"{name:<16}{rps:>10.0f}{statistics.median(latencies):>10.2f}"
+          f"{percentile(latencies, 99):>10.2f}{max(latencies):>10.2f}  ({rps / baseline:.0%} of first)")
+
+
+if __name__ == "__main__":
+  asyncio.run(main())
@@ -0,0 +1,109 @@
+"""
+检索召回率基准测试（离线）
+在已构建的知识库上，用带标注的查询集（benchmarks/data/retrieval_queries.json）比较
+向量检索、BM25检索和混合检索（RRF融合）的 recall@k 和 MRR。
+
+标注按商品名称给出相关商品（与 add_sample_products.py 的示例数据对应），运行时解析为文档ID；
+"filters" 是查询中应识别出的价格/分类条件，会下推到检索中（--no-filters 时不使用）。
+
+用法（在 e-commerce 目录下，需要先执行 python init_knowledge_base.py）：
+    python -m benchmarks.retrieval_recall
+    python -m benchmarks.retrieval_recall --k 1,3,5,10 --rrf-k 60 --candidates 20 --verbose
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+
+DEFAULT_QUERIES = os.path.join(os.path.dirname(__file__), "data", "retrieval_queries.json")
+MODES = ("vector", "lexical", "hybrid")
+
+
+def resolve_relevant(vector_store, names):
+    """商品名称 -> 商品文档ID"""
+    by_name = {}
+    for doc_id, metadata in vector_store.lexical_index.metadatas():
+        if metadata.get("type") == "product":
+            by_name.setdefault(metadata.get("product_name"), set()).add(doc_id)
+    ids, missing = set(), []
+    for name in names:
+        if name in by_name:
+            ids |= by_name[name]
+        else:
+            missing.append(name)
+    return ids, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default=DEFAULT_QUERIES)
+    parser.add_argument("--k", default="1,3,5,10", help="逗号分隔的k值")
+    parser.add_argument("--rrf-k", type=int, default=60)
+    parser.add_argument("--candidates", type=int, default=20, help="混合检索每路召回的候选数")
+    parser.add_argument("--no-filters", action="store_true", help="不使用标注中的过滤条件")
+    parser.add_argument("--verbose", action="store_true", help="输出每个查询的命中情况")
+    args = parser.parse_args()
+
+    from app.services.hybrid_retriever import HybridRetriever, build_where
+    from app.services.vector_store_service import VectorStoreService
+
+    ks = sorted(int(k) for k in args.k.split(","))
+    with open(args.queries, encoding="utf-8") as f:
+        labelled = json.load(f)
+
+    vector_store = VectorStoreService()
+    vector_store.refresh_lexical_index()
+    retriever = HybridRetriever(vector_store, rrf_k=args.rrf_k, candidates=args.candidates)
+    print(f"知识库文档数: {len(vector_store.lexical_index)}，查询数: {len(labelled)}")
+
+    recalls = {mode: {k: [] for k in ks} for mode in MODES}
+    reciprocal_ranks = {mode: [] for mode in MODES}
+    latencies = {mode: [] for mode in MODES}
+    skipped = 0
+
+    for item in labelled:
+        relevant, missing = resolve_relevant(vector_store, item["relevant"])
+        if missing:
+            print(f"  [跳过] {item['query']}: 知识库中没有 {missing}")
+            skipped += 1
+            continue
+
+        filters = {} if args.no_filters else item.get("filters", {})
+        where = build_where(doc_type="product", **filters)
+        # 查询向量只计算一次，各模式比较的是检索本身
+        query_embedding = vector_store.embedding_service.encode_single(item["query"])
+
+        for mode in MODES:
+            start = time.perf_counter()
+            results = retriever.search(item["query"], n_results=max(ks), where=where,
+                                       query_embedding=query_embedding, mode=mode)
+            latencies[mode].append((time.perf_counter() - start) * 1000)
+
+            ranked = [result["id"] for result in results]
+            for k in ks:
+                recalls[mode][k].append(len(relevant & set(ranked[:k])) / len(relevant))
+            first_hit = next((rank for rank, doc_id in enumerate(ranked, start=1) if doc_id in relevant), None)
+            reciprocal_ranks[mode].append(1 / first_hit if first_hit else 0.0)
+
+            if args.verbose:
+                names = [result["metadata"].get("product_name") for result in results[:3]]
+                print(f"  {mode:>7} | {item['query']} -> 首个命中: {first_hit} | top3: {names}")
+
+    evaluated = len(labelled) - skipped
+    if not evaluated:
+        print("没有可评估的查询，请先用 add_sample_products.py 的示例数据构建知识库")
+        return
+
+    print(f"\n评估查询数: {evaluated}（跳过 {skipped}），过滤条件: {'关闭' if args.no_filters else '开启'}")
+    header = "  ".join(f"recall@{k:<3}" for k in ks)
+    print(f"{'mode':>8}  {header}  MRR     p50延迟")
+    for mode in MODES:
+        row = "  ".join(f"{statistics.mean(recalls[mode][k]):<10.3f}" for k in ks)
+        print(f"{mode:>8}  {row}  {statistics.mean(reciprocal_ranks[mode]):.3f}   "
+              f"{statistics.median(latencies[mode]):.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
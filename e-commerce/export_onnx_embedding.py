@@ -0,0 +1,62 @@
+"""
+导出ONNX Embedding模型
+把 sentence-transformers/all-MiniLM-L6-v2 的Transformer部分导出为ONNX，并生成int8动态量化版本，
+供 EMBEDDING_BACKEND=onnx/auto 使用。只需在构建镜像或部署前执行一次（需要PyTorch和transformers）。
+导出后需要设置 EMBEDDING_BACKEND=onnx 并重建知识库（python init_knowledge_base.py --rebuild）才会生效。
+
+用法：
+    python export_onnx_embedding.py
+    python export_onnx_embedding.py --model sentence-transformers/all-MiniLM-L6-v2 --output models/all-MiniLM-L6-v2-onnx
+"""
+import argparse
+import os
+
+from app.config.settings import settings
+
+
+def export(model_name: str, output_dir: str):
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+
+    # 保存 tokenizer.json，推理时用 tokenizers 加载，不依赖transformers
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["导出示例", "export sample"], padding=True, return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    model_path = os.path.join(output_dir, "model.onnx")
+    print(f"正在导出 {model_name} -> {model_path}")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+
+    quantized_path = os.path.join(output_dir, "model_int8.onnx")
+    print(f"正在生成int8量化模型 -> {quantized_path}")
+    quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+
+    for path in (model_path, quantized_path):
+        print(f"   {path}: {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+    print("导出完成")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--output", default=settings.EMBEDDING_ONNX_DIR)
+    args = parser.parse_args()
+    export(args.model, args.output)
@@ -1,67 +1,65 @@
 """
 初始化知识库脚本
-从数据库提取商品和评论，生成向量并存储到向量数据库
+从数据库提取商品和评论，生成向量并存储到向量数据库。
+默认做增量校对（只处理有变化的文档），--rebuild 时先清空集合。
+数据通过数据库游标分批读取、编码和写入，大商品库也不会一次性加载到内存；
+中断后使用 --resume 从上次写入的检查点继续。
+日常的商品/评价变化由 KnowledgeBaseIndexer 增量索引，一般不需要再执行本脚本。
 """
 import asyncio
-from app.database.session import get_db
-from app.services.knowledge_base_service import KnowledgeBaseService
+from app.services.knowledge_base_builder import KnowledgeBaseBuilder
+from app.services.knowledge_base_indexer import sync_all
 from app.services.vector_store_service import VectorStoreService
 
 
-async def init_knowledge_base(rebuild: bool = True):
+async def init_knowledge_base(rebuild: bool = True, vector_store: VectorStoreService = None, resume: bool = False):
     """
     初始化知识库
     
     Args:
-        rebuild: 是否重建（删除旧数据）
+        rebuild: 是否先清空集合（更换Embedding模型/后端时需要）
+        vector_store: 复用已有的向量数据库服务（例如服务进程中共享的实例），默认新建
+        resume: 从上次中断的检查点继续（rebuild 时忽略）
     """
     print("=" * 50)
     print("开始构建知识库...")
     print("=" * 50)
     
     # 初始化向量数据库
-    vector_store = VectorStoreService()
+    if vector_store is None:
+        vector_store = VectorStoreService()
     
     if rebuild:
         print("正在删除旧的知识库...")
-        vector_store.delete_collection()
-        # 重新初始化
-        vector_store = VectorStoreService()
+        vector_store.reset_collection()
+        await KnowledgeBaseBuilder.clear_checkpoint()
+        resume = False
+    else:
+        # 集合是用另一个Embedding模型/后端构建的，增量写入会混用两种向量，需要 --rebuild
+        vector_store.check_embedding_model()
     
-    # 获取数据库连接
-    async for db in get_db():
-        try:
-            # 提取所有数据
-            print("\n1. 正在提取商品数据...")
-            products = await KnowledgeBaseService.extract_all_products(db)
-            print(f"   提取到 {len(products)} 个商品")
-            
-            print("\n2. 正在提取评论数据...")
-            reviews = await KnowledgeBaseService.extract_all_reviews(db)
-            print(f"   提取到 {len(reviews)} 条评论")
-            
-            # 构建知识文档
-            print("\n3. 正在构建知识文档...")
-            documents = await KnowledgeBaseService.build_knowledge_documents(db)
-            print(f"   共 {len(documents)} 个知识文档")
-            
-            # 添加到向量数据库
-            print("\n4. 正在生成向量并存储到向量数据库...")
-            vector_store.add_documents(documents, batch_size=50)
-            
-            # 显示统计信息
-            print("\n5. 知识库构建完成！")
-            info = vector_store.get_collection_info()
-            print(f"   集合名称: {info['name']}")
-            print(f"   文档数量: {info['count']}")
-            print(f"   状态: {info['status']}")
-            
-        except Exception as e:
-            print(f"\n错误: {e}")
-            import traceback
-            traceback.print_exc()
-        finally:
-            break
+    try:
+        # 增量校对：只为新增或文本变化的文档生成向量，删除已下架/已删除的文档
+        print("\n1. 正在提取商品和评论数据并与向量数据库校对...")
+        stats = await sync_all(vector_store, resume=resume)
+        if stats["resumed_from"]:
+            print(f"   从检查点继续: {stats['resumed_from']}")
+        print(f"   重新生成向量: {stats['embedded']} 个文档")
+        print(f"   只更新元数据: {stats['metadata_only']} 个文档")
+        print(f"   未变化: {stats['unchanged']} 个文档")
+        print(f"   已删除: {stats['deleted']} 个文档")
+        
+        # 显示统计信息
+        print("\n2. 知识库构建完成！")
+        info = vector_store.get_collection_info()
+        print(f"   集合名称: {info['name']}")
+        print(f"   文档数量: {info['count']}")
+        print(f"   状态: {info['status']}")
+        
+    except Exception as e:
+        print(f"\n错误: {e}")
+        import traceback
+        traceback.print_exc()
     
     print("\n" + "=" * 50)
     print("知识库构建完成！")
@@ -71,5 +69,6 @@ async def init_knowledge_base(rebuild: bool = True):
 if __name__ == "__main__":
     import sys
     rebuild = "--rebuild" in sys.argv
-    asyncio.run(init_knowledge_base(rebuild=rebuild))
+    resume = "--resume" in sys.argv
+    asyncio.run(init_knowledge_base(rebuild=rebuild, resume=resume))
 
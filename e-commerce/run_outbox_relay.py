@@ -0,0 +1,20 @@
+"""
+独立运行发件箱中继
+适用于将中继从API进程中拆分出来部署的场景（此时API进程设置 OUTBOX_RELAY_ENABLED=false）
+"""
+import asyncio
+from app.services.outbox_service import outbox_relay
+# 注册知识库索引的事件处理函数
+import app.services.knowledge_base_indexer  # noqa: F401
+
+
+async def main():
+    print("发件箱中继已启动，按 Ctrl+C 退出")
+    try:
+        await outbox_relay.run_forever()
+    finally:
+        await outbox_relay.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())